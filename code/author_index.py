@@ -0,0 +1,276 @@
+"""
+Persistent inverted index from authors to documents of the merged corpus, for the monograph and multi-author
+statistics of corpus_description.ipynb.
+
+Authors are interned to integers in the order they first appear (keyed by their MAG id, or their name if they have
+none), documents are numbered in corpus order. The author lists of the documents are stored in CSR layout (offsets
+into one int32 array of author numbers, in author list order), and the inverse as CSR arrays from each author to the
+documents listing them with their 1-based position (of the first occurrence) in the author list. Ids and names are
+stored as byte blobs with offsets, ids also as sorted 64 bit hashes for lookups. All files are numpy arrays opened
+with mmap. Counts, the positions histogram and the category breakdown are computed with vectorised numpy operations.
+"""
+
+from glob import glob
+from os.path import basename, exists, isfile, getsize, sep
+from os import makedirs
+from multiprocessing import Pool
+from array import array
+from argparse import ArgumentParser
+from datetime import datetime
+import numpy as np
+from core_index import key_hash
+from json_codec import loads
+import scheduler
+
+STRING_COLUMNS = ['doc_ids', 'author_ids', 'author_names']
+CATEGORIES = ['Mono_only', 'Mono_plus', 'Multi_plus', 'Multi_only', 'No_info']
+
+def author_key(author):
+    """The id and name of an author of the merged corpus ({'id', 'name'}) or of CORE (a name)."""
+    if isinstance(author, dict):
+        name = author.get('name') or ''
+        return (str(author['id']) if author.get('id') is not None else name), name
+    return str(author), str(author)
+
+def document_id(entry):
+    """The id of an entry of the merged corpus (core_id) or of CORE (coreId)."""
+    core_id = entry.get('core_id', entry.get('coreId'))
+    if core_id is None:
+        raise ValueError("Entry without core_id or coreId: " + str(entry)[:200])
+    return str(core_id)
+
+def authors_in_chunk(chunk):
+    """Helper function for parallel processing. Returns the id and list of (author id, name) of each entry."""
+    print(basename(chunk[0]))
+    entries = []
+    for line in scheduler.read_chunk(chunk, "rb"):
+        entry = loads(line)
+        entries.append((document_id(entry), [author_key(author) for author in entry.get('authors') or []]))
+    return entries
+
+def write_strings(directory, column, values):
+    offsets = np.zeros(len(values) + 1, dtype = np.uint64)
+    with open(directory + sep + column + ".bin", "wb") as blob:
+        for i, value in enumerate(values):
+            data = value.encode('utf-8', 'surrogatepass')
+            blob.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(directory + sep + column + ".offsets.npy", offsets)
+
+def write_keys(directory, column, values):
+    hashes = np.array([key_hash(value) for value in values], dtype = np.uint64)
+    order = np.argsort(hashes, kind = 'stable')
+    np.save(directory + sep + column + ".keys.npy", hashes[order])
+    np.save(directory + sep + column + ".rows.npy", order.astype(np.int64))
+
+def build_author_index(filepaths, directory, pool_size = 10, chunk_size = scheduler.CHUNK_SIZE):
+    """
+    Build the author index of the merged corpus files in directory. The files are read in parallel, the authors are
+    interned in corpus order.
+    """
+    if not exists(directory): makedirs(directory)
+    doc_ids = []
+    lengths = array('q')
+    author_numbers = {}
+    author_names = []
+    doc_authors = array('i')
+    chunks = scheduler.split(filepaths, chunk_size)
+    with Pool(pool_size) as pool:
+        for entries in scheduler.imap_in_order(pool, authors_in_chunk, chunks):
+            for core_id, authors in entries:
+                doc_ids.append(core_id)
+                lengths.append(len(authors))
+                for author_id, name in authors:
+                    if author_id not in author_numbers:
+                        author_numbers[author_id] = len(author_numbers)
+                        author_names.append(name)
+                    doc_authors.append(author_numbers[author_id])
+    doc_offsets = np.zeros(len(lengths) + 1, dtype = np.int64)
+    np.cumsum(lengths, out = doc_offsets[1:])
+    doc_authors = np.frombuffer(doc_authors, dtype = np.int32) if len(doc_authors) else np.zeros(0, dtype = np.int32)
+    lengths = np.frombuffer(lengths, dtype = np.int64) if len(lengths) else np.zeros(0, dtype = np.int64)
+    np.save(directory + sep + "doc_offsets.npy", doc_offsets)
+    np.save(directory + sep + "doc_authors.npy", doc_authors)
+    # each author is kept once per document, at its first position
+    docs = np.repeat(np.arange(len(lengths), dtype = np.int64), lengths)
+    positions = np.arange(len(doc_authors), dtype = np.int64) - doc_offsets[docs] + 1
+    _, first = np.unique(docs * max(len(author_numbers), 1) + doc_authors, return_index = True)
+    order = first[np.argsort(doc_authors[first], kind = 'stable')]
+    author_offsets = np.zeros(len(author_numbers) + 1, dtype = np.int64)
+    np.cumsum(np.bincount(doc_authors[order], minlength = len(author_numbers)), out = author_offsets[1:])
+    np.save(directory + sep + "author_offsets.npy", author_offsets)
+    np.save(directory + sep + "author_docs.npy", docs[order].astype(np.int32))
+    np.save(directory + sep + "author_positions.npy", positions[order].astype(np.int32))
+    author_ids = list(author_numbers)
+    for column, values in [('doc_ids', doc_ids), ('author_ids', author_ids), ('author_names', author_names)]:
+        write_strings(directory, column, values)
+    write_keys(directory, 'doc_ids', doc_ids)
+    write_keys(directory, 'author_ids', author_ids)
+    print(f"Indexed {len(doc_ids)} documents and {len(author_ids)} authors.")
+
+class AuthorIndex:
+    """
+    Read-only access to an index built by build_author_index.
+
+    Attributes:
+        directory: The directory of the index files.
+        documents: Number of indexed documents.
+        authors: Number of indexed authors.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.blobs = {}
+        self.offsets = {}
+        for column in STRING_COLUMNS:
+            path = directory + sep + column + ".bin"
+            self.blobs[column] = np.memmap(path, dtype = np.uint8, mode = 'r') if getsize(path) else np.zeros(0, dtype = np.uint8)
+            self.offsets[column] = np.load(directory + sep + column + ".offsets.npy", mmap_mode = 'r')
+        self.keys = {column: np.load(directory + sep + column + ".keys.npy", mmap_mode = 'r') for column in ['doc_ids', 'author_ids']}
+        self.key_rows = {column: np.load(directory + sep + column + ".rows.npy", mmap_mode = 'r') for column in ['doc_ids', 'author_ids']}
+        self.doc_offsets = np.load(directory + sep + "doc_offsets.npy", mmap_mode = 'r')
+        self.doc_authors = np.load(directory + sep + "doc_authors.npy", mmap_mode = 'r')
+        self.author_offsets = np.load(directory + sep + "author_offsets.npy", mmap_mode = 'r')
+        self.author_docs = np.load(directory + sep + "author_docs.npy", mmap_mode = 'r')
+        self.author_positions = np.load(directory + sep + "author_positions.npy", mmap_mode = 'r')
+        self.documents = len(self.doc_offsets) - 1
+        self.authors = len(self.author_offsets) - 1
+        self._counts = None
+
+    def _string(self, column, row):
+        offsets = self.offsets[column]
+        return bytes(self.blobs[column][offsets[row]:offsets[row+1]]).decode('utf-8', 'surrogatepass')
+
+    def _row(self, column, value):
+        hashed = np.uint64(key_hash(str(value)))
+        keys = self.keys[column]
+        start = int(np.searchsorted(keys, hashed, side = 'left'))
+        end = int(np.searchsorted(keys, hashed, side = 'right'))
+        for row in self.key_rows[column][start:end]:
+            if self._string(column, int(row)) == str(value):
+                return int(row)
+        return None
+
+    def doc_id(self, doc):
+        return self._string('doc_ids', doc)
+
+    def author_id(self, author):
+        return self._string('author_ids', author)
+
+    def author_name(self, author):
+        return self._string('author_names', author)
+
+    def author_number(self, author_id):
+        """The number of an author id, None if unknown."""
+        return self._row('author_ids', author_id)
+
+    def doc_number(self, core_id):
+        """The number of a document by its coreId, None if unknown."""
+        return self._row('doc_ids', core_id)
+
+    def authors_of(self, core_id):
+        """The author ids of a document in author list order, [] if unknown."""
+        doc = self.doc_number(core_id)
+        if doc is None:
+            return []
+        return [self.author_id(int(author)) for author in self.doc_authors[self.doc_offsets[doc]:self.doc_offsets[doc+1]]]
+
+    def documents_of(self, author_id):
+        """The (coreId, position in the author list) of all documents of an author, in corpus order."""
+        author = self.author_number(author_id)
+        if author is None:
+            return []
+        start, end = self.author_offsets[author], self.author_offsets[author+1]
+        return [(self.doc_id(int(doc)), int(position)) for doc, position in zip(self.author_docs[start:end], self.author_positions[start:end])]
+
+    def doc_lengths(self):
+        """Number of authors of each document, as listed."""
+        return np.diff(self.doc_offsets)
+
+    def counts(self):
+        """
+        Number of monographs and multi-author documents of each author.
+
+        Returns:
+            Two int64 arrays indexed by author number.
+        """
+        if self._counts is None:
+            pair_authors = np.repeat(np.arange(self.authors, dtype = np.int32), np.diff(self.author_offsets))
+            mono = self.doc_lengths()[self.author_docs] == 1
+            self._counts = (np.bincount(pair_authors[mono], minlength = self.authors), np.bincount(pair_authors[~mono], minlength = self.authors))
+        return self._counts
+
+    def positions_histogram(self, mono_authors_only = True):
+        """
+        Number of times each position occurs in the author lists of multi-author documents, of authors with
+        monographs only if mono_authors_only. Index 0 is always 0.
+        """
+        mono_counts, _ = self.counts()
+        pair_authors = np.repeat(np.arange(self.authors, dtype = np.int32), np.diff(self.author_offsets))
+        selected = self.doc_lengths()[self.author_docs] > 1
+        if mono_authors_only:
+            selected &= mono_counts[pair_authors] > 0
+        return np.bincount(self.author_positions[selected])
+
+    def categories(self):
+        """
+        Number of documents in each category of CATEGORIES: monographs whose author has no multi-author documents
+        (Mono_only) or has some (Mono_plus), multi-author documents with at least one author with monographs
+        (Multi_plus) or without (Multi_only), and documents without authors (No_info).
+        """
+        mono_counts, multi_counts = self.counts()
+        lengths = self.doc_lengths()
+        starts = np.asarray(self.doc_offsets[:-1])
+        monographs = np.flatnonzero(lengths == 1)
+        multis = np.flatnonzero(lengths > 1)
+        with_multi = multi_counts[self.doc_authors[starts[monographs]]] > 0
+        docs = np.repeat(np.arange(self.documents, dtype = np.int64), lengths)
+        with_mono = np.bincount(docs, weights = mono_counts[self.doc_authors] > 0, minlength = self.documents)[multis] > 0
+        return {
+            'Mono_only': int(np.sum(~with_multi)),
+            'Mono_plus': int(np.sum(with_multi)),
+            'Multi_plus': int(np.sum(with_mono)),
+            'Multi_only': int(np.sum(~with_mono)),
+            'No_info': int(np.sum(lengths == 0))}
+
+    def author_table(self, positions = False):
+        """
+        Table of all authors with monographs: name, number of monographs and of multi-author documents, average
+        position in the author lists of the latter (0 if none), and with positions the list of these positions.
+
+        Returns:
+            A pandas DataFrame indexed by author id (int if all ids are numeric).
+        """
+        import pandas as pd
+        mono_counts, multi_counts = self.counts()
+        authors = np.flatnonzero(mono_counts > 0)
+        pair_authors = np.repeat(np.arange(self.authors, dtype = np.int32), np.diff(self.author_offsets))
+        multi = self.doc_lengths()[self.author_docs] > 1
+        position_sums = np.bincount(pair_authors[multi], weights = self.author_positions[multi], minlength = self.authors)
+        ids = [self.author_id(int(author)) for author in authors]
+        table = pd.DataFrame({
+            'name': [self.author_name(int(author)) for author in authors],
+            'mono_docs': mono_counts[authors],
+            'multi_docs': multi_counts[authors]},
+            index = [int(i) for i in ids] if all(i.isdigit() for i in ids) else ids)
+        if positions:
+            multi_positions = np.split(np.asarray(self.author_positions[multi]), np.cumsum(multi_counts)[:-1])
+            table['positions'] = [multi_positions[author].tolist() for author in authors]
+        averages = np.divide(position_sums[authors], multi_counts[authors], out = np.zeros(len(authors)), where = multi_counts[authors] > 0)
+        table['avg_position'] = [round(average, 1) for average in averages.tolist()]
+        return table
+
+if __name__ == "__main__":
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument("-i", "--input")
+    argument_parser.add_argument("-o", "--output")
+    argument_parser.add_argument("--size", default=10, type=int)
+    argument_parser.add_argument("--chunk_size", default=scheduler.CHUNK_SIZE, type=int)
+
+    args = vars(argument_parser.parse_args())
+
+    print(datetime.now())
+    filepaths = [args["input"]] if isfile(args["input"]) else [filepath for filepath in sorted(glob(args["input"] + sep + "*")) if isfile(filepath)]
+    build_author_index(filepaths, args["output"], args["size"], args["chunk_size"])
+    print(datetime.now())
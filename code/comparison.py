@@ -0,0 +1,96 @@
+"""
+Bounded Levenshtein comparison of titles and author names, as used to check matches between MAG and CORE entries.
+
+Two strings are similar if the edit distance of their lowercased versions is below the difference of their lengths
+plus 10% of the shorter length, unless one of them is shorter than 'short_length' characters and their lengths differ
+by more than 'max_gap'. The distance is only computed up to the largest accepted value, and pairs the length check
+already decides are never compared. utils uses 6 and 6, the matching notebooks 20 and 30.
+"""
+
+from math import ceil
+
+SHORT_LENGTH = 6
+MAX_GAP = 6
+
+def max_distance(length1, length2):
+    """Largest edit distance accepted for strings of the given lengths, -1 if none is."""
+    return ceil(abs(length1-length2) + 0.1*min(length1,length2)) - 1
+
+def compare(t1, t2, short_length=SHORT_LENGTH, max_gap=MAX_GAP):
+    """
+    Return True if both strings are similar (see module description).
+    """
+    if not isinstance(t1, str) or not isinstance(t2, str) or not t1 or not t2:
+        return False
+    if (len(t1) < short_length or len(t2) < short_length) and abs(len(t1)-len(t2)) > max_gap:
+        return False
+    cutoff = max_distance(len(t1), len(t2))
+    return _bounded(t1.lower(), t2.lower(), cutoff)
+
+def _bounded(lower1, lower2, cutoff):
+    if cutoff < 0 or abs(len(lower1)-len(lower2)) > cutoff:
+        return False
+    from Levenshtein import distance
+    return distance(lower1, lower2, score_cutoff=cutoff) <= cutoff
+
+def compare_pairs(strings1, strings2, short_length=SHORT_LENGTH, max_gap=MAX_GAP):
+    """
+    Compare two lists of strings element by element.
+
+    Returns:
+        A boolean numpy array with one value per pair.
+    """
+    import numpy as np
+    lowered = {}
+    result = np.zeros(len(strings1), dtype=bool)
+    for i, (t1, t2) in enumerate(zip(strings1, strings2)):
+        if not isinstance(t1, str) or not isinstance(t2, str) or not t1 or not t2:
+            continue
+        if (len(t1) < short_length or len(t2) < short_length) and abs(len(t1)-len(t2)) > max_gap:
+            continue
+        if t1 not in lowered:
+            lowered[t1] = t1.lower()
+        if t2 not in lowered:
+            lowered[t2] = t2.lower()
+        result[i] = _bounded(lowered[t1], lowered[t2], max_distance(len(t1), len(t2)))
+    return result
+
+def compare_many_to_many(strings1, strings2, short_length=SHORT_LENGTH, max_gap=MAX_GAP, workers=1):
+    """
+    Compare every string of the first list with every string of the second list.
+    Distances are computed by rapidfuzz in one call, bounded by the largest distance accepted for any pair.
+
+    Args:
+        workers: Number of threads used by rapidfuzz, -1 for all cores.
+    Returns:
+        A boolean numpy array of shape (len(strings1), len(strings2)).
+    """
+    import numpy as np
+    from rapidfuzz.process import cdist
+    from rapidfuzz.distance import Levenshtein
+    valid1 = np.array([isinstance(t, str) and len(t) > 0 for t in strings1], dtype=bool)
+    valid2 = np.array([isinstance(t, str) and len(t) > 0 for t in strings2], dtype=bool)
+    result = np.zeros((len(strings1), len(strings2)), dtype=bool)
+    if not valid1.any() or not valid2.any():
+        return result
+    index1 = np.flatnonzero(valid1)
+    index2 = np.flatnonzero(valid2)
+    lengths1 = np.array([len(strings1[i]) for i in index1])[:, None]
+    lengths2 = np.array([len(strings2[i]) for i in index2])[None, :]
+    difference = np.abs(lengths1 - lengths2)
+    cutoffs = np.ceil(difference + 0.1*np.minimum(lengths1, lengths2)).astype(np.int64) - 1
+    allowed = ~(((lengths1 < short_length) | (lengths2 < short_length)) & (difference > max_gap)) & (cutoffs >= 0)
+    if allowed.any():
+        distances = cdist([strings1[i].lower() for i in index1], [strings2[i].lower() for i in index2],
+                          scorer=Levenshtein.distance, score_cutoff=int(cutoffs[allowed].max()), workers=workers)
+        result[np.ix_(index1, index2)] = allowed & (distances <= cutoffs)
+    return result
+
+def compare_one_to_many(string, strings, short_length=SHORT_LENGTH, max_gap=MAX_GAP, workers=1):
+    """
+    Compare one string with every string of a list.
+
+    Returns:
+        A boolean numpy array with one value per string of the list.
+    """
+    return compare_many_to_many([string], strings, short_length, max_gap, workers)[0]
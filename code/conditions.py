@@ -0,0 +1,249 @@
+import ast
+from time import perf_counter
+
+# functions in utils with a batch version taking a list of texts in place of the first argument
+BATCH_FUNCTIONS = {'text_readable': 'text_readable_batch', 'ft_lang_detect': 'ft_lang_detect_batch'}
+# position of the print_command argument of the functions in utils that have one, the batch versions ignore it
+PRINT_COMMAND_POSITIONS = {'text_readable': 6, 'text_readable_batch': 6}
+
+class ConditionSet:
+    """
+    Compiled version of the conditions passed via --cond.
+
+    Every condition string is parsed and compiled once. Top-level 'and' terms of all conditions are treated as
+    independent conjuncts, so that cheap and selective conjuncts can be evaluated first. Calls that appear more
+    than once across the conditions (e.g. utils.preprocessor(entry['full_text'])) are evaluated at most once per entry.
+    The result for an entry is the same as evaluating the condition strings one after another with eval().
+    Conjuncts that print (a call with a print_command that may be true) keep their place: no conjunct is moved from
+    before them to after them or the other way round, so they print for the same entries as in the given order.
+    Conjuncts that are plain calls of utils.text_readable or utils.ft_lang_detect are evaluated for many entries
+    at once by check_many.
+
+    Attributes:
+        conditions: The condition strings as passed.
+        namespace: Names available to the conditions ('utils', 'fmodel', ...). 'entry' is set for each call.
+        sample_size: Number of entries evaluated in the given order to measure cost and selectivity before reordering.
+        fields: Top-level keys of the entry the conditions read, None if they use the entry in any other way.
+    """
+    def __init__(self, conditions, namespace = None, sample_size = 1000):
+        self.conditions = list(conditions) if conditions else []
+        self.namespace = dict(namespace) if namespace else {}
+        self.namespace['_shared'] = self._shared
+        self.sample_size = sample_size
+        self.shared = []
+        self.cache = {}
+        terms = []
+        for condition in self.conditions:
+            tree = ast.parse(condition.strip(), mode = 'eval').body
+            if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And):
+                terms.extend(tree.values)
+            else:
+                terms.append(tree)
+        counts = {}
+        for term in terms:
+            for node in ast.walk(term):
+                if isinstance(node, ast.Call):
+                    key = ast.dump(node)
+                    counts[key] = counts.get(key, 0) + 1
+        self._shared_keys = {key: None for key in counts if counts[key] > 1}
+        self.fields = _entry_fields(terms)
+        self.conjuncts = [self._compile(term) for term in terms]
+        self.fixed = [i for i, term in enumerate(terms) if _prints(term)]
+        self.batched = {}
+        for i, term in enumerate(terms):
+            if _batchable(term):
+                self.batched[i] = (compile(term.func.value.id + '.' + BATCH_FUNCTIONS[term.func.attr], '<cond>', 'eval'),
+                    self._compile(term.args[0]),
+                    compile('(' + ''.join(ast.unparse(arg) + ',' for arg in term.args[1:]) + ')', '<cond>', 'eval'),
+                    compile('dict(' + ','.join(kw.arg + '=' + ast.unparse(kw.value) for kw in term.keywords) + ')', '<cond>', 'eval'))
+        # check_many evaluates the batched conjuncts last, which would move them after a printing conjunct
+        self.batch_many = not any(b < f for b in self.batched for f in self.fixed)
+        self.order = list(range(len(self.conjuncts)))
+        self.calls = [0] * len(self.conjuncts)
+        self.passed = [0] * len(self.conjuncts)
+        self.seconds = [0.0] * len(self.conjuncts)
+        self.evaluated = 0
+
+    def __bool__(self):
+        return len(self.conjuncts) > 0
+
+    def __len__(self):
+        return len(self.conjuncts)
+
+    def _compile(self, term):
+        """Compile a single conjunct, replacing shared calls by lookups in the per-entry cache."""
+        engine = self
+        class SharedCalls(ast.NodeTransformer):
+            def visit_Call(self, node):
+                key = ast.dump(node)
+                if key in engine._shared_keys:
+                    if engine._shared_keys[key] is None:
+                        inner = self.generic_visit(_copy(node))
+                        engine._shared_keys[key] = len(engine.shared)
+                        engine.shared.append(compile(ast.fix_missing_locations(ast.Expression(inner)), '<cond>', 'eval'))
+                    return ast.copy_location(ast.Call(func = ast.Name(id = '_shared', ctx = ast.Load()),
+                        args = [ast.Constant(engine._shared_keys[key])], keywords = []), node)
+                return self.generic_visit(node)
+        term = SharedCalls().visit(_copy(term))
+        return compile(ast.fix_missing_locations(ast.Expression(term)), '<cond>', 'eval')
+
+    def _shared(self, index):
+        """Evaluate a shared subexpression once per entry."""
+        if index not in self.cache:
+            self.cache[index] = eval(self.shared[index], self.namespace)
+        return self.cache[index]
+
+    def _reorder(self):
+        """
+        Order conjuncts by measured cost per rejected entry, unmeasured conjuncts keep their position at the end.
+        Printing conjuncts keep their place, the conjuncts between them are ordered among themselves.
+        """
+        def rank(i):
+            cost = self.seconds[i] / self.calls[i]
+            rejected = 1 - self.passed[i] / self.calls[i]
+            return cost / rejected if rejected > 0 else float('inf')
+        def ordered(segment):
+            return sorted([i for i in segment if self.calls[i]], key = rank) + [i for i in segment if not self.calls[i]]
+        order = []
+        segment = []
+        for i in self.order:
+            if i in self.fixed:
+                order += ordered(segment) + [i]
+                segment = []
+            else:
+                segment.append(i)
+        self.order = order + ordered(segment)
+
+    def _measure(self):
+        """Evaluate conjuncts in the given order while recording time and pass rate of each."""
+        for i, conjunct in enumerate(self.conjuncts):
+            start = perf_counter()
+            result = eval(conjunct, self.namespace)
+            self.seconds[i] += perf_counter() - start
+            self.calls[i] += 1
+            if not result:
+                return False
+            self.passed[i] += 1
+        return True
+
+    def _evaluate_in_order(self):
+        for conjunct in self.conjuncts:
+            if not eval(conjunct, self.namespace):
+                return False
+        return True
+
+    def __call__(self, entry):
+        """
+        Check whether an entry matches all conditions.
+
+        Args:
+            entry: A JSON entry.
+        Returns:
+            True if all conditions hold for the entry.
+        """
+        self.namespace['entry'] = entry
+        self.cache.clear()
+        if self.evaluated < self.sample_size:
+            self.evaluated += 1
+            result = self._measure()
+            if self.evaluated == self.sample_size:
+                self._reorder()
+            return result
+        try:
+            for i in self.order:
+                if not eval(self.conjuncts[i], self.namespace):
+                    return False
+            return True
+        except Exception:
+            # a conjunct may rely on an earlier one as guard, the original order decides (and raises) in that case
+            self.cache.clear()
+            return self._evaluate_in_order()
+
+    def check_many(self, entries):
+        """
+        Check a list of entries at once. All other conjuncts are checked entry by entry first, the batchable
+        language checks are then run once for all entries still matching.
+
+        Args:
+            entries: A list of JSON entries.
+        Returns:
+            A list with True for each entry matching all conditions.
+        """
+        if not self.batched or not self.batch_many or self.evaluated < self.sample_size:
+            return [self(entry) for entry in entries]
+        results = [False] * len(entries)
+        matching = []
+        for k, entry in enumerate(entries):
+            self.namespace['entry'] = entry
+            self.cache.clear()
+            try:
+                for i in self.order:
+                    if i not in self.batched and not eval(self.conjuncts[i], self.namespace):
+                        break
+                else:
+                    matching.append(k)
+            except Exception:
+                self.cache.clear()
+                results[k] = self._evaluate_in_order()
+        try:
+            for i in self.order:
+                if i in self.batched and matching:
+                    function, text, args, kwargs = self.batched[i]
+                    texts = []
+                    for k in matching:
+                        self.namespace['entry'] = entries[k]
+                        self.cache.clear()
+                        texts.append(eval(text, self.namespace))
+                    verdicts = eval(function, self.namespace)(texts, *eval(args, self.namespace), **eval(kwargs, self.namespace))[0]
+                    matching = [k for k, verdict in zip(matching, verdicts) if verdict]
+        except Exception:
+            matching = [k for k in matching if self(entries[k])]
+        for k in matching:
+            results[k] = True
+        return results
+
+def _batchable(term):
+    """Whether a conjunct is a call of a function in BATCH_FUNCTIONS whose arguments besides the text do not depend on the entry."""
+    if not (isinstance(term, ast.Call) and isinstance(term.func, ast.Attribute) and isinstance(term.func.value, ast.Name)
+            and term.func.attr in BATCH_FUNCTIONS and term.args):
+        return False
+    if any(isinstance(arg, ast.Starred) for arg in term.args) or any(kw.arg is None for kw in term.keywords):
+        return False
+    if _may_print(term):
+        return False
+    for node in term.args[1:] + [kw.value for kw in term.keywords]:
+        if any(isinstance(n, ast.Name) and n.id == 'entry' for n in ast.walk(node)):
+            return False
+    return True
+
+def _may_print(call):
+    """Whether a call passes a print_command (by keyword, or by position to a function in PRINT_COMMAND_POSITIONS) that is not a constant false value."""
+    name = call.func.attr if isinstance(call.func, ast.Attribute) else getattr(call.func, 'id', None)
+    position = PRINT_COMMAND_POSITIONS.get(name)
+    print_command = [kw.value for kw in call.keywords if kw.arg == 'print_command']
+    if position is not None and len(call.args) > position:
+        print_command.append(call.args[position])
+    return any(not (isinstance(arg, ast.Constant) and not arg.value) for arg in print_command)
+
+def _prints(term):
+    """Whether a conjunct contains a call that may print."""
+    return any(isinstance(node, ast.Call) and _may_print(node) for node in ast.walk(term))
+
+def _entry_fields(terms):
+    """Collect the constant keys of all entry[...] lookups, None if 'entry' is used otherwise."""
+    fields = set()
+    lookups = set()
+    for term in terms:
+        for node in ast.walk(term):
+            if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'entry':
+                if not (isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+                    return None
+                fields.add(node.slice.value)
+                lookups.add(id(node.value))
+        for node in ast.walk(term):
+            if isinstance(node, ast.Name) and node.id == 'entry' and id(node) not in lookups:
+                return None
+    return fields
+
+def _copy(node):
+    return ast.parse(ast.unparse(node), mode = 'eval').body
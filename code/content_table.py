@@ -0,0 +1,134 @@
+"""
+Random-access content table of JSON Lines batches: the byte offset and length of the line of each entry, keyed by
+coreId and optionally by DOI and MAG id.
+
+Every key is stored as sorted 64 bit hashes (see core_index.key_hash) with the file number, offset and length of the
+line of its entry, as numpy files opened with mmap. Looking up entries is a binary search, and the lines of a batch of
+ids are read with one seek each, in file and offset order. Offsets refer to the decompressed content of .gz and .zst
+batches (see jsonl_io.py), which are read forward to the requested lines. Entries are checked against the requested id after
+decoding, so hash collisions never return a wrong entry.
+"""
+
+from json import dump, load
+from json_codec import loads
+from os.path import exists, sep
+from os import makedirs
+import numpy as np
+from core_index import key_hash, normalise_doi
+from jsonl_io import open_jsonl
+
+KEYS = ['coreId', 'doi', 'mag_id']
+
+def entry_keys(entry, key):
+    """The values of a key of an entry: its coreId, its normalised DOI or its MAG ids (merged corpus)."""
+    if key == 'coreId':
+        core_id = entry.get('coreId', entry.get('core_id'))
+        return [str(core_id)] if core_id is not None else []
+    if key == 'doi':
+        doi = normalise_doi(entry.get('doi'))
+        return [doi] if doi else []
+    if key == 'mag_id':
+        return [str(mag_id) for mag_id in entry.get('mag_ids') or []]
+    raise ValueError("Unknown key " + str(key))
+
+def lookup_key(key, value):
+    """The form of a requested id that is stored for the key."""
+    return normalise_doi(value) if key == 'doi' else str(value)
+
+def write_content_table(directory, filenames, parts, keys):
+    """
+    Write the content table of a list of batch files.
+
+    Args:
+        filenames: Names of the batch files, relative to the input directory.
+        parts: For each batch file, a dict from each key to the (hashes, offsets, lengths) of its entries.
+        keys: The keys the table is built for.
+    """
+    if not exists(directory): makedirs(directory)
+    with open(directory + sep + "files.json", "w") as files_file:
+        dump({"files": filenames, "keys": keys}, files_file)
+    for key in keys:
+        hashes = np.concatenate([np.asarray(part[key][0], dtype = np.uint64) for part in parts] + [np.zeros(0, dtype = np.uint64)])
+        files = np.concatenate([np.full(len(part[key][0]), number, dtype = np.int32) for number, part in enumerate(parts)] + [np.zeros(0, dtype = np.int32)])
+        offsets = np.concatenate([np.asarray(part[key][1], dtype = np.int64) for part in parts] + [np.zeros(0, dtype = np.int64)])
+        lengths = np.concatenate([np.asarray(part[key][2], dtype = np.int64) for part in parts] + [np.zeros(0, dtype = np.int64)])
+        order = np.argsort(hashes, kind = 'stable')
+        np.save(directory + sep + key + ".keys.npy", hashes[order])
+        np.save(directory + sep + key + ".files.npy", files[order])
+        np.save(directory + sep + key + ".offsets.npy", offsets[order])
+        np.save(directory + sep + key + ".lengths.npy", lengths[order])
+
+class ContentTable:
+    """
+    Read-only access to a content table written by write_content_table.
+
+    Attributes:
+        directory: The directory of the table files.
+        input_directory: The directory of the batch files.
+        files: Names of the batch files.
+        keys: The keys the table was built for.
+    """
+    def __init__(self, directory, input_directory):
+        self.directory = directory
+        self.input_directory = input_directory
+        with open(directory + sep + "files.json") as files_file:
+            files = load(files_file)
+        self.files = files['files']
+        self.keys = files['keys']
+        self.columns = {}
+        for key in self.keys:
+            self.columns[key] = {column: np.load(directory + sep + key + "." + column + ".npy", mmap_mode = 'r') for column in ['keys', 'files', 'offsets', 'lengths']}
+
+    def __len__(self):
+        return len(self.columns[self.keys[0]]['keys'])
+
+    def locate(self, ids, key = 'coreId'):
+        """
+        Return (id, file number, offset, length) of all lines stored under the ids, sorted by file and offset.
+        Lines of other ids with the same hash are included.
+        """
+        if key not in self.columns:
+            raise ValueError("The content table has no key " + str(key))
+        columns = self.columns[key]
+        locations = []
+        for identifier in dict.fromkeys(ids):
+            if lookup_key(key, identifier) is None:
+                continue
+            hashed = np.uint64(key_hash(lookup_key(key, identifier)))
+            start = int(np.searchsorted(columns['keys'], hashed, side = 'left'))
+            end = int(np.searchsorted(columns['keys'], hashed, side = 'right'))
+            for i in range(start, end):
+                locations.append((identifier, int(columns['files'][i]), int(columns['offsets'][i]), int(columns['lengths'][i])))
+        return sorted(locations, key = lambda location: (location[1], location[2]))
+
+    def open_many(self, ids, key = 'coreId'):
+        """
+        Read the entries of a list of ids. Each batch file is opened once and the lines are read in offset order.
+
+        Returns:
+            A dict from each id found to the list of its entries (one entry per coreId; several are possible for DOIs).
+        """
+        result = {}
+        batch = None
+        position = 0
+        for identifier, number, offset, length in self.locate(ids, key):
+            if batch is None or batch[0] != number:
+                if batch is not None:
+                    batch[1].close()
+                batch = (number, open_jsonl(self.input_directory + sep + self.files[number], "rb", threads = 0))
+                position = 0
+            if offset + length == position:
+                pass
+            elif batch[1].seekable():
+                batch[1].seek(offset)
+                line = batch[1].read(length)
+            else:
+                batch[1].read(offset - position)
+                line = batch[1].read(length)
+            position = offset + length
+            entry = loads(line)
+            if lookup_key(key, identifier) in entry_keys(entry, key):
+                result.setdefault(identifier, []).append(entry)
+        if batch is not None:
+            batch[1].close()
+        return result
@@ -0,0 +1,183 @@
+"""
+Persistent, memory-mappable index of the CORE entries used for matching with the OAG.
+
+Built once from the English CORE batches (or matching_data_complete.json), it replaces loading all
+(coreId, title, authors, doi, year) tuples into Python lists and dicts. Every entry is a row. coreIds, titles,
+lowercased author names and normalised DOIs are stored as one byte blob each with row offsets, years as an int32
+column. Normalised DOIs and normalised titles are hashed to 64 bit keys; the sorted unique keys point to the rows
+with that key in CSR layout (offsets into a row array). The key of each row found by its hash is compared with the
+requested key, so hash collisions never return a wrong entry. All files are numpy arrays opened with mmap, so loading takes no time and
+only the pages touched by lookups are read.
+"""
+
+from json import load, loads
+from glob import glob
+from os.path import basename, exists, isfile, isdir, getsize, sep
+from os import makedirs
+from array import array
+from hashlib import blake2b
+from argparse import ArgumentParser
+from datetime import datetime
+import numpy as np
+from title_index import normalise_title
+
+MISSING_YEAR = -2**31
+AUTHOR_SEPARATOR = '\x1f'
+STRING_COLUMNS = ['core_ids', 'titles', 'authors', 'dois']
+KEY_COLUMNS = ['doi', 'title']
+
+def normalise_doi(doi):
+    """Return the DOI lowercased, without spaces and resolver prefix, None for missing DOIs."""
+    if not isinstance(doi, str):
+        return None
+    doi = doi.replace(' ','').lower()
+    for prefix in ['https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/', 'doi:']:
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi if doi else None
+
+def key_hash(key):
+    """Stable 64 bit hash of a normalised key."""
+    return int.from_bytes(blake2b(key.encode('utf-8', 'surrogatepass'), digest_size = 8).digest(), 'little')
+
+def entries_from_batches(input_path):
+    """Yield (coreId, title, authors, doi, year) for each entry of CORE JSON Lines file(s)."""
+    filepaths = [input_path] if isfile(input_path) else [filepath for filepath in sorted(glob(input_path + sep + "*")) if isfile(filepath)]
+    for filepath in filepaths:
+        print(basename(filepath))
+        with open(filepath) as input_file:
+            for line in input_file:
+                entry = loads(line)
+                yield (entry['coreId'], entry['title'], entry['authors'], entry['doi'], entry['year'])
+
+def build_index(entries, directory):
+    """
+    Build the index of an iterable of (coreId, title, authors, doi, year) in directory.
+    Only the keys, not the entries, are kept in memory while building.
+    """
+    if not exists(directory): makedirs(directory)
+    blobs = {column: open(directory + sep + column + ".bin", "wb") for column in STRING_COLUMNS}
+    offsets = {column: array('Q', [0]) for column in STRING_COLUMNS}
+    years = array('i')
+    keys = {column: array('Q') for column in KEY_COLUMNS}
+    key_rows = {column: array('I') for column in KEY_COLUMNS}
+    row = -1
+    for row, (core_id, title, authors, doi, year) in enumerate(entries):
+        names = AUTHOR_SEPARATOR.join(n.lower() for n in authors or [] if isinstance(n, str))
+        for column, value in zip(STRING_COLUMNS, [str(core_id), title or '', names, normalise_doi(doi) or '']):
+            data = value.encode('utf-8', 'surrogatepass')
+            blobs[column].write(data)
+            offsets[column].append(offsets[column][-1] + len(data))
+        years.append(year if isinstance(year, int) and not isinstance(year, bool) and -2**31 < year < 2**31 else MISSING_YEAR)
+        for column, key in zip(KEY_COLUMNS, [normalise_doi(doi), normalise_title(title)]):
+            if key is not None:
+                keys[column].append(key_hash(key))
+                key_rows[column].append(row)
+    for column in STRING_COLUMNS:
+        blobs[column].close()
+        np.save(directory + sep + column + ".offsets.npy", np.frombuffer(offsets[column], dtype = np.uint64))
+    np.save(directory + sep + "years.npy", np.frombuffer(years, dtype = np.int32) if len(years) else np.zeros(0, dtype = np.int32))
+    for column in KEY_COLUMNS:
+        hashes = np.array(keys[column], dtype = np.uint64)
+        rows = np.array(key_rows[column], dtype = np.uint32)
+        order = np.argsort(hashes, kind = 'stable')
+        hashes = hashes[order]
+        rows = rows[order]
+        unique, starts = np.unique(hashes, return_index = True)
+        np.save(directory + sep + column + ".keys.npy", unique)
+        np.save(directory + sep + column + ".key_offsets.npy", np.append(starts, len(hashes)).astype(np.uint64))
+        np.save(directory + sep + column + ".rows.npy", rows)
+    print(f"Indexed {row + 1} entries.")
+
+class CoreIndex:
+    """
+    Read-only access to an index built by build_index.
+
+    Attributes:
+        directory: The directory of the index files.
+        size: Number of indexed entries.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.blobs = {}
+        self.offsets = {}
+        for column in STRING_COLUMNS:
+            path = directory + sep + column + ".bin"
+            self.blobs[column] = np.memmap(path, dtype = np.uint8, mode = 'r') if getsize(path) else np.zeros(0, dtype = np.uint8)
+            self.offsets[column] = np.load(directory + sep + column + ".offsets.npy", mmap_mode = 'r')
+        self.years = np.load(directory + sep + "years.npy", mmap_mode = 'r')
+        self.keys = {}
+        self.key_offsets = {}
+        self.key_rows = {}
+        for column in KEY_COLUMNS:
+            self.keys[column] = np.load(directory + sep + column + ".keys.npy", mmap_mode = 'r')
+            self.key_offsets[column] = np.load(directory + sep + column + ".key_offsets.npy", mmap_mode = 'r')
+            self.key_rows[column] = np.load(directory + sep + column + ".rows.npy", mmap_mode = 'r')
+        self.size = len(self.years)
+
+    def _string(self, column, row):
+        offsets = self.offsets[column]
+        return bytes(self.blobs[column][offsets[row]:offsets[row+1]]).decode('utf-8', 'surrogatepass')
+
+    def _rows(self, column, key):
+        if key is None:
+            return []
+        hashed = np.uint64(key_hash(key))
+        keys = self.keys[column]
+        position = int(np.searchsorted(keys, hashed))
+        if position == len(keys) or keys[position] != hashed:
+            return []
+        offsets = self.key_offsets[column]
+        rows = [int(row) for row in self.key_rows[column][offsets[position]:offsets[position+1]]]
+        return [row for row in rows if self._key(column, row) == key]
+
+    def _key(self, column, row):
+        """The normalised key of a row, to rule out hash collisions."""
+        if column == 'doi':
+            return self._string('dois', row)
+        return normalise_title(self.title(row))
+
+    def rows_for_doi(self, doi):
+        """Rows of all entries with the same normalised DOI, in the order they were indexed."""
+        return self._rows('doi', normalise_doi(doi))
+
+    def rows_for_title(self, title):
+        """Rows of all entries with the same normalised title, in the order they were indexed."""
+        return self._rows('title', normalise_title(title))
+
+    def core_id(self, row):
+        return self._string('core_ids', row)
+
+    def title(self, row):
+        title = self._string('titles', row)
+        return title if title else None
+
+    def author_names(self, row):
+        """The lowercased author names of an entry."""
+        names = self._string('authors', row)
+        return names.split(AUTHOR_SEPARATOR) if names else []
+
+    def year(self, row):
+        year = int(self.years[row])
+        return None if year == MISSING_YEAR else year
+
+    def entry(self, row):
+        """The (coreId, title, lowercased authors, None, year) tuple of a row, as used by the matching."""
+        return (self.core_id(row), self.title(row), self.author_names(row), None, self.year(row))
+
+if __name__ == "__main__":
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument("-i", "--input")
+    argument_parser.add_argument("-o", "--output")
+
+    args = vars(argument_parser.parse_args())
+
+    print(datetime.now())
+    if isfile(args["input"]) and args["input"].endswith(".json"):
+        with open(args["input"]) as input_file:
+            build_index(load(input_file)['all_data'], args["output"])
+    else:
+        build_index(entries_from_batches(args["input"]), args["output"])
+    print(datetime.now())
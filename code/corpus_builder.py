@@ -1,19 +1,28 @@
 import traceback
-from json import dump, loads, load
+from json import load
 from pprint import pprint, pformat
 from glob import glob
 from os.path import basename, exists, isfile, isdir, sep, dirname, join
-from os import makedirs
+from os import makedirs, remove
 from datetime import datetime
 from argparse import ArgumentParser
 from multiprocessing import Pool
 from math import ceil
 import utils
-import fasttext
+from conditions import ConditionSet
+from content_table import ContentTable, write_content_table, entry_keys
+from core_index import key_hash
+from author_index import author_key, document_id
+from corpus_statistics import CorpusStatistics, write_report
+from feature_table import compile_features, write_shard, shard_filepath, duplicate_hashes, duplicate_ids
+from match_table import MatchTable, read_published
+import scheduler
+import shuffle
+import json_codec
+from json_codec import loads, dump
+import numpy as np
 from re import search
 from time import sleep
-import requests
-from requests.exceptions import Timeout
 
 class CorpusBuilderJSON:
     """
@@ -23,19 +32,22 @@ class CorpusBuilderJSON:
         input_filepaths: The absolute paths to the input file(s).
         output_directory: The path to the directory where CSVs, JSONSs, logs and metadata will be saved in a timestamped subdirectory below output_directory.
         pool_size: Size of process pool for multiprocessing.
+        threads: Number of threads decompressing ahead per input file; .gz and .zst inputs are read according to their extension.
+        chunk_size: Approximate number of bytes of the chunks input files are split into (see scheduler.py).
 
     """
-    def __init__(self, input_filepath, pool_size = 10):
+    def __init__(self, input_filepath, pool_size = 10, threads = 1, chunk_size = scheduler.CHUNK_SIZE):
 
         if isfile(input_filepath):
             self.input_filepaths = [input_filepath]
         if isdir(input_filepath):
-            self.input_filepaths = sorted(glob(input_filepath + sep + "*"))
+            self.input_filepaths = [filepath for filepath in sorted(glob(input_filepath + sep + "*")) if isfile(filepath)]
         
         self.pool_size = pool_size
         self.input_filepath = input_filepath
         self.output_directory = None
-
+        self.threads = threads
+        self.chunk_size = chunk_size
 
     def __enter__(self):
         return self
@@ -55,8 +67,31 @@ class CorpusBuilderJSON:
             if len(self.input_filepaths) > 1:
                 metadata_file.write("Entries extracted from: " + self.input_filepaths[0][:self.input_filepaths[0].rfind('/')] + "\n")
             else:
-                metatdata_file.write("Entries extracted from: " + self.input_filepaths[0] + "\n")
+                metadata_file.write("Entries extracted from: " + self.input_filepaths[0] + "\n")
             metadata_file.write("conditions: " + str(conditions) + "\n")
+            metadata_file.write("json codec: " + json_codec.BACKEND + "\n")
+
+    def map_chunks(self, pool, function, arguments = ()):
+        """
+        Apply a helper function to all chunks of the input files, largest first. Each task is the chunk followed by the arguments.
+
+        Returns:
+            An iterator of (position of the chunk in the files, result) in the order the results are done.
+        """
+        chunks = scheduler.split(self.input_filepaths, self.chunk_size)
+        sizes = [scheduler.chunk_size_of(chunk) for chunk in chunks]
+        return scheduler.imap_largest_first(pool, function, [chunk + tuple(arguments) for chunk in chunks], sizes)
+
+    def map_chunks_in_order(self, pool, function, arguments = (), whole_files = False):
+        """
+        Apply a helper function to all chunks of the input files in the order of the files, for merges whose result
+        depends on the order. Each task is the chunk followed by the arguments. With whole_files, every input file is one chunk.
+
+        Returns:
+            An iterator of the results in the order of the chunks in the files.
+        """
+        chunks = scheduler.split(self.input_filepaths, None if whole_files else self.chunk_size)
+        return scheduler.imap_in_order(pool, function, [chunk + tuple(arguments) for chunk in chunks])
 
     def load_entry(self, line):
         """
@@ -82,52 +117,150 @@ class CorpusBuilderJSON:
     def dict_authors_in_batches(self, output_filepath, conditions = None):
         """
             Creates a dictionary listing all authors and how often they appear in the data.
+            The count of an author depends on the counts before it in the same file, so the files are not split into chunks.
         """
         with open(output_filepath, "w") as output_file:
-            with Pool(self.pool_size) as pool:
-                results = pool.map(self.dict_authors_in_batch, [(input_filepath, conditions) for input_filepath in self.input_filepaths])
             authors = {}
-            for entry in results:
-                for person in entry[1]:
-                    if person in authors:
-                        authors[person] = authors[person] + entry[1][person]
-                    else:
-                        authors[person] = entry[1][person]
+            with Pool(self.pool_size) as pool:
+                for entry in self.map_chunks_in_order(pool, self.dict_authors_in_batch, [conditions], whole_files = True):
+                    for person in entry[1]:
+                        if person in authors:
+                            authors[person] = authors[person] + entry[1][person]
+                        else:
+                            authors[person] = entry[1][person]
             dump(authors, output_file)
             print(f"Found {len(authors)} different authors.")
 
-    def dict_authors_in_batch(self, input_filepath_and_conditions):
+    def dict_authors_in_batch(self, chunk_and_conditions):
         """Helper function for parallel processing."""
-        input_filepath = input_filepath_and_conditions[0]
-        conditions = input_filepath_and_conditions[1]
+        input_filepath = chunk_and_conditions[0]
+        conditions = chunk_and_conditions[3]
         print(basename(input_filepath))
         authors = {}
-        with open(input_filepath) as input_file:
-            for line in input_file:
-                entry = self.load_entry(line)
-                if conditions:
-                    for condition in conditions:
-                        if not eval(condition):
-                            break
+        check_conditions = ConditionSet(conditions, globals())
+        for line in scheduler.read_chunk(chunk_and_conditions, "r", self.threads):
+            entry = self.load_entry(line)
+            if entry is None:
+                continue
+            if not conditions or check_conditions(entry):
+                omit = []
+                for author in entry['authors']:
+                    if author in authors and not author in omit:
+                        authors[author] = authors[author] + 1
+                        if entry['authors'].count(author) > 1:
+                            omit.append(author)
                     else:
-                        omit = []
-                        for author in entry['authors']:
-                            if author in authors and not author in omit:
-                                authors[author] = authors[author] + 1
-                                if entry['authors'].count(author) > 1:
-                                    omit.append(author)
-                            else:
-                                authors[author] = 1
-                else:
-                    omit = []
-                    for author in entry['authors']:
-                        if author in authors and not author in omit:
-                            authors[author] = authors[author] + 1
-                            if entry['authors'].count(author) > 1:
-                                omit.append(author)
-                        else:
-                            authors[author] = 1
+                        authors[author] = 1
         return (basename(input_filepath), authors)                       
+
+    def count_authors_in_batches(self, output_directory, conditions = None, partitions = 64, output_format = 'jsonl'):
+        """
+            Counts in how many entries each author appears, with bounded memory. Unlike dict_authors_in_batches, an author
+            listed twice in an entry is counted once for it, so the counts of the chunks add up to the same total however
+            the files are split. The counts of each chunk are spilled to hash partitions on disk (see shuffle.py), which are
+            reduced in parallel and written to output_directory as one JSON Lines or Parquet file of {"author", "count"}
+            records per partition (read with shuffle.read_records).
+        """
+        spill_directory = output_directory + sep + "spill"
+        shuffle.remove_spill(spill_directory)
+        if not exists(output_directory): makedirs(output_directory)
+        for filepath in glob(output_directory + sep + "part-*"):
+            remove(filepath)
+        with Pool(self.pool_size) as pool:
+            for count in scheduler.unordered(self.map_chunks(pool, self.spill_authors_in_batch, [conditions, spill_directory, partitions])):
+                pass
+            results = pool.map(self.reduce_authors_partition, [(spill_directory, partition, output_directory, output_format) for partition in range(partitions)])
+        shuffle.remove_spill(spill_directory)
+        print(f"Found {sum(results)} different authors.")
+
+    def spill_authors_in_batch(self, chunk_and_conditions):
+        """Helper function for parallel processing."""
+        conditions = chunk_and_conditions[3]
+        spill_directory = chunk_and_conditions[4]
+        partitions = chunk_and_conditions[5]
+        print(basename(chunk_and_conditions[0]))
+        authors = {}
+        check_conditions = ConditionSet(conditions, globals())
+        for line in scheduler.read_chunk(chunk_and_conditions, "r", self.threads):
+            entry = self.load_entry(line)
+            if entry is not None and (not conditions or check_conditions(entry)):
+                for author in dict.fromkeys(entry['authors']):
+                    authors[author] = authors.get(author, 0) + 1
+        shuffle.spill(authors.items(), spill_directory, scheduler.chunk_name(chunk_and_conditions), partitions)
+        return len(authors)
+
+    def reduce_authors_partition(self, task):
+        """Helper function for parallel processing."""
+        spill_directory, partition, output_directory, output_format = task
+        authors = {}
+        for author, count in shuffle.read_spill(spill_directory, partition):
+            authors[author] = authors.get(author, 0) + count
+        return shuffle.write_records(shuffle.output_filepath(output_directory, partition, output_format), authors.items(), ['author', 'count'], output_format)
+
+    def export_author_documents(self, output_directory, conditions = None, partitions = 64, output_format = 'jsonl', shard_size = 10000, texts = False, paired_only = False):
+        """
+            Groups the documents of the merged corpus by author with an external shuffle. Each chunk spills one record per
+            author of each entry (its core_id, or coreId in CORE files, whether it is a monograph, the author name and with
+            texts its full text) to the hash partition of the author id (see shuffle.py). The partitions are grouped in
+            parallel, so only one partition per worker is held in memory, and written to output_directory in shards of at
+            most shard_size records, one per author: {"author", "name", "mono", "multi"} with the ids of their monographs and
+            multi-author documents in corpus order, with texts also "mono_texts" and "multi_texts". With paired_only,
+            only authors with monographs and multi-author documents are written.
+        """
+        spill_directory = output_directory + sep + "spill"
+        shuffle.remove_spill(spill_directory)
+        if not exists(output_directory): makedirs(output_directory)
+        for filepath in glob(output_directory + sep + "part-*"):
+            remove(filepath)
+        with Pool(self.pool_size) as pool:
+            for count in scheduler.unordered(self.map_chunks(pool, self.spill_author_documents_in_batch, [conditions, spill_directory, partitions, texts])):
+                pass
+            results = pool.map(self.group_author_documents_partition, [(spill_directory, partition, output_directory, output_format, shard_size, texts, paired_only) for partition in range(partitions)])
+        shuffle.remove_spill(spill_directory)
+        print(f"Exported the documents of {sum(results)} authors.")
+
+    def spill_author_documents_in_batch(self, chunk_and_conditions):
+        """Helper function for parallel processing."""
+        input_filepath = chunk_and_conditions[0]
+        conditions = chunk_and_conditions[3]
+        spill_directory = chunk_and_conditions[4]
+        partitions = chunk_and_conditions[5]
+        texts = chunk_and_conditions[6]
+        print(basename(input_filepath))
+        check_conditions = ConditionSet(conditions, globals())
+        def records():
+            for line in scheduler.read_chunk(chunk_and_conditions, "rb", self.threads):
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    traceback.print_exc()
+                    continue
+                if conditions and not check_conditions(entry):
+                    continue
+                core_id = document_id(entry)
+                authors = entry.get('authors') or []
+                seen = set()
+                for author in authors:
+                    author_id, name = author_key(author)
+                    if author_id not in seen:
+                        seen.add(author_id)
+                        yield author_id, [core_id, len(authors) == 1, name] + ([entry.get('full_text', entry.get('fullText'))] if texts else [])
+        shuffle.spill(records(), spill_directory, scheduler.chunk_name(chunk_and_conditions), partitions)
+
+    def group_author_documents_partition(self, task):
+        """Helper function for parallel processing."""
+        spill_directory, partition, output_directory, output_format, shard_size, texts, paired_only = task
+        authors = {}
+        for author_id, document in shuffle.read_spill(spill_directory, partition):
+            if author_id not in authors:
+                authors[author_id] = (document[2], [], [], [], [])
+            record = authors[author_id]
+            record[1 if document[1] else 2].append(document[0])
+            if texts:
+                record[3 if document[1] else 4].append(document[3])
+        columns = ['author', 'name', 'mono', 'multi'] + (['mono_texts', 'multi_texts'] if texts else [])
+        records = ((author_id,) + record[:len(columns) - 1] for author_id, record in authors.items() if not paired_only or (record[1] and record[2]))
+        return shuffle.write_shards(output_directory, partition, records, columns, output_format, shard_size)
                                 
     def extract_features_from_batches(self, output_filepath, conditions = None, features = ["entry['coreId']"]):
         """
@@ -141,53 +274,86 @@ class CorpusBuilderJSON:
             Creates a dictionary listing all selected features from all core entries matching the conditions.
         """
         with open(output_filepath, "w") as output_file:
-            with Pool(self.pool_size) as pool:
-                results = pool.map(self.extract_features_from_batch, [(input_filepath, conditions, features) for input_filepath in self.input_filepaths])
             feature_list = {}
-            for result in results:
-                for e in result[1]:
-                    if e in feature_list:
-                        print("Error: ID found multiple times")
-                    else:
-                        feature_list[e] = result[1][e]
+            with Pool(self.pool_size) as pool:
+                for result in self.map_chunks_in_order(pool, self.extract_features_from_batch, [conditions, features]):
+                    for e in result[1]:
+                        if e in feature_list:
+                            print("Error: ID found multiple times")
+                        else:
+                            feature_list[e] = result[1][e]
             dump(feature_list, output_file)
             print(f"Length of dict generated: {len(feature_list)}")
 
 
-    def extract_features_from_batch(self, input_filepath_and_conditions):
+    def extract_features_from_batch(self, chunk_and_conditions):
         """Helper function for parallel processing."""
-        input_filepath = input_filepath_and_conditions[0]
-        conditions = input_filepath_and_conditions[1]
-        features = input_filepath_and_conditions[2]
+        input_filepath = chunk_and_conditions[0]
+        features = chunk_and_conditions[4]
         print(basename(input_filepath))
         result = {}
-        with open(input_filepath) as input_file:
-            for line in input_file:
-                entry = self.load_entry(line)
-                if entry is None:
-                    print('empty line found')
-                    continue
-                if conditions:
-                    for condition in conditions:
-                        if not eval(condition):
-                            break
-                    else: 
-                        r = {}
-                        for feature in features:
-                            r[feature] = eval(feature)
-                        if entry['coreId'] in result:
-                            print("Error: ID found multiple times")
-                        else:
-                            result[entry['coreId']] = r
-                else:  
-                    r = {}
-                    for feature in features:
-                        r[feature] = eval(feature)
-                    if entry['coreId'] in result:
-                        print("Error: ID found multiple times")
-                    else:
-                        result[entry['coreId']] = r
+        for core_id, values in self.feature_rows(chunk_and_conditions, chunk_and_conditions[3], features):
+            if core_id in result:
+                print("Error: ID found multiple times")
+            else:
+                result[core_id] = dict(zip(features, values))
         return (basename(input_filepath), result)
+
+    def feature_rows(self, chunk, conditions, features):
+        """
+        Evaluate the features for the entries of a chunk matching the conditions. The features are compiled once per chunk.
+
+        Returns:
+            An iterator of (coreId, list of the feature values) per entry.
+        """
+        check_conditions = ConditionSet(conditions, globals())
+        compiled_features = compile_features(features)
+        for line in scheduler.read_chunk(chunk, "r", self.threads):
+            entry = self.load_entry(line)
+            if entry is None:
+                print('empty line found')
+                continue
+            if conditions and not check_conditions(entry):
+                continue
+            values = []
+            for feature in compiled_features:
+                values.append(eval(feature))
+            yield entry['coreId'], values
+
+    def extract_feature_columns_from_batches(self, output_directory, conditions = None, features = ["entry['coreId']"]):
+        """
+            Extracts the features like extract_features_from_batches, but writes them as one Parquet shard per chunk of the
+            input files (see feature_table.py), which can be read back column by column.
+
+            Args:
+                output_directory: Directory of the shards.
+                conditions: conditions an entry should match to be included in the result set
+                features
+
+            Duplicate coreIds are reported after all shards are written and listed in duplicates.json.
+        """
+        if not exists(output_directory): makedirs(output_directory)
+        with Pool(self.pool_size) as pool:
+            hashes = [result for position, result in self.map_chunks(pool, self.extract_feature_columns_from_batch, [conditions, features, output_directory])]
+        hashes = np.sort(np.concatenate(hashes)) if hashes else np.zeros(0, dtype = np.uint64)
+        duplicates = duplicate_hashes(hashes)
+        if len(duplicates):
+            print(f"Error: {len(duplicates)} IDs found multiple times")
+            with open(output_directory + sep + "duplicates.json", "w") as output_file:
+                dump(duplicate_ids(output_directory, duplicates), output_file)
+        print(f"Number of rows written: {len(hashes)}")
+
+    def extract_feature_columns_from_batch(self, chunk_and_conditions):
+        """Helper function for parallel processing."""
+        features = chunk_and_conditions[4]
+        output_directory = chunk_and_conditions[5]
+        print(basename(chunk_and_conditions[0]))
+        ids = []
+        rows = []
+        for core_id, values in self.feature_rows(chunk_and_conditions, chunk_and_conditions[3], features):
+            ids.append(core_id)
+            rows.append(values)
+        return write_shard(shard_filepath(output_directory, chunk_and_conditions), ids, rows, features)
     
     def timestamp(self, output_filepath, conditions = None, features = None):
         """
@@ -201,75 +367,124 @@ class CorpusBuilderJSON:
         """
         with open(output_filepath, "w") as output_file:
             output_file.write("Started counting at: " + str(datetime.now()) + "\n")
-            with Pool(self.pool_size) as pool:
-                results = pool.map(self.extract_features_from_batch, [(input_filepath, conditions, features) for input_filepath in self.input_filepaths])
             feature_list = {}
-            for result in results:
-                for e in result[1]:
-                    if e in feature_list:
-                        print("Error: ID found multiple times")
-                    else:
-                        feature_list[e] = result[1][e]
+            with Pool(self.pool_size) as pool:
+                for result in self.map_chunks_in_order(pool, self.extract_features_from_batch, [conditions, features]):
+                    for e in result[1]:
+                        if e in feature_list:
+                            print("Error: ID found multiple times")
+                        else:
+                            feature_list[e] = result[1][e]
             print(f"Length of dict generated: {len(feature_list)}")
             output_file.write("Finished counting at: " + str(datetime.now()))
 
     
-    def create_content_table(self, conditions = None):
+    def statistics(self, output_filepath, conditions = None, match_table = None, published = None):
         """
-            Creates a dictionary listing all authors and how often they appear in the data.
+            Computes the corpus statistics (see corpus_statistics.py) in one parallel pass and writes them as a JSON report.
+
+            Args:
+                output_filepath: Path of the report.
+                conditions: Conditions an entry should match to be counted.
+                match_table: Directory of a match table (see match_table.py), to report how many coreIds have a match.
+                published: Path of the published CORE-MAG mapping, to report how many coreIds it contains.
+            Returns:
+                The report.
         """
-        with open(f"{dirname(self.input_filepath)}/content_table.json", "w") as output_file:
-            with Pool(self.pool_size) as pool:
-                results = pool.map(self.create_content_table_batch, [(input_filepath, conditions) for input_filepath in self.input_filepaths])
-            adresses = {}
-            for entry in results:
-                for cid in entry[1]:
-                    if cid in adresses:
-                        print(f"Error: id {cid} appeared multiple times")
-                    else:
-                        adresses[cid] = entry[1][cid]
-            dump(adresses, output_file)
-            print(f"Mapped {len(adresses)} different entries.")
+        statistics = CorpusStatistics()
+        with Pool(self.pool_size) as pool:
+            for result in scheduler.unordered(self.map_chunks(pool, self.statistics_of_batch, [conditions])):
+                statistics.merge(result)
+        report = statistics.report(MatchTable(match_table) if match_table else None, read_published(published)[0] if published else None)
+        write_report(report, output_filepath)
+        print(f"Counted {report['entries']} entries.")
+        return report
+
+    def statistics_of_batch(self, chunk_and_conditions):
+        """Helper function for parallel processing."""
+        conditions = chunk_and_conditions[3]
+        print(basename(chunk_and_conditions[0]))
+        statistics = CorpusStatistics()
+        check_conditions = ConditionSet(conditions, globals())
+        for line in scheduler.read_chunk(chunk_and_conditions, "rb", self.threads):
+            try:
+                entry = loads(line)
+            except ValueError:
+                traceback.print_exc()
+                continue
+            if not conditions or check_conditions(entry):
+                statistics.add(entry)
+        return statistics.compact()
+
+    def content_table_directory(self):
+        """The directory content_table next to the input file or directory."""
+        return f"{dirname(self.input_filepath.rstrip(sep))}/content_table"
+
+    def create_content_table(self, conditions = None, keys = ['coreId']):
+        """
+            Creates a table of the byte offset and length of each entry in the batch files, keyed by coreId and
+            optionally by 'doi' and 'mag_id' (see content_table.py), in the directory content_table next to the input.
+        """
+        filenames = []
+        parts = []
+        with Pool(self.pool_size) as pool:
+            for filename, adresses in self.map_chunks_in_order(pool, self.create_content_table_batch, [conditions, keys]):
+                if not filenames or filenames[-1] != filename:
+                    filenames.append(filename)
+                    parts.append({key: ([], [], []) for key in keys})
+                for key in keys:
+                    for column in range(3):
+                        parts[-1][key][column].extend(adresses[key][column])
+        write_content_table(self.content_table_directory(), filenames, parts, keys)
+        table = ContentTable(self.content_table_directory(), self.input_filepath)
+        duplicates = int(np.sum(np.diff(table.columns[keys[0]]['keys']) == 0))
+        if duplicates:
+            print(f"Error: {duplicates} ids appeared multiple times")
+        print(f"Mapped {len(table) - duplicates} different entries.")
 
-    def create_content_table_batch(self, input_filepath_and_conditions):
+    def create_content_table_batch(self, chunk_and_conditions):
         """Helper function for parallel processing."""
-        input_filepath = input_filepath_and_conditions[0]
-        conditions = input_filepath_and_conditions[1]
+        input_filepath = chunk_and_conditions[0]
+        conditions = chunk_and_conditions[3]
+        keys = chunk_and_conditions[4]
         print(basename(input_filepath))
-        adresses = {}
-        linec = 0
-        with open(input_filepath) as input_file:
-            for line in input_file:
-                entry = self.load_entry(line)
-                if conditions:
-                    for condition in conditions:
-                        if not eval(condition):
-                            break
+        adresses = {key: ([], [], []) for key in keys}
+        check_conditions = ConditionSet(conditions, globals())
+        for offset, line in scheduler.read_chunk_offsets(chunk_and_conditions, self.threads):
+            try:
+                entry = loads(line)
+            except ValueError:
+                traceback.print_exc()
+                entry = None
+            if entry is not None and (not conditions or check_conditions(entry)):
+                for key in keys:
+                    for value in entry_keys(entry, key):
+                        adresses[key][0].append(key_hash(value))
+                        adresses[key][1].append(offset)
+                        adresses[key][2].append(len(line))
+        return (basename(input_filepath), adresses)
+
+    def open_many(self, ids, key = 'coreId'):
+        """
+        Read the entries of a list of ids via the content table.
+
+        Returns:
+            A dict from each id found to the list of its entries.
+        """
+        table = ContentTable(self.content_table_directory(), self.input_filepath)
+        return table.open_many(ids, key)
+
+    def open_specific(self, coreid, key = 'coreId'):
+        for entry in self.open_many([coreid], key).get(coreid, []):
+            print("#" * 100)
+            for tag in ['title','authors','year','doi','fullText']:
+                if tag == 'fullText':
+                    if len(entry['fullText']) > 4000:
+                        print(f'{tag}: {entry[tag][:4000]},\n')
                     else:
-                        adresses[entry['coreId']] = (basename(input_filepath),linec)
+                       print(f'{tag}: {entry[tag]},\n') 
                 else:
-                    adresses[entry['coreId']] = (basename(input_filepath),linec)
-                linec += 1
-        return (basename(input_filepath), adresses)
-    
-    def open_specific(self, coreid):
-        with open(f"{dirname(self.input_filepath)}/content_table.json") as contents:
-            con = load(contents)
-            adress = con[coreid]
-            with open(f"{self.input_filepath}/{adress[0]}") as batch:
-                for i, line in enumerate(batch):
-                    if i == adress[1]:
-                        entry = self.load_entry(line)
-                        print("#" * 100)
-                        for tag in ['title','authors','year','doi','fullText']:
-                            if tag == 'fullText':
-                                if len(entry['fullText']) > 4000:
-                                    print(f'{tag}: {entry[tag][:4000]},\n')
-                                else:
-                                   print(f'{tag}: {entry[tag]},\n') 
-                            else:
-                                print(f'{tag}: {entry[tag]},\n')
-                        break
+                    print(f'{tag}: {entry[tag]},\n')
                         
 
 if __name__ == "__main__":
@@ -285,6 +500,16 @@ if __name__ == "__main__":
     argument_parser.add_argument("--features", nargs='+', default=[])
     argument_parser.add_argument("--size", default=10, type=int)
     argument_parser.add_argument("--id")
+    argument_parser.add_argument("--table_keys", nargs='+', default=["coreId"])
+    argument_parser.add_argument("--threads", default=1, type=int)
+    argument_parser.add_argument("--chunk_size", default=scheduler.CHUNK_SIZE, type=int)
+    argument_parser.add_argument("--partitions", default=64, type=int)
+    argument_parser.add_argument("--format", default="jsonl", choices=shuffle.FORMATS)
+    argument_parser.add_argument("--shard_size", default=10000, type=int)
+    argument_parser.add_argument("--texts", action="store_true")
+    argument_parser.add_argument("--paired_only", action="store_true")
+    argument_parser.add_argument("--match_table", default=None)
+    argument_parser.add_argument("--published", default=None)
 
     args = vars(argument_parser.parse_args())
 
@@ -297,20 +522,39 @@ if __name__ == "__main__":
     LIST = args["list"]
     FEATURES = args["features"]
     ENTRYID = args["id"]
+    TABLE_KEYS = args["table_keys"]
+    THREADS = args["threads"]
+    CHUNK_SIZE = args["chunk_size"]
+    PARTITIONS = args["partitions"]
+    FORMAT = args["format"]
+    SHARD_SIZE = args["shard_size"]
+    TEXTS = args["texts"]
+    PAIRED_ONLY = args["paired_only"]
+    MATCH_TABLE = args["match_table"]
+    PUBLISHED = args["published"]
     
-    with CorpusBuilderJSON(input_filepath=INPUT_PATH, pool_size=SIZE) as cb:
+    with CorpusBuilderJSON(input_filepath=INPUT_PATH, pool_size=SIZE, threads=THREADS, chunk_size=CHUNK_SIZE) as cb:
         if LIST:
             input_json = load(open(LIST))
             
         if MODE == "feature_extract":
-            cb.extract_features_from_batches(OUTPUT_PATH, COND, FEATURES)
+            if FORMAT == "parquet":
+                cb.extract_feature_columns_from_batches(OUTPUT_PATH, COND, FEATURES)
+            else:
+                cb.extract_features_from_batches(OUTPUT_PATH, COND, FEATURES)
         elif MODE == "authors_json":
             cb.dict_authors_in_batches(OUTPUT_PATH, COND)
+        elif MODE == "author_counts":
+            cb.count_authors_in_batches(OUTPUT_PATH, COND, PARTITIONS, FORMAT)
+        elif MODE == "statistics":
+            cb.statistics(OUTPUT_PATH, COND, MATCH_TABLE, PUBLISHED)
+        elif MODE == "author_export":
+            cb.export_author_documents(OUTPUT_PATH, COND, PARTITIONS, FORMAT, SHARD_SIZE, TEXTS, PAIRED_ONLY)
         elif MODE == "timestamp":
             cb.timestamp(OUTPUT_PATH, COND, FEATURES)
         elif MODE == "content_table":
-            cb.create_content_table(COND)
+            cb.create_content_table(COND, TABLE_KEYS)
         elif MODE == "open_specific":
-            cb.open_specific(ENTRYID)
+            cb.open_specific(ENTRYID, TABLE_KEYS[0])
         else:
             print("INVALID MODE.")
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Mergeable statistics of CORE or merged corpus entries, for the numbers of final_numbers.ipynb,
+corpus_description.ipynb and core_mag_mapping.ipynb.
+
+Every worker adds the entries of its chunk to a CorpusStatistics, and the parent merges them in any order. Counts and
+histograms are added up. Distinct values are kept as arrays of 64 bit hashes (DOIs, topics), deduplicated per chunk,
+and the integer coreIds of all entries; the arrays of all chunks are collected and only made unique once for the
+report. The coverage of the coreIds by the match table and by the published CORE-MAG mapping is computed from them.
+
+The numbers are counted as the notebooks counted them with pandas: an entry has a DOI or a language if the value is
+not None, the unique DOIs and topics include the missing value (None, or an empty topic list) once if any entry has
+it, and the coverage is reported both for the unique coreIds (final_numbers.ipynb) and for the entries
+(core_mag_mapping.ipynb).
+"""
+
+from json import dump
+from collections import Counter
+import numpy as np
+from core_index import key_hash
+
+class CorpusStatistics:
+    """
+    Statistics of a set of entries.
+
+    Attributes:
+        entries: Number of entries.
+        with_doi: Number of entries with a DOI.
+        without_doi: Number of entries whose DOI is None or missing.
+        with_topics: Number of entries with at least one topic.
+        without_topics: Number of entries with no topics.
+        with_language: Number of entries with a language.
+        languages: Number of entries per language code.
+        authors_per_document: Number of entries per number of authors.
+        doi_hashes: Arrays of the unique hashes of the DOIs of each chunk.
+        topic_hashes: Arrays of the unique hashes of the topics of each chunk.
+        core_ids: Arrays of the numeric coreIds of the entries of each chunk.
+        other_core_ids: Number of entries whose coreId is missing or not numeric.
+    """
+    def __init__(self):
+        self.entries = 0
+        self.with_doi = 0
+        self.without_doi = 0
+        self.with_topics = 0
+        self.without_topics = 0
+        self.with_language = 0
+        self.languages = Counter()
+        self.authors_per_document = Counter()
+        self.doi_hashes = []
+        self.topic_hashes = []
+        self.core_ids = []
+        self.other_core_ids = 0
+        self._added = ([], [], [])
+
+    def add(self, entry):
+        """Add an entry; call compact before merging or pickling."""
+        self.entries += 1
+        doi = entry.get('doi')
+        if doi is not None:
+            self.with_doi += 1
+            self._added[0].append(key_hash(str(doi)))
+        else:
+            self.without_doi += 1
+        topics = entry.get('topics') or []
+        if topics:
+            self.with_topics += 1
+            self._added[1].extend(key_hash(str(topic)) for topic in topics)
+        else:
+            self.without_topics += 1
+        language = entry.get('language')
+        if language is not None:
+            self.with_language += 1
+            self.languages[str(language.get('code') if isinstance(language, dict) else language)] += 1
+        self.authors_per_document[len(entry.get('authors') or [])] += 1
+        core_id = str(entry.get('core_id', entry.get('coreId')))
+        if core_id.isdigit():
+            self._added[2].append(int(core_id))
+        else:
+            self.other_core_ids += 1
+
+    def compact(self):
+        """Turn the values added since the last call into arrays."""
+        dois, topics, core_ids = self._added
+        if dois:
+            self.doi_hashes.append(np.unique(np.asarray(dois, dtype = np.uint64)))
+        if topics:
+            self.topic_hashes.append(np.unique(np.asarray(topics, dtype = np.uint64)))
+        if core_ids:
+            self.core_ids.append(np.asarray(core_ids, dtype = np.int64))
+        self._added = ([], [], [])
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another set of entries."""
+        self.compact()
+        other.compact()
+        self.entries += other.entries
+        self.with_doi += other.with_doi
+        self.without_doi += other.without_doi
+        self.with_topics += other.with_topics
+        self.without_topics += other.without_topics
+        self.with_language += other.with_language
+        self.languages.update(other.languages)
+        self.authors_per_document.update(other.authors_per_document)
+        self.doi_hashes.extend(other.doi_hashes)
+        self.topic_hashes.extend(other.topic_hashes)
+        self.core_ids.extend(other.core_ids)
+        self.other_core_ids += other.other_core_ids
+        return self
+
+    def report(self, match_table = None, published_core_ids = None):
+        """
+        The statistics as a JSON-serialisable dict.
+
+        Args:
+            match_table: A MatchTable, to count the coreIds with a match.
+            published_core_ids: The coreIds of the published CORE-MAG mapping (see match_table.read_published).
+        """
+        self.compact()
+        doi_hashes = np.unique(np.concatenate(self.doi_hashes)) if self.doi_hashes else np.zeros(0, dtype = np.uint64)
+        topic_hashes = np.unique(np.concatenate(self.topic_hashes)) if self.topic_hashes else np.zeros(0, dtype = np.uint64)
+        core_ids = np.concatenate(self.core_ids) if self.core_ids else np.zeros(0, dtype = np.int64)
+        unique_core_ids = np.unique(core_ids)
+        authors = self.authors_per_document
+        report = {
+            'entries': self.entries,
+            'core_ids': {'unique': len(unique_core_ids), 'duplicates': len(core_ids) - len(unique_core_ids), 'not_numeric': self.other_core_ids},
+            'dois': {'with_doi': self.with_doi, 'unique': len(doi_hashes) + (self.without_doi > 0)},
+            'topics': {'with_topics': self.with_topics, 'unique': len(topic_hashes) + (self.without_topics > 0)},
+            'language': {'with_language': self.with_language, 'codes': dict(self.languages.most_common())},
+            'authors': {
+                'no_authors': authors[0],
+                'monographs': authors[1],
+                'multi_author': sum(count for length, count in authors.items() if length > 1),
+                'per_document': {str(length): authors[length] for length in sorted(authors)}}}
+        coverage = {}
+        if match_table is not None:
+            coverage['match_table'] = int(match_table.contains('core', unique_core_ids).sum())
+            coverage['match_table_entries'] = int(match_table.contains('core', core_ids).sum())
+        if published_core_ids is not None:
+            published_core_ids = np.unique(published_core_ids)
+            coverage['published'] = int(np.isin(unique_core_ids, published_core_ids).sum())
+            coverage['published_entries'] = int(np.isin(core_ids, published_core_ids).sum())
+        if coverage:
+            report['match_coverage'] = coverage
+        return report
+
+def write_report(report, output_filepath):
+    with open(output_filepath, "w") as output_file:
+        dump(report, output_file, indent = 1)
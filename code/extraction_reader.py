@@ -1,15 +1,26 @@
 import traceback
-from json import dump, loads, load
+from json import dump, load, JSONDecoder
+from json.decoder import scanstring
+from re import compile as re_compile
 from pprint import pprint, pformat
 from glob import glob
-from os.path import basename, exists, isfile, isdir, sep
+from os.path import basename, exists, isfile, isdir, getsize, sep
 from os import makedirs
 from datetime import datetime
 from argparse import ArgumentParser
 from multiprocessing import Pool
 from math import ceil
-import fasttext
 import utils
+from conditions import ConditionSet
+from manifest import RunManifest, ShardWriter
+from jsonl_io import open_jsonl, strip_compression, with_compression
+import json_codec
+from json_codec import loads
+import scheduler
+
+JSON_DECODER = JSONDecoder()
+JSON_WHITESPACE = re_compile(r'[ \t\n\r]*')
+JSON_STRING = re_compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
 
 class ExtractionReaderJSON:
     """
@@ -19,18 +30,28 @@ class ExtractionReaderJSON:
         input_filepaths: The absolute paths to the input file(s).
         output_directory: The path to the directory where CSVs, JSONSs, logs and metadata will be saved in a timestamped subdirectory below output_directory.
         pool_size: Size of process pool for multiprocessing.
+        batch_size: Number of entries checked together in reduce mode, language checks run once per batch.
+        compression: Compression of the output batches ('gz', 'zst' or None), input files are read according to their extension.
+        level: Compression level of the output batches, the default of the compression if None.
+        threads: Number of threads decompressing ahead per input file and compressing per output file (zst).
+        chunk_size: Approximate number of bytes of the chunks input files are split into for counting and mapping (see scheduler.py).
 
     """
-    def __init__(self, input_filepath, pool_size = 10, load_model = False):
+    def __init__(self, input_filepath, pool_size = 10, load_model = False, batch_size = 256, compression = None, level = None, threads = 1, chunk_size = scheduler.CHUNK_SIZE):
 
         if isfile(input_filepath):
             self.input_filepaths = [input_filepath]
         if isdir(input_filepath):
-            self.input_filepaths = sorted(glob(input_filepath + sep + "*"))
+            self.input_filepaths = [filepath for filepath in sorted(glob(input_filepath + sep + "*")) if isfile(filepath)]
 
         self.pool_size = pool_size
         self.output_directory = None
         self.load_model = load_model
+        self.batch_size = batch_size
+        self.compression = compression
+        self.level = level
+        self.threads = threads
+        self.chunk_size = chunk_size
 
     def __enter__(self):
         return self
@@ -38,11 +59,18 @@ class ExtractionReaderJSON:
     def __exit__(self, type, value, traceback):
         pass
 
-    def setup(self, output_directory, conditions, message):
+    def setup(self, output_directory, conditions, message, resume = None):
         """
-        Set up run.
+        Set up run. With resume, the run continues in the given directory of an earlier run instead of a new one.
         """
         print(message)
+        if resume:
+            self.output_directory = resume.rstrip(sep)
+            self.timestamp = basename(self.output_directory)
+            with open(self.output_directory + sep + self.timestamp + ".metadata", "a") as metadata_file:
+                metadata_file.write("resumed: " + str(datetime.now())[:-7] + "\n")
+                metadata_file.write("json codec: " + json_codec.BACKEND + "\n")
+            return
         self.timestamp = str(datetime.now())[:-7].replace(":","_").replace("-","_").replace(" ","_")
         self.output_directory = output_directory + sep + self.timestamp
         if not exists(self.output_directory): makedirs(self.output_directory)
@@ -50,8 +78,47 @@ class ExtractionReaderJSON:
             if len(self.input_filepaths) > 1:
                 metadata_file.write("Entries extracted from: " + self.input_filepaths[0][:self.input_filepaths[0].rfind('/')] + "\n")
             else:
-                metatdata_file.write("Entries extracted from: " + self.input_filepaths[0] + "\n")
+                metadata_file.write("Entries extracted from: " + self.input_filepaths[0] + "\n")
             metadata_file.write("conditions: " + str(conditions) + "\n")
+            metadata_file.write("json codec: " + json_codec.BACKEND + "\n")
+
+    def create_pool(self):
+        """
+        Create the process pool for a run. If load_model is set, the fasttext model is loaded here before forking,
+        so workers share it, and each worker loads it through the initializer if it was not inherited.
+        """
+        if self.load_model:
+            utils.load_model()
+            return Pool(self.pool_size, initializer = utils.load_model)
+        return Pool(self.pool_size)
+
+    def map_chunks(self, pool, function, arguments = ()):
+        """
+        Apply a helper function to all chunks of the input files, largest first. Each task is the chunk followed by the arguments.
+
+        Returns:
+            An iterator of (position of the chunk in the files, result) in the order the results are done.
+        """
+        chunks = scheduler.split(self.input_filepaths, self.chunk_size)
+        sizes = [scheduler.chunk_size_of(chunk) for chunk in chunks]
+        return scheduler.imap_largest_first(pool, function, [chunk + tuple(arguments) for chunk in chunks], sizes)
+
+    def map_chunks_in_order(self, pool, function, arguments = ()):
+        """
+        Apply a helper function to all chunks of the input files in the order of the files, for merges whose result
+        depends on the order. Each task is the chunk followed by the arguments.
+
+        Returns:
+            An iterator of the results in the order of the chunks in the files.
+        """
+        chunks = scheduler.split(self.input_filepaths, self.chunk_size)
+        return scheduler.imap_in_order(pool, function, [chunk + tuple(arguments) for chunk in chunks])
+
+    def condition_namespace(self):
+        """Names available to conditions, 'fmodel' refers to the model of the current process if load_model is set."""
+        if self.load_model:
+            return dict(globals(), fmodel = utils.load_model())
+        return globals()
 
     def load_entry(self, line):
         """
@@ -68,24 +135,67 @@ class ExtractionReaderJSON:
             traceback.print_exc()
             return 
 
+    def load_fields(self, line, fields):
+        """
+        Load only some top-level keys of a JSON line in CORE. Values of all other keys are skipped without being decoded,
+        and scanning stops as soon as all requested keys were found, so long fullTexts are mostly never touched.
+
+        Args:
+            line: A JSON line.
+            fields: The keys to decode.
+        Returns:
+            A dict with the requested keys present in the line, None if broken.
+        """
+        try:
+            entry = {}
+            idx = JSON_WHITESPACE.match(line, 0).end()
+            if line[idx] != '{':
+                raise ValueError("Expected object at position " + str(idx))
+            idx = JSON_WHITESPACE.match(line, idx + 1).end()
+            if line[idx] == '}':
+                return entry
+            while True:
+                if line[idx] != '"':
+                    raise ValueError("Expected key at position " + str(idx))
+                key, idx = scanstring(line, idx + 1)
+                idx = JSON_WHITESPACE.match(line, idx).end()
+                if line[idx] != ':':
+                    raise ValueError("Expected ':' at position " + str(idx))
+                idx = JSON_WHITESPACE.match(line, idx + 1).end()
+                if key in fields:
+                    entry[key], idx = JSON_DECODER.raw_decode(line, idx)
+                    if len(entry) == len(fields):
+                        return entry
+                elif line[idx] == '"':
+                    idx = JSON_STRING.match(line, idx).end()
+                else:
+                    _, idx = JSON_DECODER.raw_decode(line, idx)
+                idx = JSON_WHITESPACE.match(line, idx).end()
+                if line[idx] == '}':
+                    return entry
+                if line[idx] != ',':
+                    raise ValueError("Expected ',' at position " + str(idx))
+                idx = JSON_WHITESPACE.match(line, idx + 1).end()
+        except:
+            traceback.print_exc()
+            return
+
     def explore(self, conditions = None, prune_text = False, process_text = True): 
         """
         Read extracted JSON Lines file and pretty print entries.
         """
         options = {0:"e",1:"f",2:"s",3:"q"}
+        check_conditions = ConditionSet(conditions, self.condition_namespace())
         for filepath in self.input_filepaths:
             if input(basename(filepath) + " Skip batch? ('s') ") == "s":
                 continue
-            with open(filepath) as input_file:
+            with open_jsonl(filepath, "r", threads = self.threads) as input_file:
                 for line in input_file:
                     entry = self.load_entry(line)
                     if process_text:
                         entry['full_text'] = utils.preprocessor(entry['full_text'])
                     if conditions:
-                        for condition in conditions:
-                            if not eval(condition):
-                                break
-                        else:
+                        if check_conditions(entry):
                             if prune_text:
                                 if len(entry["full_text"]) > 100:
                                     entry["full_text"] = entry["full_text"][:100]+'[...]'
@@ -130,40 +240,47 @@ class ExtractionReaderJSON:
             output_filepath: Path to which fullText lengths will be written.
         """
         with open(output_filepath, "w") as output_file:
-            with Pool(self.pool_size) as pool:
-                results = pool.map(self.fulltextlength_of_entries_in_batch, self.input_filepaths)
-            for result in results:
-                for text_length in result:
-                    output_file.write(str(text_length) + "\n")
+            with self.create_pool() as pool:
+                for result in self.map_chunks_in_order(pool, self.fulltextlength_of_entries_in_batch):
+                    for text_length in result:
+                        output_file.write(str(text_length) + "\n")
 
-    def fulltextlength_of_entries_in_batch(self, input_filepath):
+    def fulltextlength_of_entries_in_batch(self, chunk):
         """Helper function for parallel processing."""
-        print(basename(input_filepath))
+        print(basename(chunk[0]))
         text_lengths = []
-        with open(input_filepath) as input_file:
-            for line in input_file:
-                entry = loads(line)
-                if entry["fullText"]:
-                    text_lengths.append(len(entry["fullText"]))
-                else:
-                    text_lengths.append(0)
+        for line in scheduler.read_chunk(chunk, "r", self.threads):
+            entry = loads(line)
+            if entry["fullText"]:
+                text_lengths.append(len(entry["fullText"]))
+            else:
+                text_lengths.append(0)
         return text_lengths
 
-    def reduce_batches(self, output_directory, conditions):
+    def reduce_batches(self, output_directory, conditions, resume = None):
         """
         Reduce extracted JSON Lines file(s) to entries matching conditions.
+        If the conditions only look up top-level keys of the entry (entry['language'] ...), only those keys are decoded.
+        Matching lines are copied to the output unchanged.
+        Completed batches are recorded in the manifest of the run (see manifest.py), a resumed run only reduces the others.
+        Resuming a run started with other conditions, compression or level raises a ValueError.
+        Batches are reduced largest first.
 
         Args:
             conditions: Conditions according to which entries will be extracted.
                         "entry['publisher'] == 'Hindawi Publishing Corporation'" will extract any entry
                         where the value to the key 'publisher' matches 'Hindawi Publishing Corporation'.
             output_directory: Directory to which the JSON data will be extracted.
+            resume: Directory of an earlier run to complete, None for a new run.
         """
-        self.setup(output_directory, conditions, "Extracting entries matching conditions: " + str(conditions))
+        self.setup(output_directory, conditions, "Extracting entries matching conditions: " + str(conditions), resume)
         batch_directory = self.output_directory + sep + "batches"
         if not exists(batch_directory): makedirs(batch_directory)
-        with Pool(self.pool_size) as pool:
-            pool.map(self.reduce_batch, [(input_filepath, batch_directory + sep + basename(input_filepath), conditions) for input_filepath in self.input_filepaths])
+        manifest = RunManifest(self.output_directory, {'conditions': conditions, 'compression': self.compression, 'level': self.level})
+        tasks = manifest.pending([(input_filepath, batch_directory + sep + with_compression(strip_compression(basename(input_filepath)), self.compression), conditions) for input_filepath in self.input_filepaths])
+        with self.create_pool() as pool:
+            for record in scheduler.unordered(scheduler.imap_largest_first(pool, self.reduce_batch, tasks, [getsize(task[0]) for task in tasks])):
+                manifest.record(*record)
 
     def reduce_batch(self, input_filepath_and_output_filepath_and_conditions):
         """Helper function for parallel processing."""
@@ -171,19 +288,34 @@ class ExtractionReaderJSON:
         output_filepath = input_filepath_and_output_filepath_and_conditions[1]
         conditions = input_filepath_and_output_filepath_and_conditions[2]
         print(basename(input_filepath))
-        with open(output_filepath, "w") as output_file:
-            with open(input_filepath) as input_file:
-                if self.load_model:
-                    path_to_pretrained_model = 'models/lid.176.ftz'
-                    fmodel = fasttext.load_model(path_to_pretrained_model)
+        with ShardWriter(output_filepath, self.level, self.threads) as output_file:
+            with open_jsonl(input_filepath, "rb", threads = self.threads) as input_file:
+                check_conditions = ConditionSet(conditions, self.condition_namespace())
+                fields = check_conditions.fields
+                utils.preprocessor_cache(self.batch_size)
+                lines = []
+                entries = []
                 for line in input_file:
-                    entry = self.load_entry(line)
-                    for condition in conditions:
-                        if not eval(condition):
-                            break
+                    if not check_conditions:
+                        entry = None
+                    elif fields is not None:
+                        entry = self.load_fields(line.decode(), fields)
                     else:
-                        dump(entry, output_file)
-                        output_file.write("\n")
+                        entry = self.load_entry(line)
+                    lines.append(line)
+                    entries.append(entry)
+                    if len(lines) >= self.batch_size:
+                        self.write_matching_lines(output_file, lines, entries, check_conditions)
+                        lines = []
+                        entries = []
+                self.write_matching_lines(output_file, lines, entries, check_conditions)
+        return output_file.record(input_filepath)
+
+    def write_matching_lines(self, output_file, lines, entries, check_conditions):
+        """Write the raw lines of all entries of a batch matching the conditions."""
+        for line, match in zip(lines, check_conditions.check_many(entries)):
+            if match:
+                output_file.write(line if line.endswith(b"\n") else line + b"\n")
 
     def count_entries_in_batches(self, output_filepath, conditions = None):
         """
@@ -197,8 +329,11 @@ class ExtractionReaderJSON:
         """
         with open(output_filepath, "w") as output_file:
             print(self.pool_size)
-            with Pool(self.pool_size) as pool:
-                results = pool.map(self.count_entries_in_batch, [(input_filepath, conditions) for input_filepath in self.input_filepaths])
+            counts = {basename(input_filepath): 0 for input_filepath in self.input_filepaths}
+            with self.create_pool() as pool:
+                for name, count in scheduler.unordered(self.map_chunks(pool, self.count_entries_in_batch, [conditions])):
+                    counts[name] += count
+            results = list(counts.items())
             if len(self.input_filepaths) > 1:
                 output_file.write("Entries counted from: " + self.input_filepaths[0][:self.input_filepaths[0].rfind('/')] + "\n")
             else:
@@ -211,25 +346,22 @@ class ExtractionReaderJSON:
             for entry in results:
                 output_file.write(basename(entry[0]) + ": " + str(entry[1]) + "\n")
 
-    def count_entries_in_batch(self, input_filepath_and_conditions):
+    def count_entries_in_batch(self, chunk_and_conditions):
         """Helper function for parallel processing."""
-        input_filepath = input_filepath_and_conditions[0]
-        conditions = input_filepath_and_conditions[1]
+        input_filepath = chunk_and_conditions[0]
+        conditions = chunk_and_conditions[3]
         print(basename(input_filepath))
         count = 0
-        with open(input_filepath) as input_file:
-            for line in input_file:
-                if conditions:
-                    entry = self.load_entry(line)
-                    if not entry:
-                        continue
-                    for condition in conditions:
-                        if not eval(condition):
-                            break
-                    else:
-                        count += 1
-                else:
+        check_conditions = ConditionSet(conditions, self.condition_namespace())
+        for line in scheduler.read_chunk(chunk_and_conditions, "r", self.threads):
+            if conditions:
+                entry = self.load_entry(line)
+                if not entry:
+                    continue
+                if check_conditions(entry):
                     count += 1
+            else:
+                count += 1
                     
         return (basename(input_filepath), count)
     
@@ -245,31 +377,29 @@ class ExtractionReaderJSON:
                  'publisher' will create of map of all publishers in the file entries and their frequency.
         """
         with open(output_filepath, "w") as output_file:
-            with Pool(self.pool_size) as pool:
-                mappings = pool.map(self.map_key_of_entries_in_batch, [(input_filepath, key) for input_filepath in self.input_filepaths])
             unified_mapping = {}
-            for mapping in mappings:
-                for key in mapping:
-                    if key not in unified_mapping:
-                        unified_mapping[key] = 0
-                    unified_mapping[key] += mapping[key]
+            with self.create_pool() as pool:
+                for mapping in self.map_chunks_in_order(pool, self.map_key_of_entries_in_batch, [key]):
+                    for key in mapping:
+                        if key not in unified_mapping:
+                            unified_mapping[key] = 0
+                        unified_mapping[key] += mapping[key]
             unified_mapping = {key:unified_mapping[key] for key in sorted(list(unified_mapping.keys()), key = lambda x: unified_mapping[x], reverse=True)}
             for key in unified_mapping:
                 output_file.write(str(key) + ": " + str(unified_mapping[key]) + "\n")
 
-    def map_key_of_entries_in_batch(self, input_filepath_and_key):
+    def map_key_of_entries_in_batch(self, chunk_and_key):
         """Helper function for parallel processing."""
-        input_filepath = input_filepath_and_key[0]
-        key = input_filepath_and_key[1]
+        input_filepath = chunk_and_key[0]
+        key = chunk_and_key[3]
         print(basename(input_filepath))
         mapping = {}
-        with open(input_filepath) as input_file:
-            for line in input_file:
-                entry = loads(line)
-                str_key = str(entry[key])
-                if str_key not in mapping:
-                    mapping[str_key] = 0
-                mapping[str_key] += 1
+        for line in scheduler.read_chunk(chunk_and_key, "r", self.threads):
+            entry = loads(line)
+            str_key = str(entry[key])
+            if str_key not in mapping:
+                mapping[str_key] = 0
+            mapping[str_key] += 1
         return mapping
     
                  
@@ -286,6 +416,12 @@ if __name__ == "__main__":
     argument_parser.add_argument("--size", default=10, type=int)
     argument_parser.add_argument("--list", default=None)
     argument_parser.add_argument("--load_model", default=False)
+    argument_parser.add_argument("--batch_size", default=256, type=int)
+    argument_parser.add_argument("--resume", default=None)
+    argument_parser.add_argument("--compression", default=None, choices=["gz", "zst"])
+    argument_parser.add_argument("--level", default=None, type=int)
+    argument_parser.add_argument("--threads", default=1, type=int)
+    argument_parser.add_argument("--chunk_size", default=scheduler.CHUNK_SIZE, type=int)
 
 
 
@@ -299,15 +435,20 @@ if __name__ == "__main__":
     SIZE = args["size"]
     LIST = args["list"]
     MODEL = args["load_model"]
+    BATCH_SIZE = args["batch_size"]
+    RESUME = args["resume"]
+    COMPRESSION = args["compression"]
+    LEVEL = args["level"]
+    THREADS = args["threads"]
+    CHUNK_SIZE = args["chunk_size"]
 
 
-    with ExtractionReaderJSON(input_filepath=INPUT_PATH, pool_size=SIZE, load_model=MODEL) as er:
+    with ExtractionReaderJSON(input_filepath=INPUT_PATH, pool_size=SIZE, load_model=MODEL, batch_size=BATCH_SIZE, compression=COMPRESSION, level=LEVEL, threads=THREADS, chunk_size=CHUNK_SIZE) as er:
         if LIST:
             input_json = load(open(LIST))
             print("Input set successfully loaded.")
         if MODEL:
-            path_to_pretrained_model = 'models/lid.176.ftz'
-            fmodel = fasttext.load_model(path_to_pretrained_model)
+            fmodel = utils.load_model()
 
         
         if MODE == "explore":
@@ -315,7 +456,7 @@ if __name__ == "__main__":
         elif MODE == "textlength":
             er.fulltextlength_of_entries_in_batches(OUTPUT_PATH)
         elif MODE == "reduce":
-            er.reduce_batches(OUTPUT_PATH, COND)
+            er.reduce_batches(OUTPUT_PATH, COND, RESUME)
         elif MODE == "entrycount":
             er.count_entries_in_batches(OUTPUT_PATH, COND)
         elif MODE == "map":
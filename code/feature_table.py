@@ -0,0 +1,130 @@
+"""
+Columnar output of the features extracted by corpus_builder.py (mode feature_extract with --format parquet).
+
+Every chunk of the input files (see scheduler.py) is written as one Parquet shard with a 'coreId' column and one
+column per feature, named by the feature string as the keys of the JSON output. Columns are typed by pyarrow; the
+values of a feature that have no common type, or that are objects, are stored as JSON strings and the column is listed
+in the schema metadata, so that read_features returns the values as extract_features_from_batch computed them.
+Duplicate coreIds are found by sorting the 64 bit hashes of the id columns of all shards (see core_index.key_hash).
+"""
+
+from glob import glob
+from os.path import sep
+import numpy as np
+import scheduler
+from core_index import key_hash
+from json_codec import loads, dumps
+
+ID_COLUMN = 'coreId'
+JSON_COLUMNS = b'json_columns'
+
+def compile_features(features):
+    """Compile the feature strings once for evaluation per entry with eval()."""
+    return [compile(feature.strip(), '<feature>', 'eval') for feature in features]
+
+def shard_filepath(output_directory, chunk):
+    return output_directory + sep + f"part-{scheduler.chunk_name(chunk)}.parquet"
+
+def _has_struct(data_type):
+    import pyarrow as pa
+    if pa.types.is_struct(data_type) or pa.types.is_map(data_type):
+        return True
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return _has_struct(data_type.value_type)
+    return False
+
+def feature_column(values):
+    """
+    Typed array of the values of a column.
+
+    Returns:
+        (pyarrow array, whether the values are encoded as JSON strings)
+    """
+    import pyarrow as pa
+    try:
+        array = pa.array(values)
+        if not _has_struct(array.type):
+            return array, False
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        pass
+    return pa.array([dumps(value) for value in values], pa.string()), True
+
+def write_shard(filepath, ids, rows, features):
+    """
+    Write the features of the entries of a chunk as a Parquet table.
+
+    Args:
+        ids: coreIds of the entries.
+        rows: Lists of the feature values of the entries, in the order of features.
+    Returns:
+        Sorted hashes of the coreIds.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = {}
+    json_columns = []
+    for i, name in enumerate([ID_COLUMN] + list(features)):
+        columns[name], encoded = feature_column(ids if i == 0 else [row[i - 1] for row in rows])
+        if encoded:
+            json_columns.append(name)
+    table = pa.table(columns).replace_schema_metadata({JSON_COLUMNS: dumps(json_columns)})
+    pq.write_table(table, filepath)
+    return np.sort(np.fromiter((key_hash(str(core_id)) for core_id in ids), dtype = np.uint64, count = len(ids)))
+
+def duplicate_hashes(hashes):
+    """Unique values that occur more than once in a sorted array."""
+    return np.unique(hashes[1:][hashes[1:] == hashes[:-1]])
+
+def shard_filepaths(output_directory):
+    return sorted(glob(output_directory + sep + "part-*.parquet"))
+
+def _json_columns(parquet_file):
+    metadata = parquet_file.schema_arrow.metadata or {}
+    return set(loads(metadata[JSON_COLUMNS])) if JSON_COLUMNS in metadata else set()
+
+def duplicate_ids(output_directory, hashes):
+    """The distinct coreIds of the shards whose hash is in hashes, in the order of their first occurrence."""
+    import pyarrow.parquet as pq
+    wanted = set(hashes.tolist())
+    found = {}
+    for filepath in shard_filepaths(output_directory):
+        parquet_file = pq.ParquetFile(filepath)
+        encoded = ID_COLUMN in _json_columns(parquet_file)
+        for batch in parquet_file.iter_batches(columns = [ID_COLUMN]):
+            for core_id in batch.column(0).to_pylist():
+                core_id = loads(core_id) if encoded else core_id
+                if key_hash(str(core_id)) in wanted:
+                    found[core_id] = None
+    return list(found)
+
+def read_features(output_directory, columns = None, batch_size = 65536):
+    """
+    Yield the rows of all shards in the order of the chunks as dicts, reading only the given columns.
+
+    Args:
+        columns: Names of the columns ('coreId' and feature strings), all columns if None.
+    """
+    import pyarrow.parquet as pq
+    for filepath in shard_filepaths(output_directory):
+        parquet_file = pq.ParquetFile(filepath)
+        encoded = _json_columns(parquet_file)
+        for batch in parquet_file.iter_batches(batch_size = batch_size, columns = columns):
+            names = batch.schema.names
+            values = [[loads(value) for value in column.to_pylist()] if name in encoded else column.to_pylist()
+                      for name, column in zip(names, batch.columns)]
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+def feature_frame(output_directory, columns = None):
+    """Load the given columns of all shards as a pandas DataFrame, with the JSON encoded columns decoded."""
+    import pandas as pd
+    import pyarrow.parquet as pq
+    frames = []
+    for filepath in shard_filepaths(output_directory):
+        parquet_file = pq.ParquetFile(filepath)
+        encoded = _json_columns(parquet_file)
+        frame = parquet_file.read(columns = columns).to_pandas()
+        for name in encoded & set(frame.columns):
+            frame[name] = frame[name].map(loads)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index = True) if frames else pd.DataFrame(columns = columns)
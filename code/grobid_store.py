@@ -0,0 +1,187 @@
+"""
+DOI-indexed access to the full texts extracted by Grobid, stored as a directory of Parquet files with a 'doi' column.
+
+An index from DOI to (file, row group, row) is built once by reading only the 'doi' column of every file. DOIs are
+stored as sorted 64 bit hashes and opened with mmap. Fetching a set of DOIs reads only the row groups containing
+them, and only the requested columns. The index records the path, size and modification time of every file, and is
+rebuilt when it was built from other files or the files have changed since. If the order in which DOIs will be
+requested is known (the ordered DOI list of mergescript.py), texts are loaded in windows of that list, the next window
+being read in a background thread.
+"""
+
+from json import dump, load
+from os.path import exists, getmtime, getsize, sep
+from os import makedirs, remove
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser
+from datetime import datetime
+from glob import glob
+from array import array
+import numpy as np
+from core_index import key_hash
+
+def source_files(filepaths):
+    """The paths, sizes and modification times of the indexed files, as recorded in filepaths.json."""
+    return {"filepaths": list(filepaths),
+            "sizes": [getsize(filepath) for filepath in filepaths],
+            "mtimes": [getmtime(filepath) for filepath in filepaths]}
+
+def is_current(filepaths, index_directory):
+    """Whether the index in index_directory was built from the files in their current state."""
+    if not exists(index_directory + sep + "filepaths.json"):
+        return False
+    with open(index_directory + sep + "filepaths.json") as filepaths_file:
+        recorded = load(filepaths_file)
+    return all(exists(filepath) for filepath in filepaths) and recorded == source_files(filepaths)
+
+def build_doi_index(filepaths, index_directory):
+    """Index the rows of a list of Parquet files by their 'doi'."""
+    import pyarrow.parquet as pq
+    if not exists(index_directory): makedirs(index_directory)
+    if exists(index_directory + sep + "filepaths.json"): remove(index_directory + sep + "filepaths.json")
+    keys = array('Q')
+    files = array('i')
+    row_groups = array('i')
+    rows = array('q')
+    for file_number, filepath in enumerate(filepaths):
+        parquet_file = pq.ParquetFile(filepath)
+        for row_group in range(parquet_file.num_row_groups):
+            dois = parquet_file.read_row_group(row_group, columns = ['doi']).column('doi').to_pylist()
+            for row, doi in enumerate(dois):
+                if isinstance(doi, str):
+                    keys.append(key_hash(doi))
+                    files.append(file_number)
+                    row_groups.append(row_group)
+                    rows.append(row)
+    keys = np.array(keys, dtype = np.uint64)
+    order = np.argsort(keys, kind = 'stable')
+    np.save(index_directory + sep + "keys.npy", keys[order])
+    np.save(index_directory + sep + "files.npy", np.array(files, dtype = np.int32)[order])
+    np.save(index_directory + sep + "row_groups.npy", np.array(row_groups, dtype = np.int32)[order])
+    np.save(index_directory + sep + "rows.npy", np.array(rows, dtype = np.int64)[order])
+    with open(index_directory + sep + "filepaths.json", "w") as filepaths_file:
+        dump(source_files(filepaths), filepaths_file)
+    print(f"Indexed {len(keys)} Grobid rows.")
+
+class GrobidStore:
+    """
+    API to fetch Grobid full texts by DOI.
+
+    Attributes:
+        filepaths: The Parquet files, as indexed.
+        index_directory: Directory of the DOI index, built if it does not exist or is not current.
+        columns: The columns fetched for each DOI.
+        order: DOIs in the order they will be requested, None if unknown.
+        window_size: Number of DOIs of the order loaded at once.
+        prefetch: Whether the next window is loaded in the background.
+    """
+    def __init__(self, filepaths, index_directory, columns = ['content'], order = None, window_size = 10000, prefetch = True):
+        if not is_current(filepaths, index_directory):
+            build_doi_index(filepaths, index_directory)
+        with open(index_directory + sep + "filepaths.json") as filepaths_file:
+            self.filepaths = load(filepaths_file)['filepaths']
+        self.index_directory = index_directory
+        self.columns = columns
+        self.keys = np.load(index_directory + sep + "keys.npy", mmap_mode = 'r')
+        self.files = np.load(index_directory + sep + "files.npy", mmap_mode = 'r')
+        self.row_groups = np.load(index_directory + sep + "row_groups.npy", mmap_mode = 'r')
+        self.rows = np.load(index_directory + sep + "rows.npy", mmap_mode = 'r')
+        self.order = order
+        self.window_size = window_size
+        self.positions = {}
+        if order is not None:
+            for position, doi in enumerate(order):
+                if doi not in self.positions:
+                    self.positions[doi] = position
+        self.window = {}
+        self.window_start = None
+        self.next_window = None
+        self.executor = ThreadPoolExecutor(1) if prefetch else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def _locations(self, doi):
+        hashed = np.uint64(key_hash(doi))
+        start = int(np.searchsorted(self.keys, hashed, side = 'left'))
+        end = int(np.searchsorted(self.keys, hashed, side = 'right'))
+        return range(start, end)
+
+    def __contains__(self, doi):
+        return isinstance(doi, str) and len(self._locations(doi)) > 0
+
+    def locate(self, doi):
+        """The (filepath, row group, row) of all rows with a DOI (and DOIs with the same hash)."""
+        return [(self.filepaths[self.files[i]], int(self.row_groups[i]), int(self.rows[i])) for i in self._locations(doi)]
+
+    def fetch_many(self, dois):
+        """
+        Read the rows of a list of DOIs, reading each needed row group once.
+
+        Returns:
+            A dict from each DOI found to the list of its rows, each row a dict of the fetched columns.
+        """
+        requested = set(d for d in dois if isinstance(d, str))
+        wanted = {}
+        for doi in requested:
+            for i in self._locations(doi):
+                wanted.setdefault((int(self.files[i]), int(self.row_groups[i])), []).append(int(self.rows[i]))
+        import pyarrow.parquet as pq
+        result = {}
+        parquet_file = None
+        for file_number, row_group in sorted(wanted):
+            if parquet_file is None or parquet_file[0] != file_number:
+                parquet_file = (file_number, pq.ParquetFile(self.filepaths[file_number]))
+            table = parquet_file[1].read_row_group(row_group, columns = ['doi'] + self.columns)
+            for row in table.take(sorted(wanted[(file_number, row_group)])).to_pylist():
+                if row['doi'] in requested:
+                    result.setdefault(row['doi'], []).append({column: row[column] for column in self.columns})
+        return result
+
+    def _load_window(self, start):
+        return self.fetch_many(self.order[start:start + self.window_size])
+
+    def get(self, doi):
+        """
+        Return the rows of a DOI (see fetch_many), an empty list if it has none. With an order, the window of the
+        order starting at the DOI is loaded if needed, and the window after it is prefetched. DOIs requested again after
+        their window are fetched on their own.
+        """
+        if doi in self.window:
+            return self.window[doi]
+        start = self.positions.get(doi)
+        if start is None or (self.window_start is not None and start < self.window_start + self.window_size):
+            return self.fetch_many([doi]).get(doi, [])
+        if self.next_window is not None and self.next_window[0] <= start < self.next_window[0] + self.window_size:
+            self.window_start = self.next_window[0]
+            self.window = self.next_window[1].result()
+        else:
+            print(f"Loading full texts from position {start}")
+            self.window_start = start
+            self.window = self._load_window(start)
+        self.next_window = None
+        following = self.window_start + self.window_size
+        if self.executor is not None and following < len(self.order):
+            self.next_window = (following, self.executor.submit(self._load_window, following))
+        return self.window.get(doi, [])
+
+if __name__ == "__main__":
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument("-i", "--input")
+    argument_parser.add_argument("-o", "--output")
+
+    args = vars(argument_parser.parse_args())
+
+    print(datetime.now())
+    build_doi_index(sorted(glob(args["input"] + sep + "*.parquet")), args["output"])
+    print(datetime.now())
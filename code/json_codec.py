@@ -0,0 +1,84 @@
+"""
+JSON decoding and encoding with the fastest installed backend: orjson if it is installed, the json module of the
+standard library otherwise. The backend can be chosen with the environment variable JSON_CODEC ('orjson' or 'json').
+
+Both backends return the same values as json.loads and write JSON that json.loads reads back to the same value.
+orjson writes compact UTF-8 JSON, the json backend writes exactly what json.dumps writes. Where orjson differs from
+the standard library (integers beyond 64 bit, which it decodes as floats; NaN and Infinity; lone surrogates; keys
+that are no strings), the entry is decoded or encoded by the standard library instead.
+"""
+
+import json
+from os import environ
+
+CODECS = ['orjson', 'json']
+LARGE_INTEGER = 2.0**63
+_orjson = None
+BACKEND = None
+
+def _exact(value):
+    """Whether a value contains no float that orjson may have decoded from an integer or can not encode."""
+    kind = type(value)
+    if kind is float:
+        return -LARGE_INTEGER < value < LARGE_INTEGER
+    if kind is dict:
+        return all(_exact(item) for item in value.values())
+    if kind is list or kind is tuple:
+        return all(_exact(item) for item in value)
+    return True
+
+def select(name = None):
+    """
+    Select the backend: name if given, else the first installed of CODECS.
+
+    Returns:
+        The name of the selected backend.
+    """
+    global _orjson, BACKEND
+    for codec in CODECS if name is None else [name]:
+        if codec == 'orjson':
+            try:
+                import orjson
+            except ImportError:
+                if name is not None:
+                    raise
+                continue
+            _orjson = orjson
+        elif codec == 'json':
+            _orjson = None
+        else:
+            raise ValueError("Unknown JSON codec " + str(codec))
+        BACKEND = codec
+        return BACKEND
+
+select(environ.get('JSON_CODEC') or None)
+
+def loads(data):
+    """Decode a JSON document given as str or bytes."""
+    if _orjson is not None:
+        try:
+            value = _orjson.loads(data)
+            if _exact(value):
+                return value
+        except _orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+def dumps_bytes(value):
+    """Encode a value as JSON in UTF-8."""
+    if _orjson is not None and _exact(value):
+        try:
+            return _orjson.dumps(value)
+        except TypeError:
+            pass
+    return json.dumps(value).encode("utf-8")
+
+def dumps(value):
+    """Encode a value as a JSON str."""
+    if _orjson is not None:
+        return dumps_bytes(value).decode("utf-8")
+    return json.dumps(value)
+
+def dump(value, file):
+    """Write a value as JSON to a text file."""
+    file.write(dumps(value))
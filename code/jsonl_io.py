@@ -0,0 +1,128 @@
+"""
+Transparent reading and writing of plain, gzip (.gz) and Zstandard (.zst) compressed JSON Lines files.
+
+The compression is chosen by the file extension. Compressed input is decompressed in a background thread that reads
+ahead while the caller parses lines (zlib and zstandard release the GIL), and Zstandard output can be compressed by
+several threads. zstandard is only imported when a .zst file is opened.
+"""
+
+import io
+import gzip
+from threading import Thread, Event
+from queue import Queue, Empty, Full
+
+COMPRESSIONS = ['gz', 'zst']
+DEFAULT_LEVELS = {'gz': 6, 'zst': 3}
+READ_AHEAD_CHUNK = 2**20
+
+def compression_of(filepath):
+    """The compression of a file by its extension, None if uncompressed."""
+    for compression in COMPRESSIONS:
+        if filepath.endswith("." + compression):
+            return compression
+    return None
+
+def strip_compression(filename):
+    """The file name without compression extension."""
+    compression = compression_of(filename)
+    return filename[:-len(compression)-1] if compression else filename
+
+def with_compression(filename, compression):
+    """The file name with the extension of a compression (None for uncompressed)."""
+    return filename + "." + compression if compression else filename
+
+class ReadAheadReader(io.RawIOBase):
+    """
+    Raw reader that reads (and thereby decompresses) a stream in a background thread, up to 'depth' chunks ahead.
+    """
+    def __init__(self, stream, depth = 4, chunk_size = READ_AHEAD_CHUNK):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.chunks = Queue(depth)
+        self.stopped = Event()
+        self.buffer = b""
+        self.error = None
+        self.thread = Thread(target = self._fill, daemon = True)
+        self.thread.start()
+
+    def _put(self, chunk):
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(chunk, timeout = 0.1)
+                return
+            except Full:
+                pass
+
+    def _fill(self):
+        try:
+            while not self.stopped.is_set():
+                chunk = self.stream.read(self.chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as error:
+            self.error = error
+            self._put(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.buffer:
+            chunk = self.chunks.get()
+            if not chunk:
+                self.chunks.put(b"")
+                if self.error is not None:
+                    raise self.error
+                return 0
+            self.buffer = chunk
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            try:
+                while True:
+                    self.chunks.get_nowait()
+            except Empty:
+                pass
+            self.thread.join()
+            self.stream.close()
+        super().close()
+
+def open_jsonl(filepath, mode = "r", level = None, threads = 1):
+    """
+    Open a plain, .gz or .zst file.
+
+    Args:
+        mode: "r", "rb", "w" or "wb". Text modes read and write UTF-8.
+        level: Compression level when writing, the default of the compression if None.
+        threads: Number of threads for decompressing ahead (reading) or compressing (writing .zst); 0 to work in the
+                 calling thread only.
+    Returns:
+        A file object.
+    """
+    compression = compression_of(filepath)
+    writing = mode.startswith("w")
+    if compression is None:
+        return open(filepath, mode) if "b" in mode else open(filepath, mode, encoding = "utf-8")
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == 'gz':
+        stream = gzip.open(filepath, "wb" if writing else "rb", compresslevel = level)
+    else:
+        import zstandard
+        if writing:
+            stream = zstandard.ZstdCompressor(level = level, threads = threads if threads > 1 else 0).stream_writer(open(filepath, "wb"), closefd = True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(filepath, "rb"), read_across_frames = True, closefd = True)
+    if not writing:
+        stream = io.BufferedReader(ReadAheadReader(stream, depth = 2*threads) if threads > 0 else stream, READ_AHEAD_CHUNK)
+    elif compression == 'zst':
+        stream = io.BufferedWriter(stream, READ_AHEAD_CHUNK)
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding = "utf-8")
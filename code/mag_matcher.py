@@ -0,0 +1,291 @@
+"""
+Matching of OAG/MAG entries against the English CORE entries, as done in mag_matching.ipynb, as a script.
+
+The OAG files are split into byte ranges aligned to line starts, which are matched in parallel. DOI and title are
+taken from the raw bytes of a line first, and only lines whose DOI or title can match are decoded as JSON. The CORE
+lookup tables are built once in the parent process and shared with the forked workers. Every range writes its own
+shards, which are merged in file and offset order, so the output does not depend on the scheduling.
+"""
+
+from json import load, loads, dump
+from glob import glob
+from os.path import basename, exists, isdir, getsize, sep, join
+from os import makedirs, remove, rmdir
+from datetime import datetime
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from re import compile as re_compile
+from shutil import copyfileobj
+import comparison
+
+DOI_FIELD = re_compile(rb'"doi"\s*:\s*"((?:[^"\\]|\\.)*)"')
+TITLE_FIELD = re_compile(rb'"title"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+LOOKUPS = None
+
+class CoreLookups:
+    """
+    Lookup tables of CORE entries (coreId, title, authors, doi, year) by DOI and title.
+
+    Attributes:
+        doi_set: All DOIs, with spaces removed.
+        doi_dict: Entries by DOI.
+        title_set: All titles.
+        auth_dict: Entries by title.
+        title_index: A title_index.TitleIndex for fuzzy title matches, None if only exact titles are matched.
+    """
+    def __init__(self, entries, fuzzy = False):
+        self.doi_set = set()
+        self.doi_dict = {}
+        self.title_set = set()
+        self.auth_dict = {}
+        self.title_index = None
+        for entry in entries:
+            if entry[1]:
+                self.title_set.add(entry[1])
+                if entry[1] in self.auth_dict:
+                    self.auth_dict[entry[1]].append(entry)
+                else:
+                    self.auth_dict[entry[1]] = [entry]
+            if entry[3]:
+                self.doi_set.add(entry[3].replace(' ',''))
+                if entry[3] in self.doi_dict:
+                    self.doi_dict[entry[3]].append(entry)
+                else:
+                    self.doi_dict[entry[3]] = [entry]
+        if fuzzy:
+            from title_index import TitleIndex
+            self.title_index = TitleIndex()
+            self.title_index.add_many((entry[1], entry) for entry in entries)
+
+    def has_doi(self, doi):
+        return doi in self.doi_set
+
+    def doi_entries(self, doi):
+        return self.doi_dict.get(doi, [])
+
+    def has_title(self, title):
+        """Whether a title has exact or (with the title index) fuzzy candidates."""
+        if title in self.title_set:
+            return True
+        return self.title_index is not None and bool(title) and bool(self.title_index.candidates(title))
+
+    def title_candidates(self, title):
+        """CORE entries a title can match, exact matches only if there are any."""
+        if title in self.title_set:
+            return self.auth_dict[title]
+        if self.title_index is not None:
+            return self.title_index.matches(title)
+        return []
+
+    def may_match(self, line):
+        """
+        Check DOI and title in the raw bytes of an OAG line. False only if the line can not match any CORE entry.
+        """
+        for field in DOI_FIELD.finditer(line):
+            if self.has_doi(decode_string(field.group(1))):
+                return True
+        for field in TITLE_FIELD.finditer(line):
+            if self.has_title(decode_string(field.group(1))):
+                return True
+        return False
+
+    def match(self, myjson):
+        """
+        Match an OAG entry like mag_matching.ipynb does: by DOI and similar title, or by title, year and one author.
+
+        Returns:
+            ('doi', coreId) or ('title', coreId) for the first matching CORE entry, None if there is none.
+        """
+        if 'doi' in myjson and self.has_doi(myjson['doi']):
+            for entry in self.doi_entries(myjson['doi']):
+                if myjson.get('title') == entry[1] or comparison.compare(myjson.get('title'), entry[1], 20, 30):
+                    return ('doi', entry[0])
+        elif 'title' in myjson and myjson['title'] and 'year' in myjson:
+            for entry in self.title_candidates(myjson['title']):
+                if myjson['year'] == entry[4] and 'authors' in myjson and len(myjson['authors']) > 0:
+                    for authn in myjson['authors']:
+                        auth = authn['name'].lower().split()
+                        if not auth:
+                            continue
+                        lname = auth[-1]
+                        fname = auth[0]
+                        if any([True if isinstance(n,str) and (n.lower().find(lname)>-1 or n.lower().find(fname)>-1) else False for n in entry[2]]):
+                            return ('title', entry[0])
+        return None
+
+class IndexedCoreLookups(CoreLookups):
+    """
+    CORE lookups backed by a core_index.CoreIndex. DOIs and titles are compared in their normalised form,
+    author names are stored lowercased.
+
+    Attributes:
+        index: The memory-mapped CoreIndex.
+        title_index: A title_index.TitleIndex for fuzzy title matches, None if only exact titles are matched.
+    """
+    def __init__(self, index, fuzzy = False):
+        self.index = index
+        self.title_index = None
+        if fuzzy:
+            from title_index import TitleIndex
+            self.title_index = TitleIndex()
+            self.title_index.add_many((index.title(row), index.entry(row)) for row in range(index.size))
+
+    def has_doi(self, doi):
+        return bool(self.index.rows_for_doi(doi))
+
+    def doi_entries(self, doi):
+        return [self.index.entry(row) for row in self.index.rows_for_doi(doi)]
+
+    def has_title(self, title):
+        if self.index.rows_for_title(title):
+            return True
+        return self.title_index is not None and bool(title) and bool(self.title_index.candidates(title))
+
+    def title_candidates(self, title):
+        rows = self.index.rows_for_title(title)
+        if rows:
+            return [self.index.entry(row) for row in rows]
+        if self.title_index is not None:
+            return self.title_index.matches(title)
+        return []
+
+def decode_string(raw):
+    """Decode the bytes of a JSON string literal without quotes."""
+    if b'\\' in raw:
+        return loads(b'"' + raw + b'"')
+    return raw.decode('utf-8', 'replace')
+
+def load_lookups(core_path, fuzzy = False):
+    """
+    Set up the CORE lookup tables of this process once, from an index directory built by core_index.py
+    or from matching_data_complete.json.
+    """
+    global LOOKUPS
+    if LOOKUPS is None:
+        if isdir(core_path):
+            from core_index import CoreIndex
+            LOOKUPS = IndexedCoreLookups(CoreIndex(core_path), fuzzy)
+        else:
+            with open(core_path) as core_file:
+                LOOKUPS = CoreLookups(load(core_file)['all_data'], fuzzy)
+    return LOOKUPS
+
+def byte_ranges(filepath, chunk_size):
+    """Split a file into (start, end) ranges of about chunk_size bytes. A range owns the lines starting in it."""
+    size = getsize(filepath)
+    return [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)] or [(0, 0)]
+
+class MagMatcher:
+    """
+    API to match OAG files against CORE entries in parallel.
+
+    Attributes:
+        oag_filepaths: The paths to the OAG files (mag_papers_*.txt).
+        core_path: Path to a core_index.py index or to matching_data_complete.json with (coreId, title, authors, doi, year) of all CORE entries.
+        pool_size: Size of process pool for multiprocessing.
+        chunk_size: Size of the byte ranges the OAG files are split into.
+        fuzzy: Whether OAG titles without exact counterpart are looked up in a fuzzy title index.
+    """
+    def __init__(self, oag_path, core_path, pool_size = 10, chunk_size = 2**28, fuzzy = False):
+        self.oag_filepaths = sorted(glob(join(oag_path, "mag_papers_*.txt")))
+        self.core_path = core_path
+        self.pool_size = pool_size
+        self.chunk_size = chunk_size
+        self.fuzzy = fuzzy
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def match(self, output_directory):
+        """
+        Match all OAG files and write the matched OAG entries to output_directory/mag_in_core and
+        the (magId, coreId) pairs to output_directory/matches.json.
+        """
+        print(datetime.now())
+        shard_directory = output_directory + sep + "shards"
+        if not exists(shard_directory): makedirs(shard_directory)
+        load_lookups(self.core_path, self.fuzzy)
+        print("Lookup tables loaded.")
+        tasks = [(filepath, start, end, shard_directory + sep + basename(filepath) + "." + "{0:0=15d}".format(start))
+                 for filepath in self.oag_filepaths for start, end in byte_ranges(filepath, self.chunk_size)]
+        counts = {'doi': 0, 'title': 0, 'lines': 0, 'parsed': 0}
+        with Pool(self.pool_size, initializer = load_lookups, initargs = (self.core_path, self.fuzzy)) as pool:
+            for result in pool.imap_unordered(self.match_range, tasks):
+                for key in counts:
+                    counts[key] += result[key]
+        self.merge_shards(output_directory, [task[3] for task in tasks])
+        rmdir(shard_directory)
+        print(datetime.now())
+        print(f"OAG entries read: {counts['lines']}, decoded: {counts['parsed']}")
+        print(f"Matched by title, year and at least one author: {counts['title']}")
+        print(f"Matched by DOI and title: {counts['doi']}")
+        with open(output_directory + sep + "matching-output.txt", "w") as report:
+            for key in counts:
+                report.write(f"{key}: {counts[key]}\n")
+
+    def match_range(self, task):
+        """Helper function for parallel processing."""
+        filepath, start, end, shard = task
+        print(basename(filepath), start)
+        lookups = load_lookups(self.core_path, self.fuzzy)
+        counts = {'doi': 0, 'title': 0, 'lines': 0, 'parsed': 0}
+        with open(filepath, "rb") as input_file, open(shard + ".mag", "wb") as mag_file, open(shard + ".matches", "w") as matches_file:
+            if start > 0:
+                input_file.seek(start - 1)
+                input_file.readline()
+            while input_file.tell() < end:
+                line = input_file.readline()
+                if not line:
+                    break
+                counts['lines'] += 1
+                if not lookups.may_match(line):
+                    continue
+                counts['parsed'] += 1
+                myjson = loads(line)
+                result = lookups.match(myjson)
+                if result:
+                    counts[result[0]] += 1
+                    mag_file.write(line if line.endswith(b"\n") else line + b"\n")
+                    dump((myjson['id'], result[1]), matches_file)
+                    matches_file.write("\n")
+        return counts
+
+    def merge_shards(self, output_directory, shards):
+        """Concatenate the shards in file and offset order and remove them."""
+        with open(output_directory + sep + "mag_in_core", "wb") as mag_file:
+            for shard in shards:
+                with open(shard + ".mag", "rb") as shard_file:
+                    copyfileobj(shard_file, mag_file)
+                remove(shard + ".mag")
+        with open(output_directory + sep + "matches.json", "w") as matches_file:
+            matches_file.write('{"matches": [')
+            first = True
+            for shard in shards:
+                with open(shard + ".matches") as shard_file:
+                    for line in shard_file:
+                        if not first:
+                            matches_file.write(', ')
+                        matches_file.write(line.rstrip("\n"))
+                        first = False
+                remove(shard + ".matches")
+            matches_file.write(']}')
+
+if __name__ == "__main__":
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument("-i", "--input")
+    argument_parser.add_argument("-o", "--output")
+    argument_parser.add_argument("--core")
+    argument_parser.add_argument("--size", default=10, type=int)
+    argument_parser.add_argument("--chunk_size", default=2**28, type=int)
+    argument_parser.add_argument("--fuzzy", action="store_true")
+
+    args = vars(argument_parser.parse_args())
+
+    with MagMatcher(oag_path=args["input"], core_path=args["core"], pool_size=args["size"], chunk_size=args["chunk_size"], fuzzy=args["fuzzy"]) as mm:
+        mm.match(args["output"])
@@ -0,0 +1,147 @@
+"""
+Read-only keyed access to the MAG entries of a JSON Lines file (mag_sets/mag_in_core) without loading them all.
+
+An offset index (sorted int64 magIds with the byte offset and length of their line) is built once next to the file
+and opened with mmap. Entries are read and decoded on request, batches of them in file order, and the most recently
+used decoded entries are kept in an LRU cache.
+"""
+
+from json_codec import loads
+from os.path import exists, getmtime, sep
+from os import makedirs, open as os_open, close as os_close, pread, O_RDONLY
+from collections import OrderedDict
+from argparse import ArgumentParser
+from datetime import datetime
+from array import array
+import numpy as np
+
+def build_offset_index(path, index_directory):
+    """
+    Index the lines of a MAG JSON Lines file by their 'id'. If an id occurs more than once, its last line is used.
+    """
+    if not exists(index_directory): makedirs(index_directory)
+    ids = array('q')
+    offsets = array('q')
+    lengths = array('q')
+    offset = 0
+    with open(path, "rb") as input_file:
+        for line in input_file:
+            if line.strip():
+                ids.append(int(loads(line)['id']))
+                offsets.append(offset)
+                lengths.append(len(line))
+            offset += len(line)
+    ids = np.array(ids, dtype = np.int64)
+    order = np.argsort(ids, kind = 'stable')
+    ids = ids[order]
+    last = np.append(ids[1:] != ids[:-1], True) if len(ids) else np.zeros(0, dtype = bool)
+    np.save(index_directory + sep + "ids.npy", ids[last])
+    np.save(index_directory + sep + "offsets.npy", np.array(offsets, dtype = np.int64)[order][last])
+    np.save(index_directory + sep + "lengths.npy", np.array(lengths, dtype = np.int64)[order][last])
+    print(f"Indexed {int(last.sum())} MAG entries.")
+
+class MagStore:
+    """
+    Dict-like read-only access to MAG entries by magId.
+
+    Attributes:
+        path: The MAG JSON Lines file.
+        index_directory: Directory of the offset index, built if it does not exist or is older than the file.
+        cache_size: Number of decoded entries kept in the LRU cache.
+    """
+    def __init__(self, path, index_directory = None, cache_size = 100000):
+        self.path = path
+        self.index_directory = index_directory if index_directory else path + ".index"
+        self.cache_size = cache_size
+        if not exists(self.index_directory + sep + "ids.npy") or getmtime(self.index_directory + sep + "ids.npy") < getmtime(path):
+            build_offset_index(path, self.index_directory)
+        self.ids = np.load(self.index_directory + sep + "ids.npy", mmap_mode = 'r')
+        self.offsets = np.load(self.index_directory + sep + "offsets.npy", mmap_mode = 'r')
+        self.lengths = np.load(self.index_directory + sep + "lengths.npy", mmap_mode = 'r')
+        self.cache = OrderedDict()
+        self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self.fd is not None:
+            os_close(self.fd)
+            self.fd = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _positions(self, keys):
+        positions = np.searchsorted(self.ids, keys)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == keys[found]
+        return positions, found
+
+    def __contains__(self, mag_id):
+        return bool(self._positions(np.array([int(mag_id)], dtype = np.int64))[1][0])
+
+    def __getitem__(self, mag_id):
+        return self.get_many([mag_id])[0]
+
+    def get(self, mag_id, default = None):
+        try:
+            return self[mag_id]
+        except KeyError:
+            return default
+
+    def get_many(self, mag_ids):
+        """
+        Return the entries of a list of magIds, in the same order. Entries not in the cache are read in file order.
+        Raises a KeyError for ids that are not in the file.
+        """
+        mag_ids = list(mag_ids)
+        result = [None]*len(mag_ids)
+        missing = []
+        for i, mag_id in enumerate(mag_ids):
+            entry = self.cache.get(mag_id)
+            if entry is None:
+                missing.append(i)
+            else:
+                self.cache.move_to_end(mag_id)
+                result[i] = entry
+        if missing:
+            keys = np.array([int(mag_ids[i]) for i in missing], dtype = np.int64)
+            positions, found = self._positions(keys)
+            if not found.all():
+                raise KeyError(mag_ids[missing[int(np.argmin(found))]])
+            if self.fd is None:
+                self.fd = os_open(self.path, O_RDONLY)
+            offsets = self.offsets[positions]
+            lengths = self.lengths[positions]
+            decoded = {}
+            for j in np.argsort(offsets, kind = 'stable'):
+                mag_id = mag_ids[missing[j]]
+                if mag_id not in decoded:
+                    decoded[mag_id] = loads(pread(self.fd, int(lengths[j]), int(offsets[j])))
+                    self._remember(mag_id, decoded[mag_id])
+            for i in missing:
+                result[i] = decoded[mag_ids[i]]
+        return result
+
+    def _remember(self, mag_id, entry):
+        self.cache[mag_id] = entry
+        self.cache.move_to_end(mag_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last = False)
+
+if __name__ == "__main__":
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument("-i", "--input")
+    argument_parser.add_argument("-o", "--output", default=None)
+
+    args = vars(argument_parser.parse_args())
+
+    print(datetime.now())
+    build_offset_index(args["input"], args["output"] if args["output"] else args["input"] + ".index")
+    print(datetime.now())
@@ -0,0 +1,148 @@
+"""
+Run manifest for jobs that write one output file per input file (reduce_batches, mergescript.py), so that an
+interrupted run can be resumed.
+
+Outputs are written to a '.part' file that is renamed once it is complete, so an output file under its final name is
+always complete. Each completed shard is then recorded in manifest.json in the run directory with the size and
+modification time of its input and the path, size, line count and SHA-256 checksum of its output. The settings that
+decide the content of the outputs (conditions, compression, ...) are stored when the manifest is created, and a run
+with other settings is refused in that directory. A resumed run skips the shards whose record still matches and redoes
+all others.
+"""
+
+from json import dump, load, dumps, loads
+from os.path import abspath, exists, getmtime, getsize, sep
+from os import replace, remove
+from hashlib import sha256
+from jsonl_io import open_jsonl, compression_of, strip_compression, with_compression
+
+MANIFEST_NAME = "manifest.json"
+
+def part_filepath(output_filepath):
+    """Path an output is written to until it is complete, keeping its compression extension."""
+    return with_compression(strip_compression(output_filepath) + ".part", compression_of(output_filepath))
+
+class ShardWriter:
+    """
+    File-like writer of a shard output that counts lines and computes the checksum of everything written
+    (before compression, which is chosen by the extension of the output, see jsonl_io.py).
+    Accepts str (written as UTF-8) and bytes. The output only gets its final name when the writer is closed without
+    an exception.
+
+    Attributes:
+        output_filepath: The final path of the output.
+        lines: Number of lines written.
+        checksum: Hex SHA-256 of the output, set once closed.
+    """
+    def __init__(self, output_filepath, level = None, threads = 1):
+        self.output_filepath = output_filepath
+        self.part_filepath = part_filepath(output_filepath)
+        self.file = open_jsonl(self.part_filepath, "wb", level, threads)
+        self.hash = sha256()
+        self.lines = 0
+        self.checksum = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8", "surrogatepass")
+        self.file.write(data)
+        self.hash.update(data)
+        self.lines += data.count(b"\n")
+
+    def close(self):
+        self.file.close()
+        replace(self.part_filepath, self.output_filepath)
+        self.checksum = self.hash.hexdigest()
+
+    def record(self, input_filepath, result = None):
+        """The arguments of RunManifest.record for the finished shard."""
+        return (input_filepath, self.output_filepath, self.lines, self.checksum, result)
+
+def file_checksum(filepath):
+    """Hex SHA-256 of the (decompressed) content of a file."""
+    file_hash = sha256()
+    with open_jsonl(filepath, "rb") as input_file:
+        for block in iter(lambda: input_file.read(2**20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+class RunManifest:
+    """
+    Record of the completed shards of a run, stored as manifest.json in the run directory.
+
+    Attributes:
+        directory: The run directory.
+        settings: The settings of the run, JSON-serialisable.
+        shards: Record of each completed shard by its input path.
+    """
+    def __init__(self, directory, settings = None):
+        self.directory = directory
+        self.filepath = directory + sep + MANIFEST_NAME
+        self.settings = loads(dumps(settings if settings is not None else {}))
+        self.shards = {}
+        if exists(self.filepath):
+            with open(self.filepath) as manifest_file:
+                manifest = load(manifest_file)
+            if manifest.get('settings') != self.settings:
+                raise ValueError(f"The run in {directory} was started with the settings {manifest.get('settings')}, "
+                                 f"not {self.settings}; start a new run instead of resuming it.")
+            self.shards = manifest['shards']
+        else:
+            self.save()
+
+    def is_complete(self, input_filepath, output_filepath, verify = False):
+        """
+        Whether a shard was completed for the input in its current state. With verify, the checksum of the output
+        is compared as well, otherwise only its size.
+        """
+        shard = self.shards.get(input_filepath)
+        if shard is None or abspath(shard['output']) != abspath(output_filepath) or not exists(output_filepath):
+            return False
+        if shard['input_size'] != getsize(input_filepath) or shard['input_mtime'] != getmtime(input_filepath):
+            return False
+        if shard['output_size'] != getsize(output_filepath):
+            return False
+        return not verify or shard['checksum'] == file_checksum(output_filepath)
+
+    def pending(self, tasks, verify = False):
+        """
+        The tasks whose shard is not complete. Each task starts with its input and output path.
+        Partial outputs left by an interrupted run are removed.
+        """
+        for task in tasks:
+            if exists(part_filepath(task[1])):
+                remove(part_filepath(task[1]))
+        pending = [task for task in tasks if not self.is_complete(task[0], task[1], verify)]
+        if len(pending) < len(tasks):
+            print(f"Resuming: {len(tasks) - len(pending)} of {len(tasks)} shards already completed.")
+        return pending
+
+    def record(self, input_filepath, output_filepath, lines, checksum, result = None):
+        """Record a completed shard, with an optional JSON-serialisable result of it, and save the manifest."""
+        self.shards[input_filepath] = {
+            'input_size': getsize(input_filepath),
+            'input_mtime': getmtime(input_filepath),
+            'output': output_filepath,
+            'output_size': getsize(output_filepath),
+            'lines': lines,
+            'checksum': checksum,
+            'result': result}
+        self.save()
+
+    def save(self):
+        """Write the manifest to a temporary file and rename it, so the manifest on disk is always complete."""
+        with open(self.filepath + ".part", "w") as manifest_file:
+            dump({'settings': self.settings, 'shards': self.shards}, manifest_file)
+        replace(self.filepath + ".part", self.filepath)
+
+    def result(self, input_filepath):
+        return self.shards[input_filepath]['result']
@@ -0,0 +1,158 @@
+"""
+Compact table of the (magId, coreId) matches found by mag_matching.ipynb or mag_matcher.py.
+
+matches.json is a list of string pairs, which has to be decoded completely and turned into dicts of lists before it
+can be used. The match table stores the ids as int64 columns in numpy files instead, once sorted by coreId and once
+sorted by magId, each with CSR offsets from the unique ids to their matches. The files are opened with mmap, so
+loading takes no time, and lookups are binary searches. Matches of an id keep the order of matches.json.
+"""
+
+from json import load
+from os.path import exists, sep
+from os import makedirs
+from argparse import ArgumentParser
+from datetime import datetime
+import numpy as np
+
+SIDES = ['core', 'mag']
+
+def encode_ids(ids):
+    """Integer encoding of string ids; all MAG and CORE ids are decimal numbers."""
+    return np.array([int(i) for i in ids], dtype = np.int64)
+
+def pair_keys(core_ids, mag_ids):
+    """One comparable (void) value per (coreId, magId) pair, for set operations on pairs."""
+    pairs = np.ascontiguousarray(np.stack([np.asarray(core_ids, dtype = np.int64), np.asarray(mag_ids, dtype = np.int64)], axis = 1))
+    return pairs.view(np.dtype((np.void, 16))).ravel()
+
+def build_match_table(pairs, directory):
+    """
+    Build the match table of a list of (magId, coreId) pairs, as stored in matches.json, in directory.
+    """
+    if not exists(directory): makedirs(directory)
+    mag_ids = encode_ids(pair[0] for pair in pairs)
+    core_ids = encode_ids(pair[1] for pair in pairs)
+    for side, keys, values in [('core', core_ids, mag_ids), ('mag', mag_ids, core_ids)]:
+        order = np.argsort(keys, kind = 'stable')
+        unique, starts = np.unique(keys[order], return_index = True)
+        np.save(directory + sep + side + ".keys.npy", unique)
+        np.save(directory + sep + side + ".offsets.npy", np.append(starts, len(keys)).astype(np.int64))
+        np.save(directory + sep + side + ".values.npy", values[order])
+    print(f"Match table of {len(mag_ids)} matches written.")
+
+def build_from_json(matches_path, directory):
+    """Build the match table of a matches.json file."""
+    with open(matches_path) as matches_file:
+        build_match_table(load(matches_file)['matches'], directory)
+
+def read_published(path):
+    """
+    Read the published CORE-MAG mapping (2019-04-core-mag.csv.gz).
+
+    Returns:
+        The (coreIds, magIds) int64 arrays of all its pairs.
+    """
+    import pandas as pd
+    table = pd.read_csv(path, usecols = ['coreid', 'magid'], dtype = str, on_bad_lines = 'skip').dropna()
+    table = table[table['coreid'].str.isdigit() & table['magid'].str.isdigit()]
+    return table['coreid'].astype(np.int64).to_numpy(), table['magid'].astype(np.int64).to_numpy()
+
+class MatchTable:
+    """
+    Read-only access to a match table built by build_match_table.
+
+    Attributes:
+        directory: The directory of the table files.
+        keys: Sorted unique ids of each side ('core', 'mag').
+        offsets: CSR offsets of each side into its values.
+        values: The matched ids of the other side, grouped by the keys.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.keys = {}
+        self.offsets = {}
+        self.values = {}
+        for side in SIDES:
+            self.keys[side] = np.load(directory + sep + side + ".keys.npy", mmap_mode = 'r')
+            self.offsets[side] = np.load(directory + sep + side + ".offsets.npy", mmap_mode = 'r')
+            self.values[side] = np.load(directory + sep + side + ".values.npy", mmap_mode = 'r')
+
+    def __len__(self):
+        return len(self.values['core'])
+
+    def _lookup(self, side, identifier):
+        keys = self.keys[side]
+        key = int(identifier)
+        position = int(np.searchsorted(keys, key))
+        if position == len(keys) or keys[position] != key:
+            return self.values[side][0:0]
+        return self.values[side][self.offsets[side][position]:self.offsets[side][position+1]]
+
+    def mags(self, core_id):
+        """The magIds matched with a coreId, as strings, in the order of matches.json."""
+        return [str(m) for m in self._lookup('core', core_id)]
+
+    def cores(self, mag_id):
+        """The coreIds matched with a magId, as strings, in the order of matches.json."""
+        return [str(c) for c in self._lookup('mag', mag_id)]
+
+    def contains(self, side, ids):
+        """Boolean array telling which of the (integer) ids of a side have at least one match."""
+        keys = self.keys[side]
+        ids = np.asarray(ids, dtype = np.int64)
+        positions = np.minimum(np.searchsorted(keys, ids), max(len(keys) - 1, 0))
+        return keys[positions] == ids if len(keys) else np.zeros(len(ids), dtype = bool)
+
+    def pairs(self):
+        """The (coreIds, magIds) int64 arrays of all matches, sorted by coreId."""
+        return np.repeat(self.keys['core'], np.diff(self.offsets['core'])), np.asarray(self.values['core'])
+
+    def intersect(self, core_ids, mag_ids):
+        """
+        Compare the matches with another set of pairs, e.g. the published mapping returned by read_published.
+
+        Returns:
+            A boolean array telling for each match (in the order of pairs()) whether it is in the other set.
+        """
+        return np.isin(pair_keys(*self.pairs()), pair_keys(core_ids, mag_ids))
+
+    def fan_out(self, side):
+        """Histogram of the number of matches per id of a side: element i is the number of ids with i matches."""
+        return np.bincount(np.diff(self.offsets[side]))
+
+    def statistics(self):
+        """Numbers of matches and matched ids, and fan-out histograms of both sides."""
+        return {'matches': len(self),
+                'core_ids': len(self.keys['core']),
+                'mag_ids': len(self.keys['mag']),
+                'mags_per_core': self.fan_out('core').tolist(),
+                'cores_per_mag': self.fan_out('mag').tolist()}
+
+    def to_parquet(self, path):
+        """Write all matches as a Parquet file with int64 columns coreId and magId."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        core_ids, mag_ids = self.pairs()
+        pq.write_table(pa.table({'coreId': core_ids, 'magId': mag_ids}), path)
+
+if __name__ == "__main__":
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument("-i", "--input")
+    argument_parser.add_argument("-o", "--output")
+    argument_parser.add_argument("--published", default=None)
+
+    args = vars(argument_parser.parse_args())
+
+    print(datetime.now())
+    build_from_json(args["input"], args["output"])
+    table = MatchTable(args["output"])
+    statistics = table.statistics()
+    print(f"Matches: {statistics['matches']}, CORE ids: {statistics['core_ids']}, MAG ids: {statistics['mag_ids']}")
+    print(f"MAG ids per CORE id: {statistics['mags_per_core']}")
+    print(f"CORE ids per MAG id: {statistics['cores_per_mag']}")
+    if args["published"]:
+        found = table.intersect(*read_published(args["published"]))
+        print(f"Matches included in the published mapping: {int(found.sum())}")
+    print(datetime.now())
@@ -0,0 +1,94 @@
+"""
+Splitting of JSON Lines files into similarly sized chunks for the process pools, and streaming of their results.
+
+Uncompressed files are split into byte ranges; a range owns the lines starting in it, so ranges need no alignment
+when they are made. Compressed files (see jsonl_io.py) can not be entered in the middle and are one chunk each. Chunks
+whose results can be merged in any order are handed to the pool largest first, so no big chunk is started last, and
+their results come back as soon as they are done. For merges whose result depends on the order, the chunks are handed
+out in the order of the files instead, so that only the results done ahead of a slower earlier chunk are held back.
+"""
+
+from os.path import getsize, basename
+from jsonl_io import open_jsonl, compression_of
+
+CHUNK_SIZE = 2**26
+
+def split(filepaths, chunk_size = CHUNK_SIZE):
+    """
+    Split files into chunks of about chunk_size bytes, each file being one chunk if chunk_size is None.
+
+    Returns:
+        (filepath, start, end) tuples in the order of the files and offsets, end None for the rest of the file.
+    """
+    chunks = []
+    for filepath in filepaths:
+        size = getsize(filepath)
+        if chunk_size is None or compression_of(filepath) or size <= chunk_size:
+            chunks.append((filepath, 0, None))
+        else:
+            chunks.extend((filepath, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size))
+    return chunks
+
+def chunk_size_of(chunk):
+    """Number of bytes of a chunk (compressed bytes for compressed files)."""
+    filepath, start, end = chunk[:3]
+    return (getsize(filepath) if end is None else end) - start
+
+def chunk_name(chunk):
+    """Name of a chunk for the files written per chunk; the names sort in the order of the chunks in the files."""
+    return f"{basename(chunk[0])}.{chunk[1]:015d}"
+
+def read_chunk(chunk, mode = "r", threads = 1):
+    """Yield the lines starting in a chunk, as str ("r") or bytes ("rb")."""
+    for offset, line in read_chunk_offsets(chunk, threads):
+        yield line if mode == "rb" else line.decode("utf-8")
+
+def read_chunk_offsets(chunk, threads = 1):
+    """Yield (byte offset, line as bytes) of the lines starting in a chunk, offsets of compressed files in their decompressed content."""
+    filepath, start, end = chunk[:3]
+    if end is None and start == 0:
+        offset = 0
+        with open_jsonl(filepath, "rb", threads = threads) as input_file:
+            for line in input_file:
+                yield offset, line
+                offset += len(line)
+        return
+    with open(filepath, "rb") as input_file:
+        if start > 0:
+            input_file.seek(start - 1)
+            input_file.readline()
+        offset = input_file.tell()
+        while end is None or offset < end:
+            line = input_file.readline()
+            if not line:
+                break
+            yield offset, line
+            offset += len(line)
+
+def _call(position_function_task):
+    position, function, task = position_function_task
+    return position, function(task)
+
+def imap_largest_first(pool, function, tasks, sizes):
+    """
+    Apply function to all tasks in the pool, the tasks with the largest sizes first.
+
+    Returns:
+        An iterator of (position of the task, result) in the order the results are done.
+    """
+    order = sorted(range(len(tasks)), key = lambda position: (-sizes[position], position))
+    return pool.imap_unordered(_call, [(position, function, tasks[position]) for position in order])
+
+def imap_in_order(pool, function, tasks):
+    """
+    Apply function to all tasks in the pool, handing them out in their order.
+
+    Returns:
+        An iterator of the results in the order of the tasks.
+    """
+    return pool.imap(function, tasks)
+
+def unordered(results):
+    """Yield the results of (position, result) pairs in the order they are done."""
+    for position, result in results:
+        yield result
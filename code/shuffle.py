@@ -0,0 +1,118 @@
+"""
+External hash partitioning of records keyed by strings (author names), for aggregations that do not fit in memory.
+
+Workers spill their partial results to one JSON Lines file per partition and chunk in the spill directory. The
+partition of a key is its stable 64 bit hash (see core_index.key_hash) modulo the number of partitions, so all records
+of a key end up in the same partition whichever process wrote them, and each partition can be reduced on its own.
+Results are written as JSON Lines or Parquet files per partition (split into shards of a maximum number of records
+if needed) and read back as a stream of records.
+"""
+
+from glob import glob
+from itertools import islice
+from os.path import exists, sep
+from os import makedirs
+from shutil import rmtree
+from core_index import key_hash
+from json_codec import loads, dumps_bytes
+
+FORMATS = ['jsonl', 'parquet']
+
+def partition_of(key, partitions):
+    """The partition of a key."""
+    return key_hash(key) % partitions
+
+def partition_directory(spill_directory, partition):
+    return spill_directory + sep + f"{partition:05d}"
+
+def spill(records, spill_directory, name, partitions):
+    """
+    Write (key, value) records to the spill files of their partitions.
+
+    Args:
+        records: Iterable of (key, value) pairs, JSON-serialisable.
+        name: Name of the spill files, unique per writer (e.g. the batch file and offset of a chunk).
+    """
+    files = {}
+    try:
+        for key, value in records:
+            partition = partition_of(key, partitions)
+            if partition not in files:
+                directory = partition_directory(spill_directory, partition)
+                if not exists(directory): makedirs(directory, exist_ok = True)
+                files[partition] = open(directory + sep + name + ".jsonl", "wb")
+            files[partition].write(dumps_bytes([key, value]) + b"\n")
+    finally:
+        for spill_file in files.values():
+            spill_file.close()
+
+def read_spill(spill_directory, partition):
+    """Yield the (key, value) records spilled to a partition, in the order of the spill file names."""
+    for filepath in sorted(glob(partition_directory(spill_directory, partition) + sep + "*.jsonl")):
+        with open(filepath, "rb") as spill_file:
+            for line in spill_file:
+                key, value = loads(line)
+                yield key, value
+
+def remove_spill(spill_directory):
+    if exists(spill_directory):
+        rmtree(spill_directory)
+
+def output_filepath(output_directory, partition, output_format):
+    return output_directory + sep + f"part-{partition:05d}.{output_format}"
+
+def write_records(filepath, records, columns, output_format = 'jsonl'):
+    """
+    Write records (tuples in the order of columns) as JSON Lines objects or as a Parquet table.
+
+    Returns:
+        The number of records written.
+    """
+    if output_format == 'jsonl':
+        count = 0
+        with open(filepath, "wb") as output_file:
+            for record in records:
+                output_file.write(dumps_bytes(dict(zip(columns, record))) + b"\n")
+                count += 1
+        return count
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        records = list(records)
+        pq.write_table(pa.table({column: [record[i] for record in records] for i, column in enumerate(columns)}), filepath)
+        return len(records)
+    raise ValueError("Unknown output format " + str(output_format))
+
+def write_shards(output_directory, partition, records, columns, output_format = 'jsonl', shard_size = 10000):
+    """
+    Write the records of a partition to files of at most shard_size records each (see write_records).
+
+    Returns:
+        The number of records written.
+    """
+    records = iter(records)
+    count = 0
+    shard = 0
+    while True:
+        shard_records = list(islice(records, shard_size))
+        if not shard_records and shard > 0:
+            return count
+        filepath = output_directory + sep + f"part-{partition:05d}-{shard:05d}.{output_format}"
+        count += write_records(filepath, shard_records, columns, output_format)
+        shard += 1
+        if len(shard_records) < shard_size:
+            return count
+
+def read_records(output_directory, columns = None):
+    """Yield the records of all partition files in a directory as dicts, one file at a time."""
+    for filepath in sorted(glob(output_directory + sep + "part-*")):
+        if filepath.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(filepath)
+            for batch in parquet_file.iter_batches(columns = columns):
+                yield from batch.to_pylist()
+        else:
+            with open(filepath, "rb") as input_file:
+                for line in input_file:
+                    record = loads(line)
+                    yield record if columns is None else {column: record[column] for column in columns}
@@ -0,0 +1,105 @@
+"""
+Blocking index over CORE titles to find candidates for fuzzy title matches with OAG entries.
+
+Titles are normalised (lowercase, runs of anything but letters and digits replaced by a space). Entries with the same
+normalised title are found by hashing, near duplicates by MinHash signatures over character n-grams that are split
+into bands (locality sensitive hashing). A query only looks at the entries sharing a band with it, instead of
+comparing it with all titles.
+"""
+
+from re import compile as re_compile
+from zlib import crc32
+import numpy as np
+import comparison
+
+NON_ALPHANUMERIC = re_compile(r'[^0-9a-z]+')
+
+def normalise_title(title):
+    """Return the normalised title, None for missing or empty titles."""
+    if not isinstance(title, str):
+        return None
+    title = NON_ALPHANUMERIC.sub(' ', title.lower()).strip()
+    return title if title else None
+
+class TitleIndex:
+    """
+    Index from titles to entries, returning small candidate sets for fuzzy title lookups.
+
+    Attributes:
+        entries: The indexed entries, e.g. (coreId, title, authors, doi, year) tuples.
+        titles: The title of each indexed entry.
+        ngram: Length of the character n-grams of a signature.
+        bands: Number of bands of the signature. More bands find candidates with less similar titles.
+        rows: Number of MinHash values per band. More rows make candidates more similar.
+        max_bucket: Bands shared by more entries than this (very common titles) are not used for candidates.
+    """
+    def __init__(self, ngram = 3, bands = 8, rows = 4, max_bucket = 1000, seed = 1):
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = rows
+        self.max_bucket = max_bucket
+        random = np.random.default_rng(seed)
+        self.a = random.integers(1, 2**63, size = bands*rows, dtype = np.uint64) | np.uint64(1)
+        self.b = random.integers(0, 2**63, size = bands*rows, dtype = np.uint64)
+        self.entries = []
+        self.titles = []
+        self.exact = {}
+        self.buckets = [{} for band in range(bands)]
+
+    def signature(self, normalised):
+        """MinHash signature of the n-grams of a normalised title (multiply-shift hashing of their CRC32)."""
+        grams = {normalised[i:i+self.ngram] for i in range(max(1, len(normalised)-self.ngram+1))}
+        hashes = np.fromiter((crc32(gram.encode()) for gram in grams), dtype = np.uint64, count = len(grams))
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)).min(axis = 1)
+
+    def band_keys(self, normalised):
+        signature = self.signature(normalised)
+        return [signature[band*self.rows:(band+1)*self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, title, entry):
+        """Add an entry under its title. Entries without title are kept but never returned as candidates."""
+        index = len(self.entries)
+        self.entries.append(entry)
+        self.titles.append(title)
+        normalised = normalise_title(title)
+        if normalised is None:
+            return
+        if normalised in self.exact:
+            self.exact[normalised].append(index)
+        else:
+            self.exact[normalised] = [index]
+        for band, key in enumerate(self.band_keys(normalised)):
+            bucket = self.buckets[band].get(key)
+            if bucket is None:
+                self.buckets[band][key] = [index]
+            else:
+                bucket.append(index)
+
+    def add_many(self, titles_and_entries):
+        for title, entry in titles_and_entries:
+            self.add(title, entry)
+
+    def candidates(self, title):
+        """
+        Return the indices of all entries with the same normalised title or sharing a band with the title.
+        """
+        normalised = normalise_title(title)
+        if normalised is None:
+            return set()
+        result = set(self.exact.get(normalised, []))
+        for band, key in enumerate(self.band_keys(normalised)):
+            bucket = self.buckets[band].get(key)
+            if bucket is not None and len(bucket) <= self.max_bucket:
+                result.update(bucket)
+        return result
+
+    def matches(self, title, short_length = 20, max_gap = 30):
+        """
+        Return the entries whose title is equal to the given title or similar by comparison.compare,
+        in the order they were added.
+        """
+        result = []
+        for index in sorted(self.candidates(title)):
+            if self.titles[index] == title or comparison.compare(title, self.titles[index], short_length, max_gap):
+                result.append(self.entries[index])
+        return result
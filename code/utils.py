@@ -1,14 +1,29 @@
 from math import ceil
-import fasttext
-import requests
 import re
-from Levenshtein import distance as levenshtein_distance
 from time import sleep
+import comparison
+
+# fasttext, requests and Levenshtein (in comparison) are imported on first use, so processes that only count or reduce by metadata start quickly.
+MODEL_PATH = 'models/lid.176.ftz'
+_models = {}
+
+def load_model(path=MODEL_PATH):
+    """
+    Return the fasttext model stored at path. Each model is loaded once per process and kept in a registry.
+    Can be passed as initializer to a process pool, so every worker loads the model once at startup. If the
+    model is loaded in the parent before the pool is created, forked workers share it copy-on-write instead.
+    """
+    if path not in _models:
+        import fasttext
+        fasttext.FastText.eprint = lambda x: None
+        _models[path] = fasttext.load_model(path)
+    return _models[path]
 
 def doi2title(doi):
     """
     Return a title extracted from metadata for a given DOI.
     """
+    import requests
     while not (doi[-1].isdigit() or doi[-1].isalpha()):
         doi = doi[:-1]
     url = f"https://api.crossref.org/works/{doi}"
@@ -47,29 +62,51 @@ def doi2title(doi):
         return str(r.status_code)
         
 def levenshtein_compare(t1, t2):
-    if not t1 or not t2:
-        return False
-    return (levenshtein_distance(t1.lower(), t2.lower()) < abs(len(t1)-len(t2)) + 0.1*min(len(t1),len(t2)) and not ((len(t1) < 6 or len(t2) < 6) and abs(len(t1)-len(t2)) > 6))
+    """
+    Return True if two titles are similar by edit distance, see comparison.compare.
+    """
+    return comparison.compare(t1, t2)
+
+def _clean_lines(text):
+    return text.replace('\n',' ').replace('\uffff','')
+
+def _parts(text, slices, prepare, window=None):
+    """
+    Prepare a text and cut it into at most 'slices' parts of equal length, None if it is shorter than 'slices'.
+    With 'window', only the first 'window' characters of each part of the raw text are taken and prepared,
+    so long texts are never prepared as a whole. This approximates the parts of the prepared text.
+    """
+    if not window:
+        text = prepare(text)
+    if(len(text) < slices):
+        return None
+    n = ceil(len(text)/slices)
+    if window:
+        return [prepare(text[i:i+min(n, window)]) for i in range(0, min(len(text), n*slices), n)]
+    return [text[i:i+n] for i in range(0, min(len(text), n*slices), n)]
 
-fasttext.FastText.eprint = lambda x: None
+def _decided(check, slices, min_true, max_false):
+    """Whether the verdict on a text can not change anymore with the slices left to predict."""
+    left = slices - len(check)
+    if check.count(False) > max_false or check.count(True) + left < min_true:
+        return True
+    return check.count(True) >= min_true and check.count(False) + left <= max_false
 
-def fast_text_lang(text, tar_lang, slices, conf, fmodel=None):
+def fast_text_lang(text, tar_lang, slices, conf, fmodel=None, early_exit=False, window=None):
     """
     Splits a given text in a number of parts given in 'slices' parameter. 
     Then performs a language detection using fasttext package, either by a given model fmodel or a default model.
     Checks whether each part is the language described via language code in 'tar_lang' parameter ('en' for english e.g.).
     Return True if at least one slice was recognized as the tar_lang, and if a number of slices smaller or equal to 'conf'
     was recognized as any other language.
+    With 'early_exit', prediction stops as soon as the verdict is decided. With 'window', only that many characters
+    at the start of each slice are classified, instead of preparing the whole text first.
     """
     if not fmodel:
-        path_to_pretrained_model = 'models/lid.176.ftz'
-        fmodel = fasttext.load_model(path_to_pretrained_model)
-        #print("No model passed")
-    text = text.replace('\n',' ').replace('\uffff','')
-    if(len(text) < slices):
+        fmodel = load_model()
+    parts = _parts(text, slices, _clean_lines, window)
+    if parts is None:
         return False
-    n = ceil(len(text)/slices)
-    parts = [text[i:i+n] for i in range(0, len(text), n)]
     test = []
     result = []
     for i in range(slices):
@@ -82,6 +119,8 @@ def fast_text_lang(text, tar_lang, slices, conf, fmodel=None):
             result.append(None)
             if len(parts) <= i:
                 break
+        if early_exit and _decided(test, slices, 1, conf):
+            break
     if test.count(False) > conf or test.count(True) == 0:
         print(test)
         print(result)
@@ -91,18 +130,17 @@ def fast_text_lang(text, tar_lang, slices, conf, fmodel=None):
         print(result)
         return True
     
-def fast_text_lang_words(text, tar_lang, slices, conf, fmodel=None):
+def fast_text_lang_words(text, tar_lang, slices, conf, fmodel=None, early_exit=False):
     """
     Splits a given text in a number of parts given in 'slices' parameter. 
     Then performs a language detection using fasttext package, either by a given model fmodel or a default model.
     Checks whether each part is the language described via language code in 'tar_lang' parameter ('en' for english e.g.).
     Return True if at least one slice was recognized as the tar_lang, and if a number of slices smaller or equal to 'conf'
     was recognized as any other language.
+    With 'early_exit', prediction stops as soon as the verdict is decided.
     """
     if not fmodel:
-        path_to_pretrained_model = 'models/lid.176.ftz'
-        fmodel = fasttext.load_model(path_to_pretrained_model)
-        #print("No model passed")
+        fmodel = load_model()
     text = text.replace('\n',' ').replace('\uffff','').split()
     if(len(text) < slices):
         return False
@@ -116,6 +154,8 @@ def fast_text_lang_words(text, tar_lang, slices, conf, fmodel=None):
             test.append(None)
             if len(parts) <= i:
                 break
+        if early_exit and _decided(test, slices, 1, conf):
+            break
     if test.count(False) > conf or test.count(True) == 0:
         #print(test)
         return False
@@ -123,38 +163,67 @@ def fast_text_lang_words(text, tar_lang, slices, conf, fmodel=None):
         #print(test)
         return True
     
+_character_classes = None
+
+def _classes():
+    """
+    Lookup table from code point to class (0 alpha, 1 digit, 2 space, 3 other), built on first use.
+    """
+    global _character_classes
+    if _character_classes is None:
+        import numpy as np
+        classes = np.full(0x110000, 3, dtype=np.uint8)
+        for c in range(0x110000):
+            char = chr(c)
+            if char.isalpha():
+                classes[c] = 0
+            elif char.isdigit():
+                classes[c] = 1
+            elif char.isspace():
+                classes[c] = 2
+        _character_classes = classes
+    return _character_classes
+
+def _code_points(text):
+    import numpy as np
+    if text.isascii():
+        return np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
 def textparts(text):
-    alpha = 0
-    digit = 0
-    space = 0
-    other = 0
-    for c in text:
-        if c.isalpha():
-            alpha += 1
-        elif c.isdigit():
-            digit += 1
-        elif c.isspace():
-            space += 1
-        else:
-            other += 1
-    return (alpha,digit,space,other)
+    """
+    Count the alphabetic, digit, whitespace and other characters of a text, as (alpha, digit, space, other).
+    """
+    import numpy as np
+    counts = np.bincount(_classes()[_code_points(text)], minlength=4)
+    return (int(counts[0]),int(counts[1]),int(counts[2]),int(counts[3]))
+
+def textparts_batch(texts):
+    """
+    Batch version of textparts. Returns an array with one row (alpha, digit, space, other) per text.
+    """
+    import numpy as np
+    classes = _classes()
+    counts = np.zeros((len(texts), 4), dtype=np.int64)
+    for i, text in enumerate(texts):
+        counts[i] = np.bincount(classes[_code_points(text)], minlength=4)
+    return counts
 
-def ft_lang_detect(text, tar_lang, slices, max_false=1, min_true=1, fmodel=None):
+def ft_lang_detect(text, tar_lang, slices, max_false=1, min_true=1, fmodel=None, early_exit=False, window=None):
     """
     Splits a given text in a number of parts given in 'slices' parameter. 
     Then performs a language detection using fasttext package, either by a given model fmodel or a default model.
     Checks whether each part is the language described via language code in 'tar_lang' parameter ('en' for english e.g.).
     Return True if at least one slice was recognized as the tar_lang, and if a number of slices smaller or equal to 'conf'
     was recognized as any other language.
+    With 'early_exit', prediction stops as soon as the verdict is decided. With 'window', only that many characters
+    at the start of each slice are classified, instead of preparing the whole text first.
     """
     if not fmodel:
-        path_to_pretrained_model = 'models/lid.176.ftz'
-        fmodel = fasttext.load_model(path_to_pretrained_model)
-    text = text.replace('\n',' ').replace('\uffff','')
-    if(len(text) < slices):
+        fmodel = load_model()
+    parts = _parts(text, slices, _clean_lines, window)
+    if parts is None:
         return False
-    n = ceil(len(text)/slices)
-    parts = [text[i:i+n] for i in range(0, len(text), n)]
     test = []
     result = []
     for i in range(slices):
@@ -170,6 +239,8 @@ def ft_lang_detect(text, tar_lang, slices, max_false=1, min_true=1, fmodel=None)
             result.append(None)
             if len(parts) <= i:
                 break
+        if early_exit and _decided(test, slices, min_true, max_false):
+            break
     if test.count(False) > max_false or test.count(True) < min_true:
         return False
     else:
@@ -177,32 +248,67 @@ def ft_lang_detect(text, tar_lang, slices, max_false=1, min_true=1, fmodel=None)
 
 
 
+_preprocessed = {}
+_preprocessed_size = 1
+
+# The only characters outside of ASCII that lowercase to a kept character are U+0130 (to 'i' and a combining dot)
+# and the Kelvin sign U+212A (to 'k'). After mapping those, all other non-ASCII characters can be dropped right away,
+# and lowercasing and filtering is a single bytes.translate.
+_ALLOWED = b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_ !.,;:?'
+_LOWER = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', b'abcdefghijklmnopqrstuvwxyz')
+_NOT_ALLOWED = bytes(c for c in range(256) if c not in _ALLOWED)
+_TAGS = re.compile(b'<[^>]*>')
+_SPACES = re.compile(b'  +')
+
+def preprocessor_cache(size):
+    """
+    Set the number of texts whose preprocessed version is kept, e.g. to the number of entries checked as one batch.
+    """
+    global _preprocessed_size
+    _preprocessed_size = max(1, size)
+    while len(_preprocessed) > _preprocessed_size:
+        del _preprocessed[next(iter(_preprocessed))]
+
 def preprocessor(text):
+    """
+    Strips tags, lowercases and reduces a text to letters, spaces and basic punctuation. Runs of spaces are collapsed.
+    The results for the last text objects passed are kept (see preprocessor_cache), so a condition calling
+    preprocessor and text_readable on the same fullText of an entry only preprocesses it once.
+    """
     if isinstance((text), (str)):
-        text = re.sub('<[^>]*>', '', text)
-        text = re.sub('[^a-zA-Z_ !.,;:?]', '', text.lower())
-        text = re.sub('\s+', ' ', text)
+        cached = _preprocessed.get(id(text))
+        if cached and cached[0] is text:
+            return cached[1]
+        original = text
+        text = text.replace('\u0130', 'i').replace('\u212a', 'k').encode('ascii', 'ignore')
+        if b'<' in text:
+            text = _TAGS.sub(b'', text)
+        text = text.translate(_LOWER, _NOT_ALLOWED)
+        if b'  ' in text:
+            text = _SPACES.sub(b' ', text)
+        text = text.decode('ascii')
+        _preprocessed[id(original)] = (original, text)
+        if len(_preprocessed) > _preprocessed_size:
+            del _preprocessed[next(iter(_preprocessed))]
         return text
     else:
         pass
 
-def text_readable(text, tar_lang, slices=1, min_true=1, max_false=0, fmodel=None, print_command=False):
+def text_readable(text, tar_lang, slices=1, min_true=1, max_false=0, fmodel=None, print_command=False, early_exit=False, window=None):
     """
     Splits a given text in a number of parts given in 'slices' parameter. 
     Then performs a language detection using fasttext package, either by a given model fmodel or a default model.
     Checks whether each part is the language described via language code in 'tar_lang' parameter ('en' for english e.g.).
     Return True if at least one slice was recognized as the tar_lang, and if a number of slices smaller or equal to 'conf'
     was recognized as any other language.
+    With 'early_exit', prediction stops as soon as the verdict is decided. With 'window', only that many characters
+    at the start of each slice are classified, instead of preparing the whole text first.
     """
     if not fmodel:
-        path_to_pretrained_model = 'models/lid.176.ftz'
-        fmodel = fasttext.load_model(path_to_pretrained_model)
-        #print("No model passed")
-    text = preprocessor(text)
-    if(len(text) < slices):
+        fmodel = load_model()
+    parts = _parts(text, slices, preprocessor, window)
+    if parts is None:
         return False
-    n = ceil(len(text)/slices)
-    parts = [text[i:i+n] for i in range(0, len(text), n)]
     predictions = []
     check = []
     for i in range(slices):
@@ -217,6 +323,8 @@ def text_readable(text, tar_lang, slices=1, min_true=1, max_false=0, fmodel=None
             check.append(None)
             if len(parts) <= i:
                 break
+        if early_exit and _decided(check, slices, min_true, max_false):
+            break
     if print_command:
         print(check)
         print(predictions)
@@ -225,6 +333,51 @@ def text_readable(text, tar_lang, slices=1, min_true=1, max_false=0, fmodel=None
     else:
         return True
     
+def _slice_verdicts(parts_of_texts, tar_lang, min_true, max_false, fmodel, threshold, below_threshold):
+    """
+    Predict the parts of all texts (as returned by _parts) in one call of the model and decide on each text like the single-text functions do.
+    Slices predicted with a probability not above threshold count as below_threshold.
+    """
+    if not fmodel:
+        fmodel = load_model()
+    label = f"__label__{tar_lang}"
+    owners = []
+    parts = []
+    for k, text_parts in enumerate(parts_of_texts):
+        for part in text_parts or []:
+            owners.append(k)
+            parts.append(part)
+    checks = [[] for text_parts in parts_of_texts]
+    scores = [[] for text_parts in parts_of_texts]
+    if parts:
+        labels, probabilities = fmodel.predict(parts)
+        for k, l, p in zip(owners, labels, probabilities):
+            scores[k].append((l[0], float(p[0])))
+            if p[0] > threshold:
+                checks[k].append(l[0] == label)
+            else:
+                checks[k].append(below_threshold)
+    verdicts = [text_parts is not None and not (check.count(False) > max_false or check.count(True) < min_true)
+                for text_parts, check in zip(parts_of_texts, checks)]
+    return verdicts, scores
+
+def text_readable_batch(texts, tar_lang, slices=1, min_true=1, max_false=0, fmodel=None, print_command=False, early_exit=False, window=None):
+    """
+    Batch version of text_readable, with the same parameters in the same order. All slices of all texts are passed to
+    fasttext in a single predict call. Returns a list with the verdict of text_readable for each text and a list with
+    the (label, probability) predicted for each slice of each text. 'print_command' and 'early_exit' have no effect,
+    all slices are predicted in one call and nothing is printed.
+    """
+    return _slice_verdicts([_parts(text, slices, preprocessor, window) for text in texts], tar_lang, min_true, max_false, fmodel, 0.6, False)
+
+def ft_lang_detect_batch(texts, tar_lang, slices, max_false=1, min_true=1, fmodel=None, early_exit=False, window=None):
+    """
+    Batch version of ft_lang_detect. All slices of all texts are passed to fasttext in a single predict call.
+    Returns a list with the verdict of ft_lang_detect for each text and a list with the (label, probability)
+    predicted for each slice of each text. 'early_exit' has no effect, all slices are predicted in one call.
+    """
+    return _slice_verdicts([_parts(text, slices, _clean_lines, window) for text in texts], tar_lang, min_true, max_false, fmodel, 0.5, None)
+
 def author_dupes(authors):
     found = []
     for i in authors:
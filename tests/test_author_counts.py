@@ -0,0 +1,45 @@
+import json
+import random
+import pytest
+import shuffle
+from corpus_builder import CorpusBuilderJSON
+from test_scheduler import make_batches
+
+def counts_reference(lines, conditions = None):
+    """In how many entries each author appears."""
+    counts = {}
+    for path_lines in lines.values():
+        for line in path_lines:
+            entry = json.loads(line)
+            if conditions and not all(eval(condition, {'entry': entry}) for condition in conditions):
+                continue
+            for author in set(entry['authors']):
+                counts[author] = counts.get(author, 0) + 1
+    return counts
+
+@pytest.mark.parametrize('chunk_size, partitions, output_format', [(97, 1, 'jsonl'), (1000, 7, 'jsonl'), (None, 64, 'jsonl'), (97, 3, 'parquet')])
+def test_counts_do_not_depend_on_the_chunks(tmp_path, chunk_size, partitions, output_format):
+    lines = make_batches(tmp_path / "batches")
+    builder = CorpusBuilderJSON(str(tmp_path / "batches"), pool_size = 3, chunk_size = chunk_size)
+    builder.count_authors_in_batches(str(tmp_path / "counts"), partitions = partitions, output_format = output_format)
+    records = list(shuffle.read_records(str(tmp_path / "counts")))
+    assert len(records) == len({record['author'] for record in records})
+    assert {record['author']: record['count'] for record in records} == counts_reference(lines)
+    assert not (tmp_path / "counts" / "spill").exists()
+    conditions = ["len(entry['authors']) > 1"]
+    builder.count_authors_in_batches(str(tmp_path / "counts"), conditions, partitions, output_format)
+    assert {record['author']: record['count'] for record in shuffle.read_records(str(tmp_path / "counts"))} == counts_reference(lines, conditions)
+
+def test_same_counts_as_authors_json_without_repeated_authors(tmp_path):
+    random.seed(21)
+    (tmp_path / "batches").mkdir()
+    names = [f"author {i}" for i in range(40)]
+    for number in range(3):
+        with open(tmp_path / "batches" / f"{number:02d}", "w") as batch:
+            for i in range(200):
+                batch.write(json.dumps({'coreId': f'{number}-{i}', 'authors': random.sample(names, random.randint(0, 5))}) + "\n")
+    builder = CorpusBuilderJSON(str(tmp_path / "batches"), pool_size = 2, chunk_size = 1000)
+    builder.dict_authors_in_batches(str(tmp_path / "authors.json"))
+    builder.count_authors_in_batches(str(tmp_path / "counts"), partitions = 5)
+    with open(tmp_path / "authors.json") as authors_file:
+        assert {record['author']: record['count'] for record in shuffle.read_records(str(tmp_path / "counts"))} == json.load(authors_file)
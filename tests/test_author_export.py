@@ -0,0 +1,75 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import pytest
+import shuffle
+from author_index import author_key
+from corpus_builder import CorpusBuilderJSON
+from test_author_index import make_corpus
+
+def export_reference(entries, texts = False, paired_only = False):
+    """The monographs and multi-author documents of each author, in corpus order."""
+    authors = {}
+    for entry in entries:
+        seen = set()
+        for author in entry['authors']:
+            author_id, name = author_key(author)
+            if author_id in seen:
+                continue
+            seen.add(author_id)
+            record = authors.setdefault(author_id, {'author': author_id, 'name': name, 'mono': [], 'multi': [], 'mono_texts': [], 'multi_texts': []})
+            kind = 'mono' if len(entry['authors']) == 1 else 'multi'
+            record[kind].append(str(entry['core_id']))
+            record[kind + '_texts'].append(entry['full_text'])
+    for record in authors.values():
+        if not texts:
+            del record['mono_texts'], record['multi_texts']
+    return {author_id: record for author_id, record in authors.items() if not paired_only or (record['mono'] and record['multi'])}
+
+@pytest.fixture
+def corpus(tmp_path):
+    entries = make_corpus(tmp_path / "corpus")
+    for path in sorted((tmp_path / "corpus").iterdir()):
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        with open(path, "w") as batch:
+            for entry in lines:
+                entry['full_text'] = f"text of {entry['core_id']}"
+                batch.write(json.dumps(entry) + "\n")
+    for entry in entries:
+        entry['full_text'] = f"text of {entry['core_id']}"
+    return entries
+
+@pytest.mark.parametrize('chunk_size, partitions, output_format, texts, paired_only', [
+    (None, 1, 'jsonl', False, False), (2000, 7, 'jsonl', True, False), (500, 3, 'jsonl', True, True), (2000, 5, 'parquet', True, False)])
+def test_export_matches_grouping(tmp_path, corpus, chunk_size, partitions, output_format, texts, paired_only):
+    builder = CorpusBuilderJSON(str(tmp_path / "corpus"), pool_size = 3, chunk_size = chunk_size)
+    builder.export_author_documents(str(tmp_path / "export"), None, partitions, output_format, 4, texts, paired_only)
+    records = list(shuffle.read_records(str(tmp_path / "export")))
+    assert {record['author']: record for record in records} == export_reference(corpus, texts, paired_only)
+    assert len(records) == len({record['author'] for record in records})
+    assert not (tmp_path / "export" / "spill").exists()
+    filenames = os.listdir(tmp_path / "export")
+    assert all(re.fullmatch(r"part-\d{5}-\d{5}\." + output_format, filename) for filename in filenames)
+    assert {filename[:10] for filename in filenames} == {f"part-{partition:05d}" for partition in range(partitions)}
+
+def test_shards_and_conditions(tmp_path, corpus):
+    builder = CorpusBuilderJSON(str(tmp_path / "corpus"), pool_size = 2, chunk_size = 1000)
+    builder.export_author_documents(str(tmp_path / "export"), ["entry['core_id'] < 1000"], 2, 'jsonl', 3)
+    expected = export_reference([entry for entry in corpus if entry['core_id'] < 1000])
+    assert {record['author']: record for record in shuffle.read_records(str(tmp_path / "export"))} == expected
+    sizes = {}
+    for path in sorted((tmp_path / "export").iterdir()):
+        sizes.setdefault(path.name[:10], []).append(len(path.read_text().splitlines()))
+    assert sorted(sizes) == ['part-00000', 'part-00001']
+    for partition_sizes in sizes.values():
+        assert all(size == 3 for size in partition_sizes[:-1]) and 0 < partition_sizes[-1] <= 3
+
+def test_command_line_flags(tmp_path, corpus):
+    code = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code")
+    result = subprocess.run([sys.executable, os.path.join(code, "corpus_builder.py"), "-i", str(tmp_path / "corpus"), "-o", str(tmp_path / "export"),
+                             "--mode", "author_export", "--size", "2", "--partitions", "4", "--texts", "--paired_only"],
+                            capture_output = True, text = True, cwd = tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert {record['author']: record for record in shuffle.read_records(str(tmp_path / "export"))} == export_reference(corpus, True, True)
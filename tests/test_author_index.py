@@ -0,0 +1,91 @@
+import json
+import random
+import pytest
+from author_index import AuthorIndex, build_author_index, author_key
+
+def make_corpus(directory):
+    """Merged corpus files, with authors without MAG id, authors listed twice and documents without authors."""
+    random.seed(22)
+    directory.mkdir()
+    authors = [{'id': 1000 + i, 'name': f'author {i}'} for i in range(30)] + [{'id': None, 'name': f'name {i}'} for i in range(5)]
+    entries = []
+    for number in range(3):
+        with open(directory / f"{number:02d}", "w") as batch:
+            for i in range(150):
+                listed = random.sample(authors, random.choice([0, 1, 1, 1, 2, 3, 5]))
+                if listed and random.random() < 0.1:
+                    listed.append(listed[0])
+                entry = {'core_id': number * 1000 + i, 'authors': listed}
+                entries.append(entry)
+                batch.write(json.dumps(entry) + "\n")
+    return entries
+
+@pytest.fixture(scope = 'module')
+def index(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("author_index")
+    entries = make_corpus(directory / "corpus")
+    build_author_index(sorted(str(path) for path in (directory / "corpus").iterdir()), str(directory / "index"), pool_size = 2, chunk_size = 2000)
+    return entries, AuthorIndex(str(directory / "index"))
+
+def documents_reference(entries):
+    """The (core_id, first position) of the documents of each author, in corpus order."""
+    documents = {}
+    for entry in entries:
+        seen = set()
+        for position, author in enumerate(entry['authors'], 1):
+            author_id = author_key(author)[0]
+            if author_id not in seen:
+                seen.add(author_id)
+                documents.setdefault(author_id, []).append((str(entry['core_id']), position, len(entry['authors'])))
+    return documents
+
+def test_lookups(index):
+    entries, author_index = index
+    documents = documents_reference(entries)
+    assert author_index.documents == len(entries)
+    assert author_index.authors == len(documents)
+    for entry in entries:
+        assert author_index.authors_of(entry['core_id']) == [author_key(author)[0] for author in entry['authors']]
+    for author_id, author_documents in documents.items():
+        assert author_index.documents_of(author_id) == [(core_id, position) for core_id, position, _ in author_documents]
+    assert author_index.authors_of('unknown') == [] and author_index.documents_of('unknown') == []
+    assert author_index.author_name(author_index.author_number('1003')) == 'author 3'
+    assert author_index.author_name(author_index.author_number('name 2')) == 'name 2'
+
+def test_statistics(index):
+    entries, author_index = index
+    documents = documents_reference(entries)
+    mono = {author_id: sum(length == 1 for _, _, length in docs) for author_id, docs in documents.items()}
+    multi = {author_id: sum(length > 1 for _, _, length in docs) for author_id, docs in documents.items()}
+    mono_counts, multi_counts = author_index.counts()
+    assert {author_index.author_id(author): int(count) for author, count in enumerate(mono_counts)} == mono
+    assert {author_index.author_id(author): int(count) for author, count in enumerate(multi_counts)} == multi
+    histogram = [0] * 8
+    for author_id, docs in documents.items():
+        for _, position, length in docs:
+            if length > 1 and mono[author_id] > 0:
+                histogram[position] += 1
+    assert author_index.positions_histogram().tolist() == histogram[:len(author_index.positions_histogram())]
+    assert sum(histogram) == author_index.positions_histogram().sum()
+    keys = [[author_key(author)[0] for author in entry['authors']] for entry in entries]
+    assert author_index.categories() == {
+        'Mono_only': sum(len(ids) == 1 and multi[ids[0]] == 0 for ids in keys),
+        'Mono_plus': sum(len(ids) == 1 and multi[ids[0]] > 0 for ids in keys),
+        'Multi_plus': sum(len(ids) > 1 and any(mono[i] > 0 for i in ids) for ids in keys),
+        'Multi_only': sum(len(ids) > 1 and not any(mono[i] > 0 for i in ids) for ids in keys),
+        'No_info': sum(len(ids) == 0 for ids in keys)}
+    table = author_index.author_table(positions = True)
+    assert sorted(str(i) for i in table.index) == sorted(author_id for author_id in mono if mono[author_id] > 0)
+    for author_id, row in table.iterrows():
+        positions = [position for _, position, length in documents[str(author_id)] if length > 1]
+        assert (row['mono_docs'], row['multi_docs'], row['positions']) == (mono[str(author_id)], multi[str(author_id)], positions)
+        assert row['avg_position'] == (round(sum(positions) / len(positions), 1) if positions else 0)
+
+def test_entries_without_id(tmp_path):
+    (tmp_path / "corpus").mkdir()
+    (tmp_path / "corpus" / "00").write_text(json.dumps({'core_id': 1, 'authors': []}) + "\n" + json.dumps({'authors': []}) + "\n")
+    with pytest.raises(ValueError):
+        build_author_index([str(tmp_path / "corpus" / "00")], str(tmp_path / "index"), pool_size = 1)
+    (tmp_path / "corpus" / "00").write_text(json.dumps({'coreId': '7', 'authors': ['a', 'b']}) + "\n")
+    build_author_index([str(tmp_path / "corpus" / "00")], str(tmp_path / "index"), pool_size = 1)
+    assert AuthorIndex(str(tmp_path / "index")).authors_of('7') == ['a', 'b']
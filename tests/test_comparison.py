@@ -0,0 +1,40 @@
+import random
+import pytest
+from Levenshtein import distance
+import comparison
+
+def compare_reference(t1, t2, short_length = 6, max_gap = 6):
+    """The unbounded comparison of utils.levenshtein_compare and the matching notebooks."""
+    if not t1 or not t2:
+        return False
+    return (distance(t1.lower(), t2.lower()) < abs(len(t1)-len(t2)) + 0.1*min(len(t1),len(t2))
+            and not ((len(t1) < short_length or len(t2) < short_length) and abs(len(t1)-len(t2)) > max_gap))
+
+def strings(number):
+    random.seed(8)
+    base = ['Deep learning for authorship', 'A survey', 'On the Origin', 'x', 'Müller, Hans', 'Smith J.']
+    result = ['', None]
+    for _ in range(number):
+        text = list(random.choice(base))
+        for _ in range(random.randint(0, 6)):
+            position = random.randint(0, len(text))
+            operation = random.random()
+            if operation < 0.3 and text:
+                del text[min(position, len(text) - 1)]
+            elif operation < 0.6:
+                text.insert(position, random.choice('abcXYZ '))
+            elif text:
+                text[min(position, len(text) - 1)] = random.choice('abcXYZ ')
+        result.append(''.join(text).upper() if random.random() < 0.2 else ''.join(text))
+    return result
+
+@pytest.mark.parametrize('short_length, max_gap', [(6, 6), (20, 30)])
+def test_same_result_as_unbounded_distance(short_length, max_gap):
+    samples = strings(120)
+    expected = [[compare_reference(t1, t2, short_length, max_gap) for t2 in samples] for t1 in samples]
+    assert [[comparison.compare(t1, t2, short_length, max_gap) for t2 in samples] for t1 in samples] == expected
+    pairs1 = [t1 for t1 in samples for t2 in samples]
+    pairs2 = [t2 for t1 in samples for t2 in samples]
+    assert comparison.compare_pairs(pairs1, pairs2, short_length, max_gap).tolist() == [value for row in expected for value in row]
+    assert comparison.compare_many_to_many(samples, samples, short_length, max_gap).tolist() == expected
+    assert comparison.compare_one_to_many(samples[5], samples, short_length, max_gap).tolist() == expected[5]
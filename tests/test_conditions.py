@@ -0,0 +1,67 @@
+import random
+from conditions import ConditionSet
+
+CONDITIONS = [
+    "entry['year'] is not None and entry['year'] > 2000",
+    "len(entry['title']) > 3 and entry['title'].lower() != 'untitled'",
+    "'doi' in entry and entry['doi'].startswith('10.1') or entry['year'] == 1999",
+    "count(entry['title']) % 2 == 0 and count(entry['title']) > 2",
+]
+
+def entries(number):
+    random.seed(3)
+    for _ in range(number):
+        entry = {'year': random.choice([None, 1999, 2001, 2010]), 'title': random.choice(['', 'untitled', 'A title', 'Titles'])}
+        if random.random() < 0.5:
+            entry['doi'] = random.choice(['10.1/x', '10.2/y'])
+        yield entry
+
+def plain(conditions, namespace, entry):
+    """The result of the conditions as evaluated with eval() one after another."""
+    for condition in conditions:
+        if not eval(condition.strip(), dict(namespace, entry = entry)):
+            return False
+    return True
+
+def test_same_result_as_eval():
+    namespace = {'count': len}
+    check = ConditionSet(CONDITIONS, namespace, sample_size = 50)
+    for entry in entries(500):
+        assert check(entry) == plain(CONDITIONS, namespace, entry)
+
+def test_check_many_same_result_as_eval():
+    namespace = {'count': len}
+    check = ConditionSet(CONDITIONS, namespace, sample_size = 10)
+    batch = list(entries(300))
+    assert check.check_many(batch) == [plain(CONDITIONS, namespace, entry) for entry in batch]
+
+def test_shared_calls_evaluated_once_per_entry():
+    calls = []
+    def count(text):
+        calls.append(text)
+        return len(text)
+    check = ConditionSet([CONDITIONS[3]], {'count': count})
+    assert check({'title': 'Titles'})
+    assert calls == ['Titles']
+
+def test_guards_keep_raising_like_eval():
+    check = ConditionSet(["'doi' in entry", "entry['doi'].startswith('10.1')"], sample_size = 2)
+    for entry in [{'doi': '10.1/a'}, {'doi': '10.2/b'}, {}, {'doi': '10.1/c'}]:
+        assert check(entry) == ('doi' in entry and entry['doi'].startswith('10.1'))
+
+def test_entry_fields():
+    assert ConditionSet(CONDITIONS[:2]).fields == {'year', 'title'}
+    assert ConditionSet(["len(entry) > 2"]).fields is None
+
+def test_printing_conjuncts_keep_their_place():
+    printed = []
+    def report(value, print_command = False):
+        if print_command:
+            printed.append(value)
+        return True
+    conditions = ["report(entry['a'], print_command = True)", "sum(range(20000)) and entry['b']"]
+    check = ConditionSet(conditions, {'report': report}, sample_size = 5)
+    batch = [{'a': i, 'b': i % 3 == 0} for i in range(30)]
+    assert [check(entry) for entry in batch] == [entry['b'] for entry in batch]
+    # the printing conjunct comes first, so it prints for every entry even after reordering
+    assert printed == list(range(30))
@@ -0,0 +1,53 @@
+import json
+import random
+import pytest
+import corpus_builder
+import content_table
+from corpus_builder import CorpusBuilderJSON
+from jsonl_io import open_jsonl
+
+def make_batches(directory):
+    """CORE batches, plain and compressed, with DOIs shared by several entries and merged-corpus MAG ids."""
+    random.seed(17)
+    directory.mkdir()
+    entries = []
+    for number, extension in enumerate(['', '.gz', '.zst']):
+        with open_jsonl(str(directory / f"{number:02d}{extension}"), "w") as batch:
+            for _ in range(150):
+                core_id = str(len(entries))
+                entry = {'coreId': core_id, 'title': 'T' + core_id, 'authors': ['A'], 'year': 2000, 'doi': random.choice([None, f'10.1/{random.randint(0, 60)}']),
+                         'mag_ids': [str(random.randint(0, 300))], 'fullText': 'ü' * random.randint(0, 300)}
+                batch.write(json.dumps(entry, ensure_ascii = False) + "\n")
+                entries.append(entry)
+    return entries
+
+@pytest.mark.parametrize('colliding', [False, True])
+def test_open_many_same_as_scan(tmp_path, monkeypatch, colliding):
+    if colliding:
+        monkeypatch.setattr(corpus_builder, 'key_hash', lambda key: 7)
+        monkeypatch.setattr(content_table, 'key_hash', lambda key: 7)
+    entries = make_batches(tmp_path / "batches")
+    builder = CorpusBuilderJSON(str(tmp_path / "batches"), pool_size = 2, chunk_size = 4096)
+    builder.create_content_table(keys = ['coreId', 'doi', 'mag_id'])
+    table = content_table.ContentTable(builder.content_table_directory(), builder.input_filepath)
+    assert (len(set(table.columns['coreId']['keys'].tolist())) == 1) == colliding
+    core_ids = [str(i) for i in range(0, 460, 7)]
+    assert builder.open_many(core_ids) == {core_id: [entries[int(core_id)]] for core_id in core_ids if int(core_id) < len(entries)}
+    for key, values in [('doi', ['10.1/3', '10.1/30', '10.9/x', None]), ('mag_id', ['1', '15', 'x'])]:
+        expected = {}
+        for value in values:
+            for entry in entries:
+                if value is not None and value in content_table.entry_keys(entry, key):
+                    expected.setdefault(value, []).append(entry)
+        assert builder.open_many(values, key) == expected
+
+def test_open_specific_prints_the_entry(tmp_path, capsys):
+    entries = make_batches(tmp_path / "batches")
+    builder = CorpusBuilderJSON(str(tmp_path / "batches"), pool_size = 2)
+    builder.create_content_table(conditions = ["int(entry['coreId']) % 2 == 0"])
+    capsys.readouterr()
+    builder.open_specific('200')
+    entry = entries[200]
+    assert capsys.readouterr().out == "#" * 100 + "\n" + "".join(f"{tag}: {entry[tag]},\n\n" for tag in ['title', 'authors', 'year', 'doi', 'fullText'])
+    builder.open_specific('201')
+    assert capsys.readouterr().out == ""
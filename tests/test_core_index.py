@@ -0,0 +1,51 @@
+import json
+import core_index
+import mag_matcher
+from core_index import build_index, entries_from_batches, CoreIndex, normalise_doi
+from title_index import normalise_title
+from mag_matcher import MagMatcher
+from test_mag_matcher import make_data
+
+ENTRIES = [('1', 'A Title', ['Jane DOE', None], '10.1/ABC', 2000),
+           ('2', 'Other: title!', [], 'https://doi.org/10.1/abc', None),
+           ('3', 'a title', ['X'], None, 1999),
+           ('4', None, None, ' 10.2/Ü ', 2001),
+           ('5', 'Ünïcode \ud800', ['Ä B'], 'doi:10.3/x', True)]
+
+def check_lookups(index):
+    for doi in ['10.1/abc', '10.2/ü', '10.3/X', '10.9/none', None, '']:
+        assert index.rows_for_doi(doi) == [row for row, entry in enumerate(ENTRIES) if normalise_doi(doi) and normalise_doi(entry[3]) == normalise_doi(doi)]
+    for title in ['A TITLE', 'other title', 'ünïcode', 'missing', None]:
+        assert index.rows_for_title(title) == [row for row, entry in enumerate(ENTRIES) if normalise_title(title) and normalise_title(entry[1]) == normalise_title(title)]
+
+def test_lookups_and_entries(tmp_path):
+    build_index(ENTRIES, str(tmp_path))
+    index = CoreIndex(str(tmp_path))
+    assert index.size == len(ENTRIES)
+    check_lookups(index)
+    assert [index.entry(row) for row in range(index.size)] == [
+        ('1', 'A Title', ['jane doe'], None, 2000), ('2', 'Other: title!', [], None, None), ('3', 'a title', ['x'], None, 1999),
+        ('4', None, [], None, 2001), ('5', 'Ünïcode \ud800', ['ä b'], None, None)]
+
+def test_hash_collisions_do_not_return_other_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(core_index, 'key_hash', lambda key: 7)
+    build_index(ENTRIES, str(tmp_path))
+    check_lookups(CoreIndex(str(tmp_path)))
+
+def test_build_from_batches(tmp_path):
+    (tmp_path / "batches").mkdir()
+    with open(tmp_path / "batches" / "1", "w") as batch:
+        for entry in ENTRIES[:3]:
+            batch.write(json.dumps(dict(zip(['coreId', 'title', 'authors', 'doi', 'year'], entry))) + "\n")
+    assert list(entries_from_batches(str(tmp_path / "batches"))) == [(e[0], e[1], e[2], e[3], e[4]) for e in ENTRIES[:3]]
+
+def test_matcher_with_index_same_as_with_json(tmp_path, monkeypatch):
+    core = make_data(tmp_path)
+    build_index(core, str(tmp_path / "core_index"))
+    results = []
+    for core_path, output in [(tmp_path / "matching_data_complete.json", "json"), (tmp_path / "core_index", "index")]:
+        monkeypatch.setattr(mag_matcher, 'LOOKUPS', None)
+        with MagMatcher(str(tmp_path / "oag"), str(core_path), pool_size = 2, chunk_size = 5000) as matcher:
+            matcher.match(str(tmp_path / output))
+        results.append((tmp_path / output / "matches.json").read_text())
+    assert results[0] == results[1]
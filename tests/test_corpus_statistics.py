@@ -0,0 +1,75 @@
+import gzip
+import json
+import random
+import pandas as pd
+import pytest
+from corpus_builder import CorpusBuilderJSON
+from corpus_statistics import CorpusStatistics
+from match_table import build_from_json
+
+def make_corpus(directory):
+    """CORE entries with repeated and non-numeric coreIds, missing DOIs, topics and languages, and one broken line."""
+    random.seed(24)
+    directory.mkdir()
+    entries = []
+    for number in range(3):
+        lines = []
+        for i in range(300):
+            entry = {'coreId': random.choice([str(random.randint(1, 500)), str(random.randint(1, 500)), 'x' + str(i)]),
+                     'doi': random.choice([None, f'10.1/{random.randint(1, 200)}']),
+                     'topics': random.sample(['a', 'b', 'c', 'd', 'é'], random.randint(0, 2)),
+                     'language': random.choice([None, {'code': 'en', 'name': 'English'}, {'code': 'de', 'name': 'German'}]),
+                     'authors': ['author'] * random.choice([0, 1, 1, 2, 3])}
+            entries.append(entry)
+            lines.append(json.dumps(entry) + "\n")
+        if number == 1:
+            lines.insert(10, '{"coreId": "broken"\n')
+        with (gzip.open if number == 2 else open)(str(directory / (f"{number:02d}" + (".gz" if number == 2 else ""))), "wt") as batch:
+            batch.writelines(lines)
+    return entries
+
+def expected_report(entries, published, matched):
+    """The numbers as the notebooks computed them with pandas."""
+    df = pd.DataFrame(entries)
+    ids = df['coreId'].map(str)
+    numeric = ids[ids.str.isdigit()].astype(int)
+    authors = df['authors'].map(len)
+    return {
+        'entries': len(df),
+        'core_ids': {'unique': numeric.nunique(), 'duplicates': len(numeric) - numeric.nunique(), 'not_numeric': int((~ids.str.isdigit()).sum())},
+        'dois': {'with_doi': len(df['doi'].dropna()), 'unique': len(df['doi'].unique())},
+        'topics': {'with_topics': int(df['topics'].map(len).gt(0).sum()), 'unique': len(df['topics'].explode().unique())},
+        'language': {'with_language': len(df['language'].dropna()), 'codes': df['language'].dropna().map(lambda language: language['code']).value_counts().to_dict()},
+        'authors': {'no_authors': int((authors == 0).sum()), 'monographs': int((authors == 1).sum()), 'multi_author': int((authors > 1).sum()),
+                    'per_document': {str(length): count for length, count in sorted(authors.value_counts().items())}},
+        'match_coverage': {'match_table': len(set(numeric) & matched), 'match_table_entries': int(numeric.isin(matched).sum()),
+                           'published': len(set(numeric) & published), 'published_entries': int(numeric.isin(published).sum())}}
+
+@pytest.mark.parametrize('chunk_size', [1000, None])
+def test_report_matches_pandas(tmp_path, chunk_size):
+    entries = make_corpus(tmp_path / "corpus")
+    published = set(range(1, 500, 3))
+    pd.DataFrame({'coreid': [str(i) for i in sorted(published)] + ['x'], 'magid': [str(i) for i in sorted(published)] + ['1']}).to_csv(tmp_path / "published.csv.gz", index = False)
+    matched = set(range(1, 500, 4))
+    with open(tmp_path / "matches.json", "w") as matches_file:
+        json.dump({'matches': [[str(i + 1000), str(i)] for i in sorted(matched)]}, matches_file)
+    build_from_json(str(tmp_path / "matches.json"), str(tmp_path / "table"))
+    builder = CorpusBuilderJSON(str(tmp_path / "corpus"), pool_size = 3, chunk_size = chunk_size)
+    report = builder.statistics(str(tmp_path / "statistics.json"), match_table = str(tmp_path / "table"), published = str(tmp_path / "published.csv.gz"))
+    expected = expected_report(entries, published, matched)
+    assert report == expected
+    with open(tmp_path / "statistics.json") as report_file:
+        assert json.load(report_file) == json.loads(json.dumps(expected))
+
+def test_merge_in_any_order():
+    random.seed(241)
+    entries = [{'coreId': str(random.randint(1, 50)), 'doi': random.choice([None, str(random.randint(1, 20))]), 'topics': [str(random.randint(1, 5))]} for _ in range(200)]
+    whole = CorpusStatistics()
+    for entry in entries:
+        whole.add(entry)
+    parts = [CorpusStatistics() for _ in range(4)]
+    for i, entry in enumerate(entries):
+        parts[i % 4].add(entry)
+    merged = parts[3].merge(parts[1]).merge(parts[0].merge(parts[2]))
+    assert merged.report() == whole.report()
+    assert CorpusStatistics().report()['dois'] == {'with_doi': 0, 'unique': 0}
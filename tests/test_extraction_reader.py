@@ -0,0 +1,40 @@
+import json
+from glob import glob
+from extraction_reader import ExtractionReaderJSON
+
+LINES = [
+    '{"coreId": "1", "fullText": "a \\"quoted\\" text \\\\ with \\u00fc", "language": {"code": "en"}, "year": 2001}',
+    ' { "fullText" : "x,}{" , "authors": [{"name": "A, B"}, "C"], "year" : null , "language": null }',
+    '{"coreId": "3", "title": "T\\nitle", "nested": {"year": 1, "a": [1, {"b": "}"}]}, "year": 1999}',
+    '{}',
+]
+
+def test_load_fields_same_values_as_loads():
+    reader = ExtractionReaderJSON.__new__(ExtractionReaderJSON)
+    for line in LINES:
+        entry = json.loads(line)
+        for fields in [{'year'}, {'language', 'year'}, {'authors', 'title'}, {'fullText', 'nested'}]:
+            assert reader.load_fields(line, fields) == {key: entry[key] for key in fields if key in entry}
+
+def test_load_fields_broken_line():
+    reader = ExtractionReaderJSON.__new__(ExtractionReaderJSON)
+    assert reader.load_fields('{"coreId": "1" "year": 2}', {'year'}) is None
+    assert reader.load_fields('["year"]', {'year'}) is None
+
+def test_reduce_copies_matching_lines(tmp_path):
+    (tmp_path / "input").mkdir()
+    lines = []
+    for i in range(200):
+        entry = {'coreId': str(i), 'fullText': 'text ' * (i % 7), 'language': {'code': 'en' if i % 3 else 'de'}, 'year': 1990 + i % 30}
+        # key order and spacing of the lines are kept, as the lines are copied
+        lines.append(json.dumps(entry, indent = None, separators = (',', ':') if i % 2 else (', ', ': ')))
+    for number in range(2):
+        (tmp_path / "input" / f"batch_{number}").write_text("\n".join(lines[number::2]) + "\n")
+    conditions = ["entry['language']['code'] == 'en' and entry['year'] > 2000"]
+    reader = ExtractionReaderJSON(str(tmp_path / "input"), pool_size = 2)
+    reader.reduce_batches(str(tmp_path / "output"), conditions)
+    for number in range(2):
+        output = glob(str(tmp_path / "output" / "*" / "batches" / f"batch_{number}"))[0]
+        with open(output) as output_file:
+            expected = [line + "\n" for line in lines[number::2] if eval(conditions[0], {'entry': json.loads(line)})]
+            assert output_file.readlines() == expected
@@ -0,0 +1,55 @@
+import json
+import random
+import pytest
+import feature_table
+from corpus_builder import CorpusBuilderJSON
+
+FEATURES = ["entry['year']", "entry['title']", "entry['authors']", "entry['language']", "entry.get('extra')", "len(entry['authors']) > 1"]
+
+def make_corpus(directory, duplicates = False):
+    """CORE entries with features of every kind: typed, lists, objects, values of mixed types and missing values."""
+    random.seed(25)
+    directory.mkdir()
+    ids = [str(i) for i in range(600)]
+    if duplicates:
+        ids[450] = ids[3]
+        ids[599] = ids[3]
+        ids[200] = ids[100]
+    for number in range(3):
+        with open(directory / f"{number:02d}", "w") as batch:
+            for core_id in ids[number * 200:(number + 1) * 200]:
+                batch.write(json.dumps({'coreId': core_id, 'year': random.choice([None, random.randint(1900, 2020)]),
+                                        'title': random.choice([None, 'Tïtle ' + core_id]),
+                                        'authors': random.sample(['a', 'b', 'c'], random.randint(0, 3)),
+                                        'language': random.choice([None, {'code': 'en', 'name': 'English'}]),
+                                        'extra': random.choice([None, 1, 'one', [1], 2**70, 1.5])}) + "\n")
+    return ids
+
+@pytest.mark.parametrize('chunk_size', [3000, None])
+def test_parquet_same_as_json(tmp_path, chunk_size):
+    make_corpus(tmp_path / "corpus")
+    builder = CorpusBuilderJSON(str(tmp_path / "corpus"), pool_size = 3, chunk_size = chunk_size)
+    builder.extract_features_from_batches(str(tmp_path / "features.json"), None, FEATURES)
+    builder.extract_feature_columns_from_batches(str(tmp_path / "features"), None, FEATURES)
+    with open(tmp_path / "features.json") as features_file:
+        expected = json.load(features_file)
+    rows = list(feature_table.read_features(str(tmp_path / "features")))
+    assert [(row.pop('coreId'), row) for row in rows] == list(expected.items())
+    assert [row["entry.get('extra')"] for row in feature_table.read_features(str(tmp_path / "features"), ["entry.get('extra')"])] == \
+           [features["entry.get('extra')"] for features in expected.values()]
+    frame = feature_table.feature_frame(str(tmp_path / "features"), ['coreId', "entry['language']"])
+    assert list(frame['coreId']) == list(expected)
+    assert list(frame["entry['language']"]) == [features["entry['language']"] for features in expected.values()]
+    assert not (tmp_path / "features" / "duplicates.json").exists()
+
+def test_duplicate_ids(tmp_path, capsys):
+    make_corpus(tmp_path / "corpus", duplicates = True)
+    builder = CorpusBuilderJSON(str(tmp_path / "corpus"), pool_size = 2, chunk_size = 5000)
+    builder.extract_feature_columns_from_batches(str(tmp_path / "features"), None, ["entry['year']"])
+    assert "Error: 2 IDs found multiple times" in capsys.readouterr().out
+    assert len(list(feature_table.read_features(str(tmp_path / "features")))) == 600
+    with open(tmp_path / "features" / "duplicates.json") as duplicates_file:
+        assert json.load(duplicates_file) == ['3', '100']
+    builder.extract_feature_columns_from_batches(str(tmp_path / "filtered"), ["int(entry['coreId']) >= 150"], ["entry['year']"])
+    assert not (tmp_path / "filtered" / "duplicates.json").exists()
+    assert [row['coreId'] for row in feature_table.read_features(str(tmp_path / "filtered"))] == [str(i) for i in range(150, 600) if i not in (200, 450, 599)]
@@ -0,0 +1,50 @@
+import os
+import random
+import pyarrow as pa
+import pyarrow.parquet as pq
+from grobid_store import GrobidStore
+
+def make_grobid_files(directory, seed = 14):
+    """Parquet files with several row groups, some DOIs in more than one row, and rows without DOI."""
+    random.seed(seed)
+    texts = {}
+    filepaths = []
+    for number in range(3):
+        dois = [random.choice([None, f'10.1/{random.randint(1, 150)}']) for _ in range(100)]
+        contents = [f'text {number} {row}' for row in range(100)]
+        for doi, content in zip(dois, contents):
+            if doi is not None:
+                texts.setdefault(doi, []).append({'content': content})
+        filepath = str(directory / f"part-{number}.parquet")
+        pq.write_table(pa.table({'doi': dois, 'content': contents, 'other': list(range(100))}), filepath, row_group_size = 17)
+        filepaths.append(filepath)
+    return filepaths, texts
+
+def test_rows_of_each_doi(tmp_path):
+    filepaths, texts = make_grobid_files(tmp_path)
+    with GrobidStore(filepaths, str(tmp_path / "index"), prefetch = False) as store:
+        for number in range(160):
+            doi = f'10.1/{number}'
+            assert (doi in store) == (doi in texts)
+            assert store.get(doi) == texts.get(doi, [])
+        assert store.fetch_many(list(texts) + [None]) == texts
+
+def test_windows_along_the_order(tmp_path):
+    filepaths, texts = make_grobid_files(tmp_path)
+    order = list(texts) + ['10.1/missing']
+    random.seed(140)
+    random.shuffle(order)
+    with GrobidStore(filepaths, str(tmp_path / "index"), order = order, window_size = 7) as store:
+        # requested in order, with repeats and a DOI out of order
+        requests = order[:20] + [order[3]] + order[20:] + [order[0]]
+        assert [store.get(doi) for doi in requests] == [texts.get(doi, []) for doi in requests]
+
+def test_index_rebuilt_for_changed_files(tmp_path):
+    filepaths, texts = make_grobid_files(tmp_path)
+    GrobidStore(filepaths, str(tmp_path / "index"), prefetch = False).close()
+    with GrobidStore(filepaths[:2], str(tmp_path / "index"), prefetch = False) as store:
+        assert store.filepaths == filepaths[:2]
+    filepaths, texts = make_grobid_files(tmp_path, seed = 141)
+    os.utime(filepaths[0], (1, 1))
+    with GrobidStore(filepaths, str(tmp_path / "index"), prefetch = False) as store:
+        assert store.fetch_many(list(texts)) == texts
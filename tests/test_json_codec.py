@@ -0,0 +1,57 @@
+import json
+import math
+import pytest
+import json_codec
+
+DOCUMENTS = ['{"coreId": "1", "year": 2001, "authors": ["Müller", "\\u00fc"], "x": null, "y": true}',
+             '{"big": 123456789012345678901234567890, "neg": -9223372036854775809, "f": 1.5e300, "i": 9223372036854775807}',
+             '{"nan": NaN, "inf": -Infinity}',
+             '{"surrogate": "\\ud800", "pair": "\\ud83d\\ude00", "escaped": "\\"\\\\\\n"}',
+             '[1, [2, {"a": []}], ""]']
+
+@pytest.fixture(params = ['json', 'orjson'])
+def backend(request):
+    previous = json_codec.BACKEND
+    json_codec.select(request.param)
+    yield request.param
+    json_codec.select(previous)
+
+def same(a, b):
+    """Equality that holds for NaN."""
+    if isinstance(a, float) and math.isnan(a):
+        return isinstance(b, float) and math.isnan(b)
+    if isinstance(a, dict):
+        return isinstance(b, dict) and list(a) == list(b) and all(same(a[key], b[key]) for key in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+def test_same_values_as_json(backend):
+    for document in DOCUMENTS:
+        assert same(json_codec.loads(document), json.loads(document))
+        assert same(json_codec.loads(document.encode("utf-8")), json.loads(document))
+
+def test_encoded_values_read_back(backend):
+    for document in DOCUMENTS:
+        value = json.loads(document)
+        assert same(json.loads(json_codec.dumps(value)), value)
+        assert same(json.loads(json_codec.dumps_bytes(value)), value)
+    assert json.loads(json_codec.dumps({1: 'a'})) == {'1': 'a'}
+
+def test_json_backend_writes_as_json_dumps():
+    previous = json_codec.BACKEND
+    json_codec.select('json')
+    try:
+        for document in DOCUMENTS:
+            assert json_codec.dumps(json.loads(document)) == json.dumps(json.loads(document))
+    finally:
+        json_codec.select(previous)
+
+def test_broken_documents_raise_value_error(backend):
+    for document in ['{"a": 1', '', '{"a": 1}}', b'\xff']:
+        with pytest.raises(ValueError):
+            json_codec.loads(document)
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        json_codec.select('simplejson')
@@ -0,0 +1,70 @@
+import io
+import gzip
+import json
+from glob import glob
+import pytest
+import zstandard
+from jsonl_io import open_jsonl, ReadAheadReader, compression_of, strip_compression, with_compression
+from extraction_reader import ExtractionReaderJSON
+
+LINES = [json.dumps({'coreId': str(i), 'fullText': 'ü ' * (i * 37 % 5000)}, ensure_ascii = False) + "\n" for i in range(400)]
+
+def test_file_names():
+    assert [compression_of(name) for name in ['00', '00.gz', '00.zst', 'a.gz.part']] == [None, 'gz', 'zst', None]
+    assert strip_compression('00.zst') == '00' and strip_compression('00') == '00'
+    assert with_compression('00', 'gz') == '00.gz' and with_compression('00', None) == '00'
+
+@pytest.mark.parametrize('extension', ['', '.gz', '.zst'])
+@pytest.mark.parametrize('threads', [0, 1, 3])
+def test_round_trip(tmp_path, extension, threads):
+    path = str(tmp_path / ("batch" + extension))
+    with open_jsonl(path, "w", threads = threads) as output_file:
+        for line in LINES:
+            output_file.write(line)
+    with open_jsonl(path, "r", threads = threads) as input_file:
+        assert list(input_file) == LINES
+    with open_jsonl(path, "rb", threads = threads) as input_file:
+        assert input_file.read() == "".join(LINES).encode()
+    if extension == '.gz':
+        assert gzip.open(path, "rt", encoding = "utf-8").read() == "".join(LINES)
+
+def test_zstd_frames_are_read_across(tmp_path):
+    data = "".join(LINES).encode()
+    compressor = zstandard.ZstdCompressor()
+    (tmp_path / "batch.zst").write_bytes(compressor.compress(data[:1000]) + compressor.compress(data[1000:]))
+    with open_jsonl(str(tmp_path / "batch.zst"), "rb") as input_file:
+        assert input_file.read() == data
+
+def test_read_ahead_in_small_chunks():
+    data = bytes(range(256)) * 1000
+    with io.BufferedReader(ReadAheadReader(io.BytesIO(data), depth = 2, chunk_size = 1000), 777) as reader:
+        assert reader.read(10) == data[:10]
+        assert reader.read() == data[10:]
+    # closing before the end stops the thread
+    reader = io.BufferedReader(ReadAheadReader(io.BytesIO(data), depth = 1, chunk_size = 10))
+    reader.read(5)
+    reader.close()
+
+def test_errors_of_the_stream_are_raised(tmp_path):
+    (tmp_path / "broken.gz").write_bytes(gzip.compress(b"line\n" * 1000)[:-20])
+    with pytest.raises(EOFError):
+        with open_jsonl(str(tmp_path / "broken.gz"), "rb") as input_file:
+            input_file.read()
+
+@pytest.mark.parametrize('compression', ['gz', 'zst'])
+def test_reduce_compressed_same_as_plain(tmp_path, compression):
+    (tmp_path / "plain").mkdir()
+    (tmp_path / "compressed").mkdir()
+    for number in range(2):
+        with open_jsonl(str(tmp_path / "plain" / f"{number:02d}"), "w") as batch:
+            batch.writelines(LINES[number::2])
+        with open_jsonl(str(tmp_path / "compressed" / f"{number:02d}.{compression}"), "w") as batch:
+            batch.writelines(LINES[number::2])
+    conditions = ["len(entry['fullText']) % 3 == 0"]
+    ExtractionReaderJSON(str(tmp_path / "plain"), pool_size = 2).reduce_batches(str(tmp_path / "plain_output"), conditions)
+    ExtractionReaderJSON(str(tmp_path / "compressed"), pool_size = 2, compression = compression, threads = 2).reduce_batches(str(tmp_path / "compressed_output"), conditions)
+    for number in range(2):
+        plain = glob(str(tmp_path / "plain_output" / "*" / "batches" / f"{number:02d}"))[0]
+        compressed = glob(str(tmp_path / "compressed_output" / "*" / "batches" / f"{number:02d}.{compression}"))[0]
+        with open_jsonl(plain, "rb") as plain_file, open_jsonl(compressed, "rb") as compressed_file:
+            assert plain_file.read() == compressed_file.read()
@@ -0,0 +1,91 @@
+import sys
+import json
+import random
+import subprocess
+from os.path import dirname, join
+import comparison
+import mag_matcher
+from mag_matcher import MagMatcher
+
+CODE_DIRECTORY = join(dirname(dirname(__file__)), 'code')
+
+def make_data(directory):
+    """A matching_data_complete.json and two OAG files with DOI, title and author matches and near misses."""
+    random.seed(10)
+    titles = ['Deep learning of style', 'A "quoted" title', 'Über Autorschaft', 'On authorship', 'Short', 'Neural corpora']
+    core = []
+    for core_id in range(300):
+        title = random.choice(titles) + ' ' + str(core_id % 40)
+        core.append((str(core_id), title, ['Jane Doe', 'Max Mustermann'] if core_id % 2 else ['A. Smith'],
+                     f'10.1/{core_id}' if core_id % 3 else None, 2000 + core_id % 5))
+    with open(join(directory, "matching_data_complete.json"), "w") as core_file:
+        json.dump({'all_data': core}, core_file)
+    (directory / "oag").mkdir()
+    for number in range(2):
+        with open(join(directory, "oag", f"mag_papers_{number}.txt"), "w") as oag_file:
+            for mag_id in range(number * 1000, number * 1000 + 400):
+                entry = core[random.randrange(len(core))]
+                oag = {'id': str(mag_id), 'title': entry[1] if random.random() < 0.8 else entry[1] + 'x', 'year': entry[4] + random.choice([0, 0, 1])}
+                if random.random() < 0.5:
+                    oag['doi'] = entry[3] if entry[3] and random.random() < 0.8 else f'10.2/{mag_id}'
+                oag['authors'] = [{'name': random.choice(['Jane Doe', 'John Roe', 'Smith', ''])}]
+                oag_file.write(json.dumps(oag, ensure_ascii = mag_id % 2 == 0) + "\n")
+    return core
+
+def match_reference(core, oag_directory):
+    """The matching loop of mag_matching.ipynb, reading every line in order."""
+    doi_dict = {}
+    auth_dict = {}
+    for entry in core:
+        if entry[1]:
+            auth_dict.setdefault(entry[1], []).append(entry)
+        if entry[3]:
+            doi_dict.setdefault(entry[3], []).append(entry)
+    matches = []
+    lines = []
+    for number in range(2):
+        with open(join(oag_directory, f"mag_papers_{number}.txt"), "rb") as oag_file:
+            for line in oag_file:
+                myjson = json.loads(line)
+                match = None
+                if 'doi' in myjson and myjson['doi'] in doi_dict:
+                    for entry in doi_dict[myjson['doi']]:
+                        if myjson['title'] == entry[1] or comparison.compare(myjson['title'], entry[1], 20, 30):
+                            match = entry[0]
+                            break
+                elif 'title' in myjson and myjson['title'] in auth_dict and 'year' in myjson:
+                    for entry in auth_dict[myjson['title']]:
+                        if myjson['year'] == entry[4] and len(myjson['authors']) > 0:
+                            for authn in myjson['authors']:
+                                auth = authn['name'].lower().split()
+                                if auth and any(n.lower().find(auth[-1]) > -1 or n.lower().find(auth[0]) > -1 for n in entry[2]):
+                                    match = entry[0]
+                                    break
+                            if match:
+                                break
+                if match:
+                    matches.append([myjson['id'], match])
+                    lines.append(line)
+    return matches, b''.join(lines)
+
+def test_same_matches_as_notebook_loop(tmp_path, monkeypatch):
+    core = make_data(tmp_path)
+    monkeypatch.setattr(mag_matcher, 'LOOKUPS', None)
+    with MagMatcher(str(tmp_path / "oag"), str(tmp_path / "matching_data_complete.json"), pool_size = 2, chunk_size = 5000) as matcher:
+        matcher.match(str(tmp_path / "output"))
+    matches, lines = match_reference(core, tmp_path / "oag")
+    assert matches
+    with open(tmp_path / "output" / "matches.json") as matches_file:
+        assert json.load(matches_file)['matches'] == matches
+    assert (tmp_path / "output" / "mag_in_core").read_bytes() == lines
+
+def test_fuzzy_is_a_flag(tmp_path):
+    make_data(tmp_path)
+    for flags, directory in [([], "exact"), (["--fuzzy"], "fuzzy")]:
+        subprocess.run([sys.executable, "mag_matcher.py", "-i", str(tmp_path / "oag"), "--core", str(tmp_path / "matching_data_complete.json"),
+                        "-o", str(tmp_path / directory), "--size", "2"] + flags, cwd = CODE_DIRECTORY, check = True, capture_output = True)
+    with open(tmp_path / "exact" / "matches.json") as exact, open(tmp_path / "fuzzy" / "matches.json") as fuzzy:
+        exact = json.load(exact)['matches']
+        fuzzy = json.load(fuzzy)['matches']
+    # titles with an appended character are only found through the fuzzy title index
+    assert set(map(tuple, exact)) < set(map(tuple, fuzzy))
@@ -0,0 +1,38 @@
+import os
+import json
+import random
+import pytest
+from mag_store import MagStore
+
+def make_mag_file(path, seed = 13):
+    random.seed(seed)
+    mag_dict = {}
+    with open(path, "w") as mag_file:
+        for _ in range(500):
+            entry = {'id': str(random.randint(1, 300)), 'title': 'T' * random.randint(0, 50), 'authors': [{'name': 'Ä'}]}
+            mag_file.write(json.dumps(entry, ensure_ascii = random.random() < 0.5) + "\n")
+            mag_dict[entry['id']] = entry
+    return mag_dict
+
+def test_same_entries_as_mag_dict(tmp_path):
+    mag_dict = make_mag_file(tmp_path / "mag_in_core")
+    with MagStore(str(tmp_path / "mag_in_core"), cache_size = 10) as store:
+        assert len(store) == len(mag_dict)
+        for mag_id in mag_dict:
+            assert mag_id in store and store[mag_id] == mag_dict[mag_id]
+        ids = list(mag_dict)
+        random.shuffle(ids)
+        assert store.get_many(ids + ids[:5]) == [mag_dict[mag_id] for mag_id in ids + ids[:5]]
+        assert len(store.cache) == 10
+        assert '0' not in store and store.get('0') is None
+        with pytest.raises(KeyError):
+            store.get_many([ids[0], '0'])
+
+def test_index_rebuilt_for_newer_file(tmp_path):
+    make_mag_file(tmp_path / "mag_in_core")
+    MagStore(str(tmp_path / "mag_in_core")).close()
+    mag_dict = make_mag_file(tmp_path / "mag_in_core", seed = 130)
+    index = tmp_path / "mag_in_core.index" / "ids.npy"
+    os.utime(tmp_path / "mag_in_core", (index.stat().st_mtime + 10, index.stat().st_mtime + 10))
+    with MagStore(str(tmp_path / "mag_in_core")) as store:
+        assert [store[mag_id] for mag_id in mag_dict] == list(mag_dict.values())
@@ -0,0 +1,81 @@
+import os
+import json
+from glob import glob
+import pytest
+from manifest import ShardWriter, RunManifest, file_checksum, part_filepath
+from extraction_reader import ExtractionReaderJSON
+from test_mergescript import merge_directory, run_mergescript, merged_batches
+
+def write_shard(input_filepath, output_filepath, lines):
+    with ShardWriter(output_filepath) as writer:
+        for line in lines:
+            writer.write(line)
+    return writer.record(input_filepath, {'lines': len(lines)})
+
+def test_shard_writer(tmp_path):
+    output = str(tmp_path / "out.gz")
+    record = write_shard("in", output, ["a\n", b"b\n", "ü\n"])
+    assert not os.path.exists(part_filepath(output)) and part_filepath(output).endswith(".part.gz")
+    assert record[2] == 3 and record[3] == file_checksum(output)
+    with pytest.raises(RuntimeError):
+        with ShardWriter(str(tmp_path / "failed")) as writer:
+            writer.write("a\n")
+            raise RuntimeError()
+    assert not os.path.exists(tmp_path / "failed")
+
+def test_pending_shards(tmp_path):
+    inputs = []
+    for number in range(4):
+        inputs.append(str(tmp_path / f"in{number}"))
+        with open(inputs[-1], "w") as input_file:
+            input_file.write("x" * number)
+    tasks = [(path, path + ".out") for path in inputs]
+    manifest = RunManifest(str(tmp_path), {'conditions': ['a']})
+    for task in tasks:
+        manifest.record(*write_shard(task[0], task[1], ["line\n"]))
+    manifest = RunManifest(str(tmp_path), {'conditions': ['a']})
+    assert manifest.pending(tasks) == [] and manifest.result(inputs[0]) == {'lines': 1}
+    os.utime(inputs[0], (1, 1))
+    with open(tasks[1][1], "w") as output_file:
+        output_file.write("li\n")
+    with open(tasks[2][1], "w") as output_file:
+        output_file.write("LINE\n")
+    with open(part_filepath(tasks[3][1]), "w") as output_file:
+        output_file.write("partial")
+    assert manifest.pending(tasks) == tasks[:2]
+    assert manifest.pending(tasks, verify = True) == tasks[:3]
+    assert not os.path.exists(part_filepath(tasks[3][1]))
+
+def test_other_settings_refused(tmp_path):
+    RunManifest(str(tmp_path), {'conditions': ['a'], 'compression': None})
+    with pytest.raises(ValueError):
+        RunManifest(str(tmp_path), {'conditions': ['b'], 'compression': None})
+
+def test_resumed_reduce_same_as_complete_run(tmp_path):
+    (tmp_path / "input").mkdir()
+    for number in range(3):
+        with open(tmp_path / "input" / f"batch_{number}", "w") as batch:
+            for i in range(50):
+                batch.write(json.dumps({'coreId': str(i), 'year': 1990 + (i * (number + 1)) % 30}) + "\n")
+    conditions = ["entry['year'] > 2000"]
+    ExtractionReaderJSON(str(tmp_path / "input"), pool_size = 2).reduce_batches(str(tmp_path / "output"), conditions)
+    run_directory = glob(str(tmp_path / "output" / "*"))[0]
+    batches = {path: open(path).read() for path in glob(run_directory + "/batches/*")}
+    os.remove(run_directory + "/batches/batch_1")
+    with open(run_directory + "/batches/batch_2.part", "w") as part:
+        part.write("{")
+    ExtractionReaderJSON(str(tmp_path / "input"), pool_size = 2).reduce_batches(str(tmp_path / "output"), conditions, resume = run_directory)
+    assert {path: open(path).read() for path in glob(run_directory + "/batches/*")} == batches
+    with pytest.raises(ValueError):
+        ExtractionReaderJSON(str(tmp_path / "input")).reduce_batches(str(tmp_path / "output"), ["True"], resume = run_directory)
+
+def test_resumed_merge_same_as_complete_run(merge_directory):
+    run_mergescript(merge_directory, 2)
+    run_directory = glob(str(merge_directory / "corpus_merged" / "*"))[0]
+    batches = merged_batches(run_directory)
+    report = open(os.path.join(run_directory, "merge-output.txt")).read()
+    os.remove(os.path.join(run_directory, "batches", "01"))
+    run = run_mergescript(merge_directory, 2, ["--resume", run_directory])
+    assert "Resuming: 3 of 4 shards already completed." in run.stdout
+    assert merged_batches(run_directory) == batches
+    assert open(os.path.join(run_directory, "merge-output.txt")).read() == report
@@ -0,0 +1,51 @@
+import json
+import random
+import numpy as np
+import pandas as pd
+from match_table import build_from_json, MatchTable, read_published
+
+def make_matches(path):
+    random.seed(12)
+    pairs = [[str(random.randint(1, 300)), str(random.randint(1, 200))] for _ in range(1000)]
+    with open(path, "w") as matches_file:
+        json.dump({'matches': pairs}, matches_file)
+    return pairs
+
+def test_lookups_same_as_dicts_of_lists(tmp_path):
+    pairs = make_matches(tmp_path / "matches.json")
+    build_from_json(str(tmp_path / "matches.json"), str(tmp_path / "table"))
+    table = MatchTable(str(tmp_path / "table"))
+    mag_dict = {}
+    core_dict = {}
+    for mag_id, core_id in pairs:
+        mag_dict.setdefault(core_id, []).append(mag_id)
+        core_dict.setdefault(mag_id, []).append(core_id)
+    assert len(table) == len(pairs)
+    for core_id in map(str, range(0, 205)):
+        assert table.mags(core_id) == mag_dict.get(core_id, [])
+    for mag_id in map(str, range(0, 305)):
+        assert table.cores(mag_id) == core_dict.get(mag_id, [])
+    ids = np.arange(-1, 210)
+    assert table.contains('core', ids).tolist() == [str(i) in mag_dict for i in ids]
+    statistics = table.statistics()
+    assert statistics['core_ids'] == len(mag_dict) and statistics['mag_ids'] == len(core_dict)
+    assert sum(count * number for number, count in enumerate(statistics['mags_per_core'])) == len(pairs)
+
+def test_intersect_with_published(tmp_path):
+    pairs = make_matches(tmp_path / "matches.json")
+    build_from_json(str(tmp_path / "matches.json"), str(tmp_path / "table"))
+    table = MatchTable(str(tmp_path / "table"))
+    published = pd.DataFrame({'coreid': [pair[1] for pair in pairs[::3]] + ['x', '7'], 'magid': [pair[0] for pair in pairs[::3]] + ['1', None]})
+    published.to_csv(tmp_path / "published.csv.gz", index = False)
+    core_ids, mag_ids = read_published(str(tmp_path / "published.csv.gz"))
+    assert len(core_ids) == len(pairs[::3])
+    expected = {(int(core_id), int(mag_id)) for mag_id, core_id in pairs[::3]}
+    pair_core_ids, pair_mag_ids = table.pairs()
+    assert table.intersect(core_ids, mag_ids).tolist() == [(c, m) in expected for c, m in zip(pair_core_ids.tolist(), pair_mag_ids.tolist())]
+
+def test_empty_table(tmp_path):
+    with open(tmp_path / "matches.json", "w") as matches_file:
+        json.dump({'matches': []}, matches_file)
+    build_from_json(str(tmp_path / "matches.json"), str(tmp_path / "table"))
+    table = MatchTable(str(tmp_path / "table"))
+    assert len(table) == 0 and table.mags('1') == [] and table.contains('mag', [1]).tolist() == [False]
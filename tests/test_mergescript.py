@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import random
+import subprocess
+from glob import glob
+from os.path import basename, dirname, join
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+CODE_DIRECTORY = join(dirname(dirname(__file__)), 'code')
+GROBID_PATH = "/home/jovyan/mnt/ceph/storage/data-in-progress/data-research/text-reuse/phoenix/spark/grobid-sample.parquet"
+
+@pytest.fixture
+def merge_directory(tmp_path):
+    """The inputs of mergescript.py in the layout it expects, with a directory of Grobid Parquet files."""
+    random.seed(15)
+    process = tmp_path / "process_2"
+    batches = process / "core_sets" / "mag_matched" / "2021_04_09_12_08_34" / "batches"
+    for directory in [batches, process / "mag_sets", process / "results" / "mag_match", process / "results" / "merge", tmp_path / "grobid"]:
+        directory.mkdir(parents = True)
+    # every CORE entry has one or two matches, as the entries of mag_matched
+    matches = [[str(1000 + core_id), str(core_id)] for core_id in range(400)]
+    matches += [[str(1000 + random.randint(0, 399)), str(core_id)] for core_id in range(0, 400, 3)]
+    with open(process / "mag_sets" / "mag_in_core", "w") as mag_file:
+        for mag_id in range(1000, 1400):
+            authors = [{'id': str(random.randint(1, 5)), 'name': random.choice(['Jane Doe', 'Max Mustermann'])} for _ in range(random.randint(0, 3))]
+            mag_file.write(json.dumps({'id': str(mag_id), 'doi': random.choice([None, '', f'10.1/{mag_id % 90}']), 'title': f'M{mag_id}',
+                                       'authors': authors, 'year': 2000 + mag_id % 7, 'publisher': random.choice(['P', 'Q'])}) + "\n")
+    with open(process / "results" / "mag_match" / "matches.json", "w") as matches_file:
+        json.dump({'matches': matches}, matches_file)
+    for number in range(4):
+        with open(batches / f"{number:02d}", "w") as batch:
+            for core_id in range(number * 100, number * 100 + random.randint(50, 100)):
+                batch.write(json.dumps({'coreId': str(core_id), 'doi': random.choice([None, f'10.1/{core_id % 90}', f'10.2/{core_id}']),
+                                        'title': f'T{core_id}', 'authors': ['Jane Doe'] * random.randint(0, 2), 'fullText': f'core {core_id}',
+                                        'publisher': 'P', 'enrichments': {'citationCount': random.randint(0, 3)}, 'abstract': 'a',
+                                        'oai': 'o', 'downloadUrl': 'u'}) + "\n")
+    pd.DataFrame({'doi': ['10.1/3', '10.1/4'], 'board': [['CS'], [['Math', 'CS'], ['Bio']]]}).to_json(process / "results" / "merge" / "fields_df.json")
+    (tmp_path / "grobid" / "_SUCCESS").write_text("")
+    for number in range(2):
+        dois = [f'10.1/{random.randint(0, 95)}' for _ in range(60)]
+        pq.write_table(pa.table({'doi': dois, 'content': [f'grobid {number} {row}' for row in range(60)]}),
+                       str(tmp_path / "grobid" / f"part-{number}.parquet"), row_group_size = 16)
+    return tmp_path
+
+def run_mergescript(directory, pool_size, arguments = [], window_size = 20):
+    """Run mergescript.py in directory, with the Grobid directory, pool size and window size of the test."""
+    with open(join(CODE_DIRECTORY, "mergescript.py")) as script_file:
+        script = script_file.read()
+    script = script.replace(GROBID_PATH, str(directory / "grobid")).replace("pool_size = 32", f"pool_size = {pool_size}")
+    script = script.replace("window_size=10000", f"window_size={window_size}")
+    with open(directory / "mergescript.py", "w") as script_file:
+        script_file.write(script)
+    environment = dict(os.environ, PYTHONPATH = CODE_DIRECTORY, JSON_CODEC = 'json')
+    run = subprocess.run([sys.executable, "mergescript.py"] + arguments, cwd = directory, env = environment, capture_output = True, text = True)
+    assert run.returncode == 0, run.stderr
+    return run
+
+def merged_batches(run_directory):
+    return {basename(path): open(path, "rb").read() for path in sorted(glob(join(run_directory, "batches", "*")))}
+
+def test_parallel_merge_same_as_one_process(merge_directory):
+    run_mergescript(merge_directory, 1)
+    # the run directories are named by the second they start in, so the first run is moved aside
+    first = str(merge_directory / "one_process")
+    os.rename(glob(str(merge_directory / "corpus_merged" / "*"))[0], first)
+    run_mergescript(merge_directory, 3)
+    second, = glob(str(merge_directory / "corpus_merged" / "*"))
+    assert merged_batches(first) == merged_batches(second)
+    assert open(join(first, "merge-output.txt")).read() == open(join(second, "merge-output.txt")).read()
+    grobid = {}
+    for path in glob(str(merge_directory / "grobid" / "*.parquet")):
+        for row in pq.read_table(path).to_pylist():
+            grobid.setdefault(row['doi'], []).append(row['content'])
+    merged = merged_batches(first)
+    batches = merge_directory / "process_2" / "core_sets" / "mag_matched" / "2021_04_09_12_08_34" / "batches"
+    assert list(merged) == sorted(os.listdir(batches))
+    sources = set()
+    for name, content in merged.items():
+        entries = [json.loads(line) for line in content.decode().splitlines()]
+        assert [entry['core_id'] for entry in entries] == [json.loads(line)['coreId'] for line in open(batches / name)]
+        for entry in entries:
+            texts = grobid.get(entry['doi'], [])
+            assert entry['full_text'] == (texts[0] if len(texts) == 1 else 'core ' + entry['core_id'])
+            sources.add(str(entry['full_text_source']))
+    assert sources == {'grobid', 'CORE', "['CORE']"}
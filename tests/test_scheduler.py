@@ -0,0 +1,85 @@
+import json
+import random
+from multiprocessing import Pool
+import pytest
+import scheduler
+from jsonl_io import open_jsonl
+from corpus_builder import CorpusBuilderJSON
+from extraction_reader import ExtractionReaderJSON
+
+def make_batches(directory, last_newline = True):
+    """Batches of uneven size, one of them gzip compressed, the last line of each without newline unless last_newline."""
+    random.seed(19)
+    directory.mkdir()
+    names = ['authors', 'of', 'the', 'corpus', 'Müller', 'Ünal']
+    lines = {}
+    for number, size in enumerate([0, 1, 30, 300]):
+        path = str(directory / (f"{number:02d}" + (".gz" if number == 2 else "")))
+        entries = [json.dumps({'coreId': f'{number}-{i}', 'authors': [random.choice(names) for _ in range(random.randint(0, 4))],
+                               'fullText': 'x' * random.randint(0, 200)}, ensure_ascii = False) for i in range(size)]
+        lines[path] = [line + "\n" for line in entries[:-1]] + ([entries[-1] + ("\n" if last_newline else "")] if entries else [])
+        with open_jsonl(path, "w") as batch:
+            batch.writelines(lines[path])
+    return lines
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 4096, None])
+def test_chunks_cover_every_line_once(tmp_path, chunk_size):
+    lines = make_batches(tmp_path / "batches", last_newline = False)
+    chunks = scheduler.split(sorted(lines), chunk_size)
+    assert [chunk[0] for chunk in chunks] == sorted(chunk[0] for chunk in chunks)
+    read = {}
+    for chunk in chunks:
+        for offset, line in scheduler.read_chunk_offsets(chunk):
+            read.setdefault(chunk[0], []).append((offset, line.decode()))
+    for path, expected in lines.items():
+        offsets = [sum(len(line.encode()) for line in expected[:i]) for i in range(len(expected))]
+        assert read.get(path, []) == list(zip(offsets, expected))
+    assert sorted(chunks, key = scheduler.chunk_name) == chunks
+
+def identity(task):
+    return task
+
+def test_largest_first_and_in_order():
+    with Pool(1) as pool:
+        results = list(scheduler.imap_largest_first(pool, identity, ['a', 'b', 'c', 'd'], [2, 5, 2, 9]))
+        assert results == [(3, 'd'), (1, 'b'), (0, 'a'), (2, 'c')]
+        assert list(scheduler.unordered(results)) == ['d', 'b', 'a', 'c']
+    with Pool(3) as pool:
+        assert list(scheduler.imap_in_order(pool, identity, list(range(50)))) == list(range(50))
+
+def authors_reference(lines):
+    """dict_authors_in_batches as it was, counting file by file and adding the counts in file order."""
+    authors = {}
+    for path in sorted(lines):
+        counts = {}
+        for line in lines[path]:
+            entry = json.loads(line)
+            omit = []
+            for author in entry['authors']:
+                if author in counts and not author in omit:
+                    counts[author] = counts[author] + 1
+                    if entry['authors'].count(author) > 1:
+                        omit.append(author)
+                else:
+                    counts[author] = 1
+        for person in counts:
+            authors[person] = authors.get(person, 0) + counts[person]
+    return authors
+
+@pytest.mark.parametrize('chunk_size', [97, 1000, None])
+def test_results_do_not_depend_on_the_chunks(tmp_path, chunk_size):
+    lines = make_batches(tmp_path / "batches")
+    builder = CorpusBuilderJSON(str(tmp_path / "batches"), pool_size = 3, chunk_size = chunk_size)
+    builder.dict_authors_in_batches(str(tmp_path / "authors.json"))
+    with open(tmp_path / "authors.json") as authors_file:
+        assert json.load(authors_file) == authors_reference(lines)
+    builder.extract_features_from_batches(str(tmp_path / "features.json"), features = ["len(entry['authors'])"])
+    with open(tmp_path / "features.json") as features_file:
+        assert list(json.load(features_file).items()) == [(json.loads(line)['coreId'], {"len(entry['authors'])": len(json.loads(line)['authors'])})
+                                                           for path in sorted(lines) for line in lines[path]]
+    reader = ExtractionReaderJSON(str(tmp_path / "batches"), pool_size = 3, chunk_size = chunk_size)
+    reader.count_entries_in_batches(str(tmp_path / "counts.txt"), ["len(entry['authors']) > 1"])
+    counts = (tmp_path / "counts.txt").read_text().splitlines()
+    expected = {path: sum(len(json.loads(line)['authors']) > 1 for line in path_lines) for path, path_lines in lines.items()}
+    assert counts[1] == f"Entries matching conditions: {sum(expected.values())}"
+    assert counts[3:] == [f"{path.rsplit('/', 1)[1]}: {count}" for path, count in sorted(expected.items())]
@@ -0,0 +1,46 @@
+import random
+import comparison
+from title_index import TitleIndex, normalise_title
+
+WORDS = ['deep', 'learning', 'authorship', 'corpus', 'analysis', 'of', 'the', 'neural', 'style', 'scientific', 'writing']
+
+def titles(number):
+    random.seed(9)
+    return [' '.join(random.choice(WORDS) for _ in range(random.randint(3, 8))).capitalize() for _ in range(number)]
+
+def brute_force(index, title):
+    """All entries a linear scan over the titles would match, in the order they were added."""
+    return [index.entries[i] for i, other in enumerate(index.titles)
+            if other == title or comparison.compare(title, other, 20, 30)]
+
+def test_normalise_title():
+    assert normalise_title("  The Title: A (Survey)!  ") == 'the title a survey'
+    assert normalise_title("?!") is None
+    assert normalise_title(None) is None
+
+def test_matches_are_found_by_a_linear_scan():
+    index = TitleIndex()
+    corpus = titles(500)
+    index.add_many((title, number) for number, title in enumerate(corpus))
+    index.add(None, 'untitled')
+    random.seed(90)
+    found = 0
+    for number, title in enumerate(corpus[:100]):
+        query = list(title)
+        query[random.randrange(len(query))] = 'x'
+        query = ''.join(query)
+        matches = index.matches(query)
+        expected = brute_force(index, query)
+        # candidates come from shared bands, so the index finds a subset of the scan, in the same order,
+        # and almost always the title the query was edited from
+        assert matches == [entry for entry in expected if entry in matches]
+        found += number in matches
+        assert 'untitled' not in matches
+    assert found >= 90
+
+def test_same_normalised_title_is_always_a_candidate():
+    index = TitleIndex(max_bucket = 1)
+    index.add("A Study of Style", 1)
+    index.add("a study, of style", 2)
+    assert index.candidates("A STUDY OF STYLE.") == {0, 1}
+    assert index.matches("A Study of Style") == [1, 2]
@@ -0,0 +1,194 @@
+import sys
+import subprocess
+import pytest
+from os.path import dirname, join
+import utils
+
+CODE_DIRECTORY = join(dirname(dirname(__file__)), 'code')
+
+def test_import_does_not_load_fasttext():
+    loaded = subprocess.run([sys.executable, '-c', "import sys, utils; print('fasttext' in sys.modules)"],
+                            cwd = CODE_DIRECTORY, capture_output = True, text = True, check = True)
+    assert loaded.stdout.strip() == 'False'
+
+def test_model_loaded_once_per_path(monkeypatch):
+    loads = []
+    class FastText:
+        eprint = None
+    fasttext = type(sys)('fasttext')
+    fasttext.FastText = FastText
+    fasttext.load_model = lambda path: loads.append(path) or object()
+    monkeypatch.setitem(sys.modules, 'fasttext', fasttext)
+    monkeypatch.setattr(utils, '_models', {})
+    model = utils.load_model('a.ftz')
+    assert utils.load_model('a.ftz') is model
+    assert utils.load_model('b.ftz') is not model
+    assert loads == ['a.ftz', 'b.ftz']
+
+class FakeModel:
+    """Stands in for the fastText model: a text is English if it has more 'e' than 'a', with a probability by its length."""
+    def __init__(self):
+        self.predicted = 0
+
+    def _predict(self, text):
+        self.predicted += 1
+        label = '__label__en' if text.count('e') > text.count('a') else '__label__de'
+        return (label,), [0.4 + (len(text) % 7) / 10]
+
+    def predict(self, text):
+        if isinstance(text, list):
+            predictions = [self._predict(t) for t in text]
+            return [list(p[0]) for p in predictions], [p[1] for p in predictions]
+        if '\n' in text:
+            raise ValueError("predict processes one line at a time")
+        return self._predict(text)
+
+def text_readable_reference(text, tar_lang, slices=1, min_true=1, max_false=0, fmodel=None):
+    """text_readable as it was before batching, early exit and windows."""
+    text = utils.preprocessor(text)
+    if(len(text) < slices):
+        return False
+    n = -(-len(text) // slices)
+    parts = [text[i:i+n] for i in range(0, len(text), n)]
+    check = []
+    for i in range(slices):
+        try:
+            pred = fmodel.predict(parts[i])
+            check.append(pred[0][0] == f"__label__{tar_lang}" and pred[1][0] > 0.6)
+        except:
+            check.append(None)
+            if len(parts) <= i:
+                break
+    return not (check.count(False) > max_false or check.count(True) < min_true)
+
+def ft_lang_detect_reference(text, tar_lang, slices, max_false=1, min_true=1, fmodel=None):
+    """ft_lang_detect as it was before batching, early exit and windows."""
+    text = text.replace('\n',' ').replace('\uffff','')
+    if(len(text) < slices):
+        return False
+    n = -(-len(text) // slices)
+    parts = [text[i:i+n] for i in range(0, len(text), n)]
+    test = []
+    for i in range(slices):
+        try:
+            r = fmodel.predict(parts[i])
+            test.append(r[0][0] == f"__label__{tar_lang}" if r[1][0] > 0.5 else None)
+        except:
+            test.append(None)
+            if len(parts) <= i:
+                break
+    return not (test.count(False) > max_false or test.count(True) < min_true)
+
+def texts():
+    words = ['the', 'tree', 'was', 'a', 'banana', 'seen', 'here', 'and', 'das', 'haus', '<b>', 'Éé', '\n', '42', '\uffff']
+    texts = ['', 'e', 'ea', 'Ae e']
+    for k in range(60):
+        texts.append(' '.join(words[(k * 7 + i * 3) % len(words)] for i in range(k % 13 + k)))
+    return texts
+
+@pytest.mark.parametrize('slices, min_true, max_false', [(1, 1, 0), (3, 2, 1), (5, 1, 2), (4, 4, 0)])
+def test_text_readable_batch_same_as_single(slices, min_true, max_false):
+    fmodel = FakeModel()
+    verdicts, scores = utils.text_readable_batch(texts(), 'en', slices, min_true, max_false, fmodel)
+    assert verdicts == [text_readable_reference(text, 'en', slices, min_true, max_false, fmodel) for text in texts()]
+    assert verdicts == [utils.text_readable(text, 'en', slices, min_true, max_false, fmodel) for text in texts()]
+    assert len(scores) == len(texts())
+
+@pytest.mark.parametrize('slices, max_false, min_true', [(1, 1, 1), (3, 1, 2), (5, 0, 1)])
+def test_ft_lang_detect_batch_same_as_single(slices, max_false, min_true):
+    fmodel = FakeModel()
+    verdicts, scores = utils.ft_lang_detect_batch(texts(), 'en', slices, max_false, min_true, fmodel)
+    assert verdicts == [ft_lang_detect_reference(text, 'en', slices, max_false, min_true, fmodel) for text in texts()]
+
+def test_batch_predicts_once():
+    calls = []
+    class CountingModel(FakeModel):
+        def predict(self, text):
+            calls.append(text)
+            return super().predict(text)
+    utils.text_readable_batch(texts(), 'en', 3, fmodel = CountingModel())
+    assert len(calls) == 1 and isinstance(calls[0], list)
+
+def test_conditions_check_language_in_batches():
+    from conditions import ConditionSet
+    fmodel = FakeModel()
+    conditions = ["len(entry['t']) > 3 and utils.text_readable(entry['t'], 'en', 3, 2, 1, fmodel)"]
+    check = ConditionSet(conditions, {'utils': utils, 'fmodel': fmodel}, sample_size = 5)
+    entries = [{'t': text} for text in texts()]
+    assert check.check_many(entries[:5]) + check.check_many(entries[5:]) == \
+        [len(text) > 3 and text_readable_reference(text, 'en', 3, 2, 1, fmodel) for text in texts()]
+
+@pytest.mark.parametrize('slices, min_true, max_false', [(1, 1, 0), (3, 2, 1), (5, 1, 2), (4, 4, 0)])
+def test_early_exit_same_verdict_with_fewer_predictions(slices, min_true, max_false):
+    full = FakeModel()
+    early = FakeModel()
+    for text in texts():
+        assert utils.text_readable(text, 'en', slices, min_true, max_false, early, early_exit = True) == \
+            utils.text_readable(text, 'en', slices, min_true, max_false, full)
+        assert utils.ft_lang_detect(text, 'en', slices, max_false, min_true, early, early_exit = True) == \
+            utils.ft_lang_detect(text, 'en', slices, max_false, min_true, full)
+        assert utils.fast_text_lang_words(text, 'en', slices, max_false, early, early_exit = True) == \
+            utils.fast_text_lang_words(text, 'en', slices, max_false, full)
+    assert early.predicted < full.predicted if slices > 1 else early.predicted == full.predicted
+
+def test_window_limits_the_classified_text():
+    lengths = []
+    class RecordingModel(FakeModel):
+        def predict(self, text):
+            lengths.append(len(text))
+            return super().predict(text)
+    text = 'here ' * 1000
+    assert utils.ft_lang_detect(text, 'en', 4, fmodel = RecordingModel(), window = 100)
+    assert lengths == [100] * 4
+
+def test_window_covering_the_slices_changes_nothing():
+    fmodel = FakeModel()
+    for text in texts():
+        text = text.replace('\uffff', '')
+        for slices in [1, 3]:
+            assert utils.ft_lang_detect(text, 'en', slices, fmodel = fmodel, window = len(text) + 1) == \
+                ft_lang_detect_reference(text, 'en', slices, fmodel = fmodel)
+
+def test_preprocessor_same_as_regex_version():
+    import random
+    from benchmark_preprocessor import preprocessor_regex
+    random.seed(6)
+    alphabet = ['a', 'Z', ' ', '  ', '\t', '\n', '\r\n', '<', '>', '<p class="x">', '!', '?', '_', '-', '1', '\u00df', '\u00e9',
+                '\u0130', '\u212a', '\ufb01', '\u03a3', '\u00a0', '\u2028', '\x0b', '\U0001f600', '\ud800']
+    samples = ['', ' ', '<a>b</a>', 'A  <b> C', '\u0130stanbul \u212aELVIN', '<unclosed text', 'x  y']
+    samples += [''.join(random.choice(alphabet) for _ in range(random.randint(1, 80))) for _ in range(2000)]
+    for text in samples:
+        assert utils.preprocessor(text) == preprocessor_regex(text), repr(text)
+    assert utils.preprocessor(None) is None
+
+def test_preprocessor_cache_checks_identity():
+    utils.preprocessor_cache(2)
+    first = ''.join(['A', 'b'])
+    assert utils.preprocessor(first) == 'ab'
+    assert utils.preprocessor(first) == 'ab'
+    del first
+    # a new text at the address of a freed one is not taken for it
+    for k in range(100):
+        assert utils.preprocessor(''.join(['X', str(k), 'y'])) == 'xy'
+    utils.preprocessor_cache(1)
+
+def textparts_reference(text):
+    """textparts as it was before vectorising, one character at a time."""
+    alpha = digit = space = other = 0
+    for c in text:
+        if c.isalpha():
+            alpha += 1
+        elif c.isdigit():
+            digit += 1
+        elif c.isspace():
+            space += 1
+        else:
+            other += 1
+    return (alpha, digit, space, other)
+
+def test_textparts_same_as_character_loop():
+    samples = ['', 'abc 123', 'x\ty\n!', '½٣² é中　', '\ud800x', '\U0001d7d8\U0001f600', 'A' * 1000 + ' ']
+    samples += [''.join(chr((k * 7919 + i * 104729) % 0x30000) for i in range(50)) for k in range(200)]
+    for text in samples:
+        assert utils.textparts(text) == textparts_reference(text), repr(text)
+    assert utils.textparts_batch(samples).tolist() == [list(textparts_reference(text)) for text in samples]